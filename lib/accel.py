@@ -0,0 +1,50 @@
+#
+# Tuning acceleration
+#
+# Sits between the encoder knob and the VFO. The knob stamps each interrupt with
+# ticks_us and the number of detents it counted, and the turning rate in detents
+# per second is estimated with an exponential filter. The main loop multiplies the detents it has gathered by
+# the multiplier the curve gives for the current rate.
+#
+# The curve is a list of [rate, multiplier] pairs in increasing rate order, read
+# from the "accel_curve" user config setting. The multiplier of the last pair
+# whose rate has been reached applies. A curve of [[0, 1]] turns acceleration off.
+#
+
+import time
+from micropython import const
+
+_RATE_SHIFT                     = const(2)       # Filter weight of each new detent is 1/4
+_IDLE_US                        = const(250000)  # A longer gap between detents starts from rest
+
+class Accelerator:
+    def __init__(self, curve: list):
+        # Split the curve into rates and multipliers, lowest rate first
+        self._rates = [point[0] for point in curve]
+        self._multipliers = [point[1] for point in curve]
+        self._last_us = time.ticks_us()
+        # Filtered rate in detents per second
+        self.rate = 0
+
+    # Called by the knob when it has turned count detents, in either direction.
+    # Runs in a hard interrupt handler, so it must not allocate.
+    def detent(self, count: int = 1):
+        now = time.ticks_us()
+        interval = time.ticks_diff(now, self._last_us)
+        self._last_us = now
+        if interval >= _IDLE_US or interval <= 0:
+            self.rate = 0
+            return
+        self.rate += (count * 1000000 // interval - self.rate) >> _RATE_SHIFT
+
+    # Return the multiplier for the current rate
+    def multiplier(self) -> int:
+        # Slowed down or stopped since the last detent
+        if time.ticks_diff(time.ticks_us(), self._last_us) >= _IDLE_US:
+            self.rate = 0
+        multiplier = 1
+        for i in range(len(self._rates)):
+            if self.rate < self._rates[i]:
+                break
+            multiplier = self._multipliers[i]
+        return multiplier
@@ -3,6 +3,7 @@ import event as ev
 import lib.globals as g
 import lib.constants as c
 import lib.gpio_lcd as lcd
+import lib.trace as trace
 
 
 DISPLAY_LINE_LENGTH = 16
@@ -80,7 +81,15 @@ class Display(_DisplayBase):
         # of the initialization sequence.
         #
         super().init()
-        g.event.add_subscriber(self.action, c.ET_DISPLAY)
+        g.event.add_handlers(c.ET_DISPLAY, {c.EST_DISPLAY_UPDATE_FREQ: self._on_freq,
+                                            c.EST_DISPLAY_UPDATE_MODE: self._on_mode,
+                                            c.EST_DISPLAY_UPDATE_TXSTATE: self._on_txstate,
+                                            c.EST_DISPLAY_UPDATE_TUNING_INCR: self._on_tuning_incr,
+                                            c.EST_DISPLAY_UPDATE_AGC: self._on_agc,
+                                            c.EST_DISPLAY_MENU_ENTRY: self._on_menu_entry,
+                                            c.EST_DISPLAY_MENU_EXIT: self._on_menu_exit,
+                                            c.EST_DISPLAY_MENU_UPDATE: self._on_menu_update,
+                                            c.EST_DISPLAY_FATAL_ERROR: self._on_fatal_error})
         self.screens = dict()
         #
         # Create the "menu", "main", and "fatal" virtual screens. 
@@ -158,51 +167,60 @@ class Display(_DisplayBase):
             g.lcd.move_to(x, y)
             g.lcd.putstr(text)
         
-    def action(self, event_data):
-        # Display events sent to this function
+    # Display event handlers, one for each display event subtype
+    
+    def _on_freq(self, event_data):
         # Frequency update
-        if event_data.subtype == c.EST_DISPLAY_UPDATE_FREQ:
-            freq = event_data.data["freq"] # Save a local copy to restore later if need be
-            self.virt_moveto_write(0, 0, self.format_freq(freq), "freq")
+        freq = event_data.arg0 # Save a local copy to restore later if need be
+        self.virt_moveto_write(0, 0, self.format_freq(freq), "freq")
+        if g.trace is not None:
+            g.trace.stamp(trace.TP_LCD_WRITE, event_data.subtype, freq)
        
+    def _on_mode(self, event_data):
         # Mode update
-        elif event_data.subtype == c.EST_DISPLAY_UPDATE_MODE:
-            mode = self.format_mode(event_data.data["mode"]) # Convert sideband to string and store locally
-            self.virt_moveto_write(13, 0, mode, "mode")
+        mode = self.format_mode(event_data.arg0) # Convert sideband to string and store locally
+        self.virt_moveto_write(13, 0, mode, "mode")
+        
+    def _on_txstate(self, event_data):
         # TX State update
-        elif event_data.subtype == c.EST_DISPLAY_UPDATE_TXSTATE: # Convert TX state to string
-            tx_state = self.format_tx_state(event_data.data["txstate"])
-            self.virt_moveto_write(10, 0, tx_state, "txstate")
+        tx_state = self.format_tx_state(event_data.arg0) # Convert TX state to string
+        self.virt_moveto_write(10, 0, tx_state, "txstate")
+        
+    def _on_tuning_incr(self, event_data):
         # Tuning increment update
-        elif event_data.subtype == c.EST_DISPLAY_UPDATE_TUNING_INCR:
-            tuning_incr = self.format_tuning_incr(event_data.data["incr"])
-            self.virt_moveto_write(13, 1, tuning_incr, "incr")
+        tuning_incr = self.format_tuning_incr(event_data.arg0)
+        self.virt_moveto_write(13, 1, tuning_incr, "incr")
+        
+    def _on_agc(self, event_data):
         # AGC update
-        elif event_data.subtype == c.EST_DISPLAY_UPDATE_AGC:
-            agc_disable = self.format_agc_disable(event_data.data["agc"])
-            self.virt_moveto_write(9, 1, agc_disable, "agc")
+        agc_disable = self.format_agc_disable(event_data.arg0)
+        self.virt_moveto_write(9, 1, agc_disable, "agc")
+        
+    def _on_menu_entry(self, event_data):
         # Main menu entry
-        elif event_data.subtype == c.EST_DISPLAY_MENU_ENTRY:
-            self.virt_switch_screens("menu")
-        elif event_data.subtype == c.EST_DISPLAY_MENU_EXIT:
-            self.virt_switch_screens("main")
+        self.virt_switch_screens("menu")
+        
+    def _on_menu_exit(self, event_data):
+        self.virt_switch_screens("main")
+        
+    def _on_menu_update(self, event_data):
         # Update the menu screen
-        elif event_data.subtype == c.EST_DISPLAY_MENU_UPDATE:
-            mli = event_data.data["group"]
-            mei = event_data.data["entry"]
-            # Pad the menu group so it appears in the center
-            ml_format ="{:^"+"{}".format(DISPLAY_LINE_LENGTH)+"s}"
-            ml_str = ml_format.format(self.menutext[mli][0])
-            # Pad the menu entry so it is left justified
-            me_format ="{:<"+"{}".format(DISPLAY_LINE_LENGTH)+"s}"
-            me_str = me_format.format(self.menutext[mli][1][mei])
-            self.virt_moveto_write(0, 0, ml_str, "group", "menu")
-            self.virt_moveto_write(0, 1, me_str, "entry", "menu")
+        mli = event_data.arg0
+        mei = event_data.arg1
+        # Pad the menu group so it appears in the center
+        ml_format ="{:^"+"{}".format(DISPLAY_LINE_LENGTH)+"s}"
+        ml_str = ml_format.format(self.menutext[mli][0])
+        # Pad the menu entry so it is left justified
+        me_format ="{:<"+"{}".format(DISPLAY_LINE_LENGTH)+"s}"
+        me_str = me_format.format(self.menutext[mli][1][mei])
+        self.virt_moveto_write(0, 0, ml_str, "group", "menu")
+        self.virt_moveto_write(0, 1, me_str, "entry", "menu")
+        
+    def _on_fatal_error(self, event_data):
         # Fatal error
-        elif event_data.subtype == c.EST_DISPLAY_FATAL_ERROR:
-            self.virt_moveto_write(0, 0, "**FATAL ERROR**"," fe1", "fatal")
-            self.virt_moveto_write(0, 1, "Check log file","fe2",  "fatal")
-            self.virt_switch_screens("fatal")
+        self.virt_moveto_write(0, 0, "**FATAL ERROR**"," fe1", "fatal")
+        self.virt_moveto_write(0, 1, "Check log file","fe2",  "fatal")
+        self.virt_switch_screens("fatal")
         
             
             
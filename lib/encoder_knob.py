@@ -16,55 +16,88 @@
 
 from machine import Pin
 from array import array
-import uheapq as q
+import uasyncio as asyncio
 import micropython
 import rp2
+from lib.trace import TP_DETENT
 
 # Closure enables Viper to retain state. Currently (V1.17) nonlocal doesn't
 # work: https://github.com/micropython/micropython/issues/8086
 # so using arrays.
+#
+# The handler keeps a signed running count of detents in detents[0], which only it
+# writes. The count wraps at 30 bits so reading it never allocates. Nothing is
+# scheduled per detent, the main loop is woken through the flag and reads the count
+# with EncoderKnob.read_and_clear().
+#
+# The handler is installed as a hard IRQ, so it runs straight from the PIO interrupt
+# rather than through the scheduler. Nothing it calls may allocate: the viper loop,
+# Trace.stamp(), Accelerator.detent() and ThreadSafeFlag.set() only touch preallocated
+# arrays and small ints.
 
-def make_isr(direction_handler, error_handler, detent_count, pos):
+def make_isr(detent_count, pos, detents, flag, trace=None, accel=None):
     old_x = array('i', (0,))
+    @micropython.viper
+    def isr_viper(sm) -> int:
+        i = ptr32(pos)
+        p = ptr32(old_x)
+        d = ptr32(detents)
+        n : int = int(detent_count)
+        moved : int = 0
+        while sm.rx_fifo():
+            v : int = int(sm.get()) & 3
+            x : int = v & 1
+            y : int = v >> 1
+            s : int = 1 if (x ^ y) else -1
+            i[0] = i[0] + (s if (x ^ p[0]) else (0 - s))
+            p[0] = x
+            if i[0] >= n:
+                i[0] = 0
+                moved += 1
+            elif i[0] < 0:
+                i[0] = n - 1
+                moved -= 1
+        d[0] = (d[0] + moved) & 0x3FFFFFFF
+        return moved
+    
     def isr(sm):
-        @micropython.viper
-        def isr_viper(sm):
-            i = ptr32(pos)
-            p = ptr32(old_x)
-            while sm.rx_fifo():
-                v : int = int(sm.get()) & 3
-                x : int = v & 1
-                y : int = v >> 1
-                s : int = 1 if (x ^ y) else -1
-                i[0] = i[0] + (s if (x ^ p[0]) else (0 - s))
-                p[0] = x
-        
-        isr_viper(sm)
-        try:
-            if pos[0] >= detent_count:
-                pos[0] = 0
-                micropython.schedule(direction_handler, 1)
-            elif pos[0] < 0:
-                pos[0] = detent_count -1
-                micropython.schedule(direction_handler, -1)
-        except RuntimeError: # Queue full
-            error_handler()
+        moved = isr_viper(sm)
+        if moved:
+            if trace is not None:
+                trace.stamp(TP_DETENT, 0, moved)
+            if accel is not None:
+                accel.detent(moved if moved > 0 else -moved)
+            flag.set()
     return isr
 
 
 class EncoderKnob:
-    def __init__(self, sm_num, queue, base_pin, detent_count=4):
-        self.errors = 0
-        self.queue = queue
+    def __init__(self, sm_num, base_pin, detent_count=4, trace=None, accel=None):
+        # Set whenever the knob moves a detent, wakes the main loop encoder task
+        self.flag = asyncio.ThreadSafeFlag()
         self._detent_count = detent_count
         self._pos = array("i", (0,))  # [pos]
+        # Running count of detents written by the interrupt handler, and the count at the last read
+        self._detents = array("i", (0,))
+        self._detents_read = 0
         self.sm = rp2.StateMachine(sm_num, self.pio_quadrature, in_base=base_pin)
-        self._direction_handler_ref = self._direction_handler
-        self._error_handler_ref = self._error_handler
-        self.sm.irq(make_isr(self._direction_handler_ref, self._error_handler_ref, self._detent_count, self._pos))  # Instantiate the closure
+        # Instantiate the closure. accel is an optional lib/accel.py Accelerator, told about each move.
+        self.sm.irq(make_isr(self._detent_count, self._pos, self._detents, self.flag, trace, accel), hard=True)
         self.sm.exec("set(y, 99)")  # Initialize y: ensure we see a change the on the first interrupt
         self.sm.active(1)
 
+    # Return the signed number of detents turned since the last call.
+    # The interrupt handler only adds to the running count and this only reads it,
+    # so no detents are lost however fast the knob turns, and no locking is needed.
+    def read_and_clear(self) -> int:
+        count = self._detents[0]
+        delta = (count - self._detents_read) & 0x3FFFFFFF
+        self._detents_read = count
+        # Back to signed
+        if delta >= 0x20000000:
+            delta -= 0x40000000
+        return delta
+
     @rp2.asm_pio()
     def pio_quadrature(in_init=rp2.PIO.IN_LOW):
         wrap_target()
@@ -79,10 +112,3 @@ class EncoderKnob:
         irq(block, rel(0))
         mov(y, x)
         wrap()
-    
-    def _direction_handler(self, up_down):
-        q.heappush(self.queue, up_down)
-        
-    def _error_handler(self, up_down):
-        self._errors+=1
-        
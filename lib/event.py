@@ -5,19 +5,57 @@
 # can receive those messages
 #
 
+from micropython import const
+import lib.trace as trace
+
+# Subtype of a subscriber which receives every subtype of its event types
+_ALL_SUBTYPES = const(-1)
+
 # Protected class to keep track of subscriber info
 class _EventSubscriber:
-    def __init__(self, callback: callable, filter_bits: int):
+    def __init__(self, callback: callable, filter_bits: int, subtype: int = _ALL_SUBTYPES):
         self.callback = callback
         self.filter_bits = filter_bits
+        self.subtype = subtype
+
+# Deferred event priorities, highest first
+PRIORITY_HIGH = const(0)
+PRIORITY_LOW = const(1)
+_PRIORITY_LANES = const(2)
+
+# Number of deferred events which can be waiting in each lane for drain(). Must be a power of 2.
+_QUEUE_SIZE = const(16)
+_QUEUE_MASK = const(_QUEUE_SIZE - 1)
+
+# Number of preallocated event objects. This covers every lane full
+# plus the deepest chain of nested synchronous publishes.
+_POOL_SIZE = const(_QUEUE_SIZE * _PRIORITY_LANES + 8)
+
+# Protected class holding the deferred events of one priority, as a ring of pooled event objects
+class _EventLane:
+    def __init__(self):
+        self.queue = [None] * _QUEUE_SIZE
+        self.head = 0
+        self.count = 0
 
-# Event opject. The publisher creates one of these for every new event
+# Event opject. The payload is carried in the integer fields arg0 and arg1.
+# Publishers take these from the pool with Event.acquire(), and hand them back
+# with Event.release() once publish() returns.
+#
+# Events can also be deferred with Event.post(). They are queued, and published
+# in order when the main loop calls Event.drain(). Events posted with coalesce set
+# replace any older copy of the same type and subtype which is still queued.
+# Each priority has its own lane. High priority events are always published
+# before low priority ones, including any posted while the low lane is draining.
 
 class EventData:
-    def __init__(self, event_type: int, event_subtype: int = 0, data: dict = None):
+    __slots__ = ("type", "subtype", "arg0", "arg1")
+
+    def __init__(self, event_type: int = 0, event_subtype: int = 0, arg0: int = 0, arg1: int = 0):
         self.type = event_type
         self.subtype = event_subtype
-        self.data = data
+        self.arg0 = arg0
+        self.arg1 = arg1
 
 # This class handles subscriber additions and message publication
 
@@ -25,33 +63,176 @@ class Event:
     def __init__(self):
         """ Constructor """
         self._subscribers = list()
-
-
-    def add_subscriber(self,  callback: callable, filter_bits: int) -> None:
-        """ Add a subscriber """
-        new_subscriber = _EventSubscriber(callback, filter_bits)
+        # Callbacks by event type and then subtype, in the order they were added.
+        # Subtype handlers are indexed when they are added, anything
+        # else is indexed the first time it is published.
+        self._index = dict()
+        # Free event objects, as a fixed stack so taking and returning them never allocates
+        self._pool = [EventData() for i in range(_POOL_SIZE)]
+        self._pool_free = _POOL_SIZE
+        self.pool_misses = 0
+        # Deferred events waiting to be published, one lane per priority
+        self._lanes = [_EventLane() for i in range(_PRIORITY_LANES)]
+        self.queue_overflows = 0
+        # Optional lib/trace.py Trace object, stamped at creation, dispatch and around each subscriber
+        self.trace = None
+
+
+    def _lookup(self, event_type: int, event_subtype: int) -> list:
+        """ Return the callbacks of the subscribers wanting an event type and subtype """
+        return [subscriber.callback for subscriber in self._subscribers
+                if event_type & subscriber.filter_bits
+                and (subscriber.subtype == _ALL_SUBTYPES or subscriber.subtype == event_subtype)]
+
+
+    def _add(self, new_subscriber: _EventSubscriber) -> None:
+        """ Add a subscriber, and update the index """
         self._subscribers.append(new_subscriber)
+        filter_bits = new_subscriber.filter_bits
+        subtype = new_subscriber.subtype
+        # Add it to the type and subtype pairs already indexed
+        for event_type, table in self._index.items():
+            if event_type & filter_bits:
+                for event_subtype, callbacks in table.items():
+                    if subtype == _ALL_SUBTYPES or subtype == event_subtype:
+                        callbacks.append(new_subscriber.callback)
+        if subtype == _ALL_SUBTYPES:
+            return
+        # Index the subtype under any of its type bits which don't have it yet
+        bit = 1
+        while bit <= filter_bits:
+            if filter_bits & bit:
+                table = self._index.get(bit)
+                if table is None:
+                    table = dict()
+                    self._index[bit] = table
+                if subtype not in table:
+                    table[subtype] = self._lookup(bit, subtype)
+            bit <<= 1
 
 
-    def publish(self, event_obj: EventData) -> None:
-        """ Publish an event"""
-        for subscriber in self._subscribers:
-            # Check filter bits to see if this event is wanted by the subscriber
-            if event_obj.type & subscriber.filter_bits:
-                # The event is wanted
-                subscriber.callback(event_obj)
-
-    def get_subscriber_count(self) -> int:
-        """ Return the number of subscribers for this event object"""
-        return len(self._subscribers)
-
-
-
+    def add_subscriber(self,  callback: callable, filter_bits: int) -> None:
+        """ Add a subscriber, which receives every subtype of the event types in filter_bits """
+        self._add(_EventSubscriber(callback, filter_bits))
 
 
+    def add_handler(self, callback: callable, filter_bits: int, subtype: int) -> None:
+        """ Add a subscriber which only receives one subtype of the event types in filter_bits """
+        self._add(_EventSubscriber(callback, filter_bits, subtype))
 
 
+    def add_handlers(self, filter_bits: int, handlers: dict) -> None:
+        """ Add a handler for each subtype in a dict of subtype: callback """
+        for subtype, callback in handlers.items():
+            self.add_handler(callback, filter_bits, subtype)
 
 
+    def publish(self, event_obj: EventData) -> None:
+        """ Publish an event"""
+        table = self._index.get(event_obj.type)
+        if table is None:
+            # A type made of several bits, or one nobody listens to
+            table = dict()
+            self._index[event_obj.type] = table
+        callbacks = table.get(event_obj.subtype)
+        if callbacks is None:
+            callbacks = self._lookup(event_obj.type, event_obj.subtype)
+            table[event_obj.subtype] = callbacks
+        if self.trace is not None:
+            self._publish_traced(event_obj, callbacks)
+            return
+        for callback in callbacks:
+            callback(event_obj)
+
+
+    def _publish_traced(self, event_obj: EventData, callbacks: list) -> None:
+        """ Publish an event, stamping the trace at dispatch and around each subscriber """
+        subtype = event_obj.subtype
+        self.trace.stamp(trace.TP_DISPATCH, subtype, event_obj.type)
+        for i in range(len(callbacks)):
+            self.trace.stamp(trace.TP_HANDLER_ENTRY, subtype, i)
+            callbacks[i](event_obj)
+            self.trace.stamp(trace.TP_HANDLER_EXIT, subtype, i)
+
+    def acquire(self, event_type: int, event_subtype: int = 0, arg0: int = 0, arg1: int = 0) -> EventData:
+        """ Take an event object from the pool and fill it in """
+        if self.trace is not None:
+            self.trace.stamp(trace.TP_CREATE, event_subtype, event_type)
+        if self._pool_free:
+            self._pool_free -= 1
+            event_obj = self._pool[self._pool_free]
+            event_obj.type = event_type
+            event_obj.subtype = event_subtype
+            event_obj.arg0 = arg0
+            event_obj.arg1 = arg1
+            return event_obj
+        # Pool exhausted, fall back to allocating one
+        self.pool_misses += 1
+        return EventData(event_type, event_subtype, arg0, arg1)
+
+
+    def release(self, event_obj: EventData) -> None:
+        """ Return an event object to the pool """
+        if self._pool_free < _POOL_SIZE:
+            self._pool[self._pool_free] = event_obj
+            self._pool_free += 1
+
+
+    def post(self, event_type: int, event_subtype: int = 0, arg0: int = 0, arg1: int = 0, coalesce: bool = False,
+             priority: int = PRIORITY_LOW) -> None:
+        """ Queue an event to be published by drain() """
+        lane = self._lanes[priority]
+        if coalesce:
+            # Replace the payload of an older copy still waiting, so only the latest is published
+            pos = lane.head
+            for i in range(lane.count):
+                event_obj = lane.queue[pos]
+                if event_obj.type == event_type and event_obj.subtype == event_subtype:
+                    event_obj.arg0 = arg0
+                    event_obj.arg1 = arg1
+                    return
+                pos = (pos + 1) & _QUEUE_MASK
+        event_obj = self.acquire(event_type, event_subtype, arg0, arg1)
+        if lane.count == _QUEUE_SIZE:
+            # Lane full, publish it now instead
+            self.queue_overflows += 1
+            self.publish(event_obj)
+            self.release(event_obj)
+            return
+        lane.queue[(lane.head + lane.count) & _QUEUE_MASK] = event_obj
+        lane.count += 1
+
+
+    def pending(self, lowest: int = PRIORITY_LOW) -> bool:
+        """ Return True if events of priority lowest or higher are waiting """
+        for priority in range(lowest + 1):
+            if self._lanes[priority].count:
+                return True
+        return False
+
+
+    def drain(self, lowest: int = PRIORITY_LOW) -> int:
+        """ Publish the queued events of priority lowest or higher, highest priority first and in order
+            within a priority, including any posted while draining. Returns the number published """
+        published = 0
+        priority = 0
+        while priority <= lowest:
+            lane = self._lanes[priority]
+            if not lane.count:
+                priority += 1
+                continue
+            event_obj = lane.queue[lane.head]
+            lane.queue[lane.head] = None
+            lane.head = (lane.head + 1) & _QUEUE_MASK
+            lane.count -= 1
+            self.publish(event_obj)
+            self.release(event_obj)
+            published += 1
+            # Anything posted by the subscribers may be of higher priority
+            priority = 0
+        return published
 
 
+    def get_subscriber_count(self) -> int:
+        """ Return the number of subscribers for this event object"""
+        return len(self._subscribers)
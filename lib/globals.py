@@ -14,10 +14,12 @@ event = None # Event subsystem
 vfo = None # VFO subsystem
 menu = None # Menu subsystem
 switch_poller = None # Switch polling subsystem
+trace = None # Event trace, when enabled
+main_loop = None # Main loop tasks
+accel = None # Tuning acceleration
 
 # Global variables
 cal_data = None
-encoder_q = None # heapq for knob object
 band_table = None
 user_config_settings = None
 
@@ -31,9 +33,17 @@ cal_defaults = {"si5351_correction_ppb":0, "xtal_freq_hz":25000000, "cf_frequenc
 band_table_path = "config/band_table.json"
 band_table_default = {"40M":{"low_limit":7000000, "high_limit":7300000}}
 
+# Precomputed band register tables generated by tools/gen_band_regs.py, formatted with the band name
+band_regs_path = "config/bandregs_{}.bin"
+
+# Clock generator register image, saved once the configuration settles and programmed at cold boot
+si5351_image_path = "config/si5351.img"
+
 # User config settings
 user_config_settings_path = "config/user_config.json"
-user_config_settings_default = {"initial_freq": 7200000}
+# accel_curve is a list of [detents per second, step multiplier], see lib/accel.py
+user_config_settings_default = {"initial_freq": 7200000, "i2c_profile": False, "trace": False,
+                                "accel_curve": [[0, 1], [15, 2], [30, 5], [60, 10]]}
 
 
 error_log_path = "log/errors.log"
\ No newline at end of file
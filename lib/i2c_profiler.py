@@ -0,0 +1,153 @@
+#
+# I2C transaction profiler
+#
+# I2CProfiler wraps an I2C object and can be used anywhere the wrapped object is.
+# Every writeto/readfrom is timed with ticks_us and accounted against the current tag.
+# Drivers set the tag with set_tag() before they start a transaction, SI5351 tags each
+# transaction with the name of the method which issued it.
+#
+# All storage is allocated up front, so profiling doesn't add garbage collections.
+# Call dump() from the REPL to print the summary.
+#
+
+import time
+from array import array
+from micropython import const
+
+_MAX_TAGS                       = const(24)
+_HIST_BUCKETS                   = const(8)
+_HIST_SHIFT                     = const(6) # First bucket is < 64us, each bucket after that doubles
+_RECENT_SIZE                    = const(32)
+_OTHER_TAG                      = const(0)
+
+class I2CProfiler:
+    def __init__(self, i2c_object, max_tags: int = _MAX_TAGS):
+        self._i2c = i2c_object
+        self._max_tags = max_tags
+        # Tag 0 collects untagged transactions, and any tags once the table is full
+        self._tag_names = ["other"]
+        self._tag_index = {"other": _OTHER_TAG}
+        self._tag = _OTHER_TAG
+        # Per tag totals
+        self._count = array('L', [0] * max_tags)
+        self._bytes = array('L', [0] * max_tags)
+        self._total_us = array('L', [0] * max_tags)
+        self._max_us = array('L', [0] * max_tags)
+        self._hist = array('L', [0] * (max_tags * _HIST_BUCKETS))
+        # Ring of the most recent transactions
+        self._recent_tag = bytearray(_RECENT_SIZE)
+        self._recent_bytes = array('H', [0] * _RECENT_SIZE)
+        self._recent_us = array('L', [0] * _RECENT_SIZE)
+        self._recent_pos = 0
+
+    def _record(self, nbytes: int, start: int):
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        tag = self._tag
+        self._count[tag] += 1
+        self._bytes[tag] += nbytes
+        self._total_us[tag] += elapsed
+        if elapsed > self._max_us[tag]:
+            self._max_us[tag] = elapsed
+        bucket = 0
+        scaled = elapsed >> _HIST_SHIFT
+        while scaled and bucket < _HIST_BUCKETS - 1:
+            scaled >>= 1
+            bucket += 1
+        self._hist[tag * _HIST_BUCKETS + bucket] += 1
+        pos = self._recent_pos
+        self._recent_tag[pos] = tag
+        self._recent_bytes[pos] = nbytes
+        self._recent_us[pos] = elapsed
+        self._recent_pos = (pos + 1) % _RECENT_SIZE
+
+    #
+    # Tagging
+    #
+
+    # Set the tag the following transactions are accounted against
+    def set_tag(self, tag: str):
+        index = self._tag_index.get(tag)
+        if index is None:
+            if len(self._tag_names) >= self._max_tags:
+                index = _OTHER_TAG
+            else:
+                index = len(self._tag_names)
+                self._tag_names.append(tag)
+                self._tag_index[tag] = index
+        self._tag = index
+
+    #
+    # I2C interface
+    #
+
+    def scan(self):
+        return self._i2c.scan()
+
+    def writeto(self, addr: int, buf, stop: bool = True):
+        start = time.ticks_us()
+        res = self._i2c.writeto(addr, buf, stop)
+        self._record(len(buf), start)
+        return res
+
+    def readfrom(self, addr: int, nbytes: int, stop: bool = True):
+        start = time.ticks_us()
+        res = self._i2c.readfrom(addr, nbytes, stop)
+        self._record(nbytes, start)
+        return res
+
+    def readfrom_into(self, addr: int, buf, stop: bool = True):
+        start = time.ticks_us()
+        res = self._i2c.readfrom_into(addr, buf, stop)
+        self._record(len(buf), start)
+        return res
+
+    def __getattr__(self, name):
+        # Anything else goes straight to the wrapped object, untimed
+        return getattr(self._i2c, name)
+
+    #
+    # Reporting
+    #
+
+    # Zero all counters. Tag names are kept.
+    def clear(self):
+        for i in range(self._max_tags):
+            self._count[i] = 0
+            self._bytes[i] = 0
+            self._total_us[i] = 0
+            self._max_us[i] = 0
+        for i in range(len(self._hist)):
+            self._hist[i] = 0
+        for i in range(_RECENT_SIZE):
+            self._recent_bytes[i] = 0
+            self._recent_us[i] = 0
+        self._recent_pos = 0
+
+    # Return (count, bytes, total us, max us) for a tag, or None if the tag hasn't been seen
+    def get_stats(self, tag: str):
+        index = self._tag_index.get(tag)
+        if index is None:
+            return None
+        return (self._count[index], self._bytes[index], self._total_us[index], self._max_us[index])
+
+    # Print the per tag summary, slowest total first, followed by the most recent transactions
+    def dump(self, recent: bool = True):
+        order = [i for i in range(len(self._tag_names)) if self._count[i]]
+        order.sort(key=lambda i: self._total_us[i], reverse=True)
+        print("{:<16} {:>7} {:>8} {:>9} {:>6} {:>6}".format("tag", "count", "bytes", "total_us", "avg", "max"))
+        for i in order:
+            print("{:<16} {:>7} {:>8} {:>9} {:>6} {:>6}".format(self._tag_names[i], self._count[i], self._bytes[i],
+                                                             self._total_us[i], self._total_us[i] // self._count[i],
+                                                             self._max_us[i]))
+        print("histogram, us: <{} then doubling".format(1 << _HIST_SHIFT))
+        for i in order:
+            base = i * _HIST_BUCKETS
+            print("{:<16} {}".format(self._tag_names[i], " ".join(["{:>5}".format(self._hist[base + b])
+                                                                   for b in range(_HIST_BUCKETS)])))
+        if recent:
+            print("recent: tag bytes us")
+            for n in range(_RECENT_SIZE):
+                pos = (self._recent_pos + n) % _RECENT_SIZE
+                if self._recent_us[pos] or self._recent_bytes[pos]:
+                    print("{:<16} {:>5} {:>6}".format(self._tag_names[self._recent_tag[pos]], self._recent_bytes[pos],
+                                                       self._recent_us[pos]))
@@ -39,7 +39,10 @@ class Menu:
     
     def init(self):
         # Subscribe to the encoder and switch events
-        g.event.add_subscriber(self.action, c.ET_ENCODER|c.ET_SWITCHES)
+        g.event.add_handlers(c.ET_SWITCHES, {c.EST_KNOB_RELEASED_LONG: self._on_knob_released_long,
+                                             c.EST_KNOB_RELEASED: self._on_knob_released})
+        g.event.add_handlers(c.ET_ENCODER, {c.EST_KNOB_MENU_CW: self._on_knob_cw,
+                                            c.EST_KNOB_MENU_CCW: self._on_knob_ccw})
  
   
     
@@ -55,15 +58,16 @@ class Menu:
         except IndexError:
             return self.menu_root
         
-    def _publish_message(self, message_type: int, message_subtype: int, message_data = None):
-        # Publish a message
-        ed = ev.EventData(message_type, message_subtype, message_data)
+    def _publish_message(self, message_type: int, message_subtype: int, arg0: int = 0, arg1: int = 0):
+        # Publish a message using an event object from the pool
+        ed = g.event.acquire(message_type, message_subtype, arg0, arg1)
         g.event.publish(ed)
+        g.event.release(ed)
     
     def _update(self):
         # Update display if we have a node
         if self.current_menu_level["type"] == "node":
-            self._publish_message(c.ET_DISPLAY, c.EST_DISPLAY_MENU_UPDATE, {"group": self.current_menu_level["group"], "entry": self.entry})
+            g.event.post(c.ET_DISPLAY, c.EST_DISPLAY_MENU_UPDATE, self.current_menu_level["group"], self.entry, coalesce=True)
           
        
     def active(self):
@@ -72,85 +76,78 @@ class Menu:
     
     
     
-    def action(self, event_data):
-        # Act on a a switch or encoder event
-        
+    # Switch and encoder event handlers
+    
+    def _on_knob_released_long(self, event_data):
         # Knob switch long press enters/exits menu system
-        if event_data.subtype == c.EST_KNOB_RELEASED_LONG:
-            self.in_menu_system = not self.in_menu_system
-            if self.in_menu_system:
-                self.menu_stack = list()
-                self.current_menu_level = self.menu_root
-                # Set number of entries for the root menu
-                self.num_entries = len(self.menu_root["entries"])
+        self.in_menu_system = not self.in_menu_system
+        if self.in_menu_system:
+            self.menu_stack = list()
+            self.current_menu_level = self.menu_root
+            # Set number of entries for the root menu
+            self.num_entries = len(self.menu_root["entries"])
+            self.entry = 0
+            # Write menu text
+            self._update()
+            # Display menu text
+            g.event.post(c.ET_DISPLAY, c.EST_DISPLAY_MENU_ENTRY)
+        else:
+            # Switch back to normal operation
+            g.event.post(c.ET_DISPLAY, c.EST_DISPLAY_MENU_EXIT)
+            
+    def _on_knob_released(self, event_data):
+        # Short knob press
+        # Select the current item
+        if self.current_menu_level["type"] == "node":
+            next_menu_level = self.current_menu_level["entries"][self.entry]
+          
+            # Look at the next menu level
+            if next_menu_level["type"] == "pop":
+                self.current_menu_level = self._pop()
+                self.num_entries = len(self.current_menu_level["entries"])
                 self.entry = 0
-                # Write menu text
                 self._update()
-                # Display menu text
-                ed = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_MENU_ENTRY)
-                g.event.publish(ed)
-            else:
-                # Switch back to normal operation
-                ed = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_MENU_EXIT)
-                g.event.publish(ed)
+                           
+            elif next_menu_level["type"] == "leaf":
+                handler = next_menu_level["handler"]
+                if handler:
+                    handler()
+                self.current_menu_level = self._pop()
+                self.entry = 0
+                self.num_entries = len(self.current_menu_level["entries"])
+                self._update()
                 
-        # Short knob press
-        elif event_data.subtype == c.EST_KNOB_RELEASED:
-            # Select the current item
-            if self.current_menu_level["type"] == "node":
-                next_menu_level = self.current_menu_level["entries"][self.entry]
-          
-                # Look at the next menu level
-                if next_menu_level["type"] == "pop":
-                    self.current_menu_level = self._pop()
-                    self.num_entries = len(self.current_menu_level["entries"])
-                    self.entry = 0
-                    self._update()
-                               
-                elif next_menu_level["type"] == "leaf":
-                    handler = next_menu_level["handler"]
-                    if handler:
-                        handler()
-                    self.current_menu_level = self._pop()
-                    self.entry = 0
-                    self.num_entries = len(self.current_menu_level["entries"])
-                    self._update()
-                    
-                elif next_menu_level["type"] == "node":
-                    self._push(self.current_menu_level)
-                    self.current_menu_level = self.current_menu_level["entries"][self.entry]
-                    self.entry = 0
-                    self.num_entries = len(self.current_menu_level["entries"])
-                    self._update()
-            
+            elif next_menu_level["type"] == "node":
+                self._push(self.current_menu_level)
+                self.current_menu_level = self.current_menu_level["entries"][self.entry]
+                self.entry = 0
+                self.num_entries = len(self.current_menu_level["entries"])
+                self._update()
         
+        
+    def _on_knob_cw(self, event_data):
         # Encoder CW
-        elif event_data.subtype == c.EST_KNOB_MENU_CW:
-            # Advance to the next entry
-            if self.current_menu_level["type"] == "node":
-                self.entry = self.entry + 1
-                if self.entry >= self.num_entries:
-                    self.entry = 0
-                # Write menu text
-                self._update()
-            
+        # Advance by the number of detents in arg0, wrapping past the last entry
+        if self.current_menu_level["type"] == "node":
+            self.entry = (self.entry + event_data.arg0) % self.num_entries
+            # Write menu text
+            self._update()
+        
+    def _on_knob_ccw(self, event_data):
         # Encoder CCW
-        elif event_data.subtype == c.EST_KNOB_MENU_CCW:
-            # Retreat to the previouse entry
-              if self.current_menu_level["type"] == "node":
-                self.entry = self.entry - 1
-                if self.entry < 0:
-                    self.entry = self.num_entries - 1
-                # Write menu text
-                self._update()
-            
+        # Retreat by the number of detents in arg0, wrapping past the first entry
+        if self.current_menu_level["type"] == "node":
+            self.entry = (self.entry - event_data.arg0) % self.num_entries
+            # Write menu text
+            self._update()
+        
         
        
         
-                
             
-                
+        
             
+        
       
     
     
\ No newline at end of file
@@ -0,0 +1,56 @@
+#
+# Fixed capacity ring buffer of integers
+#
+# Storage is an array allocated up front, so neither side allocates. It is safe
+# for one producer in an interrupt or scheduled callback and one consumer in the
+# main loop: the producer only moves the head, and the consumer only moves the tail.
+# A put() into a full buffer drops the value and counts it in overflows.
+#
+
+from array import array
+from micropython import const
+
+_DEFAULT_CAPACITY               = const(32)
+_INDEX_MASK                     = const(0x3FFFFFFF) # Indexes stay small ints
+
+class RingBuffer:
+    def __init__(self, capacity: int = _DEFAULT_CAPACITY, typecode: str = 'i'):
+        # Round up to a power of 2, so the indexes can be masked
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self._buf = array(typecode, [0] * size)
+        self._mask = size - 1
+        # Free running indexes, the number held is their difference
+        self._head = 0
+        self._tail = 0
+        self.overflows = 0
+
+    # Add a value. Returns False if the buffer was full and the value was dropped.
+    def put(self, value: int) -> bool:
+        head = self._head
+        if (head - self._tail) & _INDEX_MASK > self._mask:
+            self.overflows += 1
+            return False
+        self._buf[head & self._mask] = value
+        self._head = (head + 1) & _INDEX_MASK
+        return True
+
+    # Return True if there are values waiting
+    def any(self) -> bool:
+        return self._head != self._tail
+
+    # Remove and return the oldest value. Only call when any() is True.
+    def get(self) -> int:
+        tail = self._tail
+        value = self._buf[tail & self._mask]
+        self._tail = (tail + 1) & _INDEX_MASK
+        return value
+
+    # Return the number of values waiting
+    def count(self) -> int:
+        return (self._head - self._tail) & _INDEX_MASK
+
+    # Drop all waiting values. Only call from the consumer.
+    def clear(self):
+        self._tail = self._head
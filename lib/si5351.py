@@ -5,7 +5,9 @@
 
 from machine import I2C
 from micropython import const
+import micropython
 import array
+import ustruct
 
 #
 # Values which are for exclusive use by this module
@@ -28,6 +30,12 @@ _CLKOUT_MIN_FREQ                = const(4000)
 _CLKOUT_MAX_FREQ                = const(_MULTISYNTH_MAX_FREQ)
 _CLKOUT67_MS_MIN                = _PLL_VCO_MIN // _MULTISYNTH67_MAX_FREQ
 _CLKOUT67_MIN_FREQ              = _CLKOUT67_MS_MIN // 128
+# _MULTISYNTH_MAX_FREQ and _MULTISYNTH_SHARE_MAX in 100ths of Hz. Written out, as the compiler
+# only folds products which are small ints, and set_freq() would otherwise allocate them
+_MULTISYNTH_MAX_FREQ_MULT       = const(22500000000)
+_MULTISYNTH_SHARE_MAX_MULT      = const(10000000000)
+# Largest MicroPython small int. Frequencies up to this, in 100ths of Hz, fit the fixed point maths
+_SMALL_INT_MAX                  = const(0x3FFFFFFF)
 _CLKOUT67_MAX_FREQ              = _MULTISYNTH67_MAX_FREQ
 
 _PLL_A_MIN                      = const(15)
@@ -161,6 +169,55 @@ _MULTISYNTH_ENABLE              = const((1<<4))
 
 _RFRAC_DENOM                    = const(1000000)
 
+# Number of registers mirrored in the shadow register cache (0 through _FANOUT_ENABLE)
+_SHADOW_SIZE                    = const(188)
+
+# Unchanged registers between two staged runs are resent rather than starting a
+# new transaction when the gap is no longer than this
+_BATCH_GAP_MAX                  = const(2)
+
+# Number of writes to registers outside the shadow which can be held while staging
+_BATCH_UNCACHED_MAX             = const(8)
+
+# Transmit buffer size (register address byte plus data), and the number of
+# preallocated views of it. Writes shorter than _TX_VIEWS bytes never allocate.
+_TX_BUF_SIZE                    = const(_SHADOW_SIZE + 1)
+_TX_VIEWS                       = const(20)
+
+# Fine tune mode places the VCO near this frequency when it picks a new output divider,
+# leaving room to tune about 20% either way before the divider must change
+_FINE_VCO_CENTER                = const(750000000)
+
+# Tuning step plan() uses to estimate the bytes written per step, 10 Hz in 100ths of Hz
+_PLAN_STEP                      = const(1000)
+
+# Default number of entries in the multisynth and PLL calculation caches, the maximum for
+# either, and the number of slots a lookup reads
+_CALC_CACHE_SIZE                = const(16)
+_PLL_CACHE_SIZE                 = const(4)
+_CALC_CACHE_MAX                 = const(64)
+_CALC_CACHE_PROBE               = const(4)
+
+# Fixed point maths, see _fixed_div(). Ratios have a 19 bit fraction, the reference is held in 1/16 Hz
+_FIXED_FRAC_BITS                = const(19)
+_FIXED_DENOM                    = const((1<<19))
+_REF_FRAC_BITS                  = const(4)
+
+# Diff commit statistics slots. Slots 0-7 are the clock outputs
+_STAT_PLLA                      = const(8)
+_STAT_PLLB                      = const(9)
+_STAT_SLOTS                     = const(10)
+
+# Saved register image file, see save_image(). The header holds the magic, XO frequency and correction
+_IMAGE_MAGIC                    = b"S5I1"
+_IMAGE_HEADER                   = "<4sIi"
+
+# Register ranges restored from a saved image, first and last register inclusive.
+# Input source, output control, PLL and multisynth parameters, then spread spectrum,
+# VCXO and phase offsets, then crystal load, then fanout enable.
+_IMAGE_RANGES                   = ((_PLL_INPUT_SOURCE, _CLK6_7_OUTPUT_DIVIDER), (_SSC_PARAM0, _CLK5_PHASE_OFFSET),
+                                   (_CRYSTAL_LOAD, _CRYSTAL_LOAD), (_FANOUT_ENABLE, _FANOUT_ENABLE))
+
 #
 # indexes to "data structures" in original C version
 #
@@ -243,6 +300,204 @@ PLL_INPUT_CLKIN                 = 1
 
 
 
+#
+# Fixed point maths
+#
+# Frequencies in 100ths of Hz above about 10.7 MHz are too big for MicroPython small ints,
+# so every operation on them in _pll_calc and _multisynth_calc allocates a bigint.
+# The fixed point path works on whole Hz. The reference frequency is held in 1/16 Hz,
+# worked out once when the reference or correction is set, and the divisions are done bit
+# serially in 32 bit viper arithmetic. Feedback and multisynth ratios come out as a + b/c
+# with c = 2**19, rounded to nearest.
+#
+# Error bound, against the exact requested frequency, with a 25 MHz reference:
+#
+#   PLL: the ratio is within 2**-20 and the reference within 1/32 Hz, so the VCO is within
+#   23.9 Hz + 1.1 Hz. An output on an integer multisynth (fine tune mode, VCO 600-900 MHz)
+#   is therefore within 25 Hz * f_out / f_vco, at most 42 mHz per MHz of output,
+#   1.25 Hz at 30 MHz. The bigint path truncates at c = 1000000, which is within 25 Hz at the VCO,
+#   so the bound is the same.
+#
+#   Multisynth: the ratio is within 2**-20, so from a PLL at f_vco the output is within
+#   f_out**2 / (2**20 * f_vco): 1.2 mHz at 1 MHz and 1.07 Hz at 30 MHz from 800 MHz.
+#
+# tools/check_fixed_point.py compares the two paths over the HF range.
+#
+# Fine tune mode always sets the PLL with the fixed point path for whole Hz frequencies,
+# so tuning steps don't allocate, see _set_freq_fine(). set_fixed_point() selects it elsewhere.
+# The multisynth path takes the output frequency in 100ths of Hz, see _fixed_muldiv(), so
+# outputs below about 10.7 MHz don't allocate even at fractions of a Hz.
+#
+
+# Return round(num * 2**shift / den) with 32 bit arithmetic.
+# num and den must be below 2**30, and num * 2**(shift + 1) / den below 2**31.
+@micropython.viper
+def _fixed_div(num: int, den: int, shift: int) -> int:
+    q = 0
+    r = 0
+    # Integer part, one numerator bit at a time
+    bit = 29
+    while bit >= 0:
+        r = (r << 1) | ((num >> bit) & 1)
+        q = q << 1
+        if r >= den:
+            r = r - den
+            q = q | 1
+        bit -= 1
+    # Fraction, with one extra bit for rounding
+    bit = shift
+    while bit >= 0:
+        r = r << 1
+        q = q << 1
+        if r >= den:
+            r = r - den
+            q = q | 1
+        bit -= 1
+    return (q + 1) >> 1
+
+# Return round(num * mul * 2**19 / den) with 32 bit arithmetic, where num = quot * den + rem.
+# Taking num as a quotient and remainder keeps a large num * mul out of the arithmetic.
+# den must be below 2**30, rem below den, mul below 2**30, and num * mul * 2**20 / den below 2**31.
+@micropython.viper
+def _fixed_muldiv(quot: int, rem: int, mul: int, den: int) -> int:
+    q = 0
+    r = 0
+    # Integer part, one multiplier bit at a time
+    bit = 29
+    while bit >= 0:
+        r = r << 1
+        q = q << 1
+        if r >= den:
+            r = r - den
+            q = q + 1
+        if (mul >> bit) & 1:
+            r = r + rem
+            q = q + quot
+            if r >= den:
+                r = r - den
+                q = q + 1
+        bit -= 1
+    # Fraction, with one extra bit for rounding
+    bit = _FIXED_FRAC_BITS
+    while bit >= 0:
+        r = r << 1
+        q = q << 1
+        if r >= den:
+            r = r - den
+            q = q | 1
+        bit -= 1
+    return (q + 1) >> 1
+
+# Fill in a register set for the ratio a + b / 2**19
+def _fixed_params(a: int, b: int, reg_set):
+    if b:
+        reg_set[_P1] = 128 * a + (b >> (_FIXED_FRAC_BITS - 7)) - 512
+        reg_set[_P2] = (b << 7) & (_FIXED_DENOM - 1)
+        reg_set[_P3] = _FIXED_DENOM
+    else:
+        reg_set[_P1] = 128 * a - 512
+        reg_set[_P2] = 0
+        reg_set[_P3] = 1
+
+# Fill in an 8 byte parameter block from a register set
+def _pack_params(reg_set, params):
+    params[0] = (reg_set[_P3] >> 8) & 0xFF
+    params[1] = reg_set[_P3] & 0xFF
+    params[2] = (reg_set[_P1] >> 16) & 0x03
+    params[3] = (reg_set[_P1] >> 8) & 0xFF
+    params[4] = reg_set[_P1] & 0xFF
+    params[5] = ((reg_set[_P3] >> 12) & 0xF0) + ((reg_set[_P2] >> 16) & 0x0F)
+    params[6] = (reg_set[_P2] >> 8) & 0xFF
+    params[7] = reg_set[_P2] & 0xFF
+
+
+#
+# Bounded least recently used cache for PLL and multisynth calculation results.
+#
+# Entries are keyed on a (freq, aux) pair. All of the storage is preallocated arrays,
+# allocated by the constructor, so the memory used by the cache never grows and it holds
+# no references to heap allocated ints. A key may only sit in the _CALC_CACHE_PROBE slots
+# from the one its hash picks, so a lookup reads at most that many, and the key hashes
+# are compared before the keys themselves.
+#
+
+class _CalcCache:
+    def __init__(self, size: int):
+        if size > _CALC_CACHE_MAX:
+            size = _CALC_CACHE_MAX
+        self._size = size
+        self._hashes = array.array('q', [0] * (2 * size))
+        self._keys = array.array('q', [0] * (2 * size))
+        self._values = array.array('q', [0] * size)
+        self._regs = array.array('L', [0] * (3 * size))
+        self._stamps = array.array('L', [0] * size)
+        self._probe = _CALC_CACHE_PROBE if size > _CALC_CACHE_PROBE else size
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, freq: int, aux: int):
+        # Return the slot index for a key, or -1 if it is not cached
+        if self._size:
+            freq_hash = hash(freq)
+            aux_hash = hash(aux)
+            slot = (freq_hash ^ aux_hash) % self._size
+            for i in range(self._probe):
+                # Stamp 0 marks an empty slot
+                if (self._stamps[slot] and self._hashes[2 * slot] == freq_hash and self._hashes[2 * slot + 1] == aux_hash
+                        and self._keys[2 * slot] == freq and self._keys[2 * slot + 1] == aux):
+                    self._clock += 1
+                    self._stamps[slot] = self._clock
+                    self.hits += 1
+                    return slot
+                slot += 1
+                if slot == self._size:
+                    slot = 0
+        self.misses += 1
+        return -1
+
+    def result(self, slot: int, reg_set):
+        # Copy a cached register set into reg_set and return the cached value
+        regs = self._regs
+        reg_set[_P1] = regs[3 * slot + _P1]
+        reg_set[_P2] = regs[3 * slot + _P2]
+        reg_set[_P3] = regs[3 * slot + _P3]
+        return self._values[slot]
+
+    def insert(self, freq: int, aux: int, value: int, reg_set):
+        # Store a result in the least recently used slot of those the key may use.
+        # Returns value
+        if self._size == 0:
+            return value
+        freq_hash = hash(freq)
+        aux_hash = hash(aux)
+        slot = (freq_hash ^ aux_hash) % self._size
+        oldest = slot
+        for i in range(self._probe):
+            if self._stamps[slot] < self._stamps[oldest]:
+                oldest = slot
+            slot += 1
+            if slot == self._size:
+                slot = 0
+        slot = oldest
+        self._clock += 1
+        self._stamps[slot] = self._clock
+        self._hashes[2 * slot] = freq_hash
+        self._hashes[2 * slot + 1] = aux_hash
+        self._keys[2 * slot] = freq
+        self._keys[2 * slot + 1] = aux
+        self._values[slot] = value
+        regs = self._regs
+        regs[3 * slot + _P1] = reg_set[_P1]
+        regs[3 * slot + _P2] = reg_set[_P2]
+        regs[3 * slot + _P3] = reg_set[_P3]
+        return value
+
+    def flush(self):
+        for slot in range(self._size):
+            self._stamps[slot] = 0
+
+
 class SI5351():
  
     #
@@ -255,32 +510,155 @@ class SI5351():
             print(label,end="")
         print(" ".join(["{:02x}".format(x) for x in byte_string]))
     
+    def _tag(self, tag: str):
+        # Label the following bus transactions for an I2C profiler, if one is in use.
+        # Registers staged by begin() remember the tag, so commit() can account them to their caller.
+        if self._i2c_tag is not None:
+            self._staging_tag = tag
+            self._i2c_tag(tag)
+
+    # Return True if a register can be served from, or skipped against, the shadow cache.
+    # Status registers change underneath us, and the PLL reset register is self clearing,
+    # so those always go to the bus.
+    def _is_cached(self, reg_addr: int):
+        if not self._shadow_valid or reg_addr >= _SHADOW_SIZE:
+            return False
+        return reg_addr != _DEVICE_STATUS and reg_addr != _INTERRUPT_STATUS and reg_addr != _PLL_RESET
+
+    def _send(self, reg_addr: int, length: int):
+        # Send reg_addr followed by the length data bytes already placed in self._tx_buf[1:]
+        if reg_addr < _PLLA_PARAMETERS or reg_addr + length > _PLLB_PARAMETERS + _PARAMETERS_LENGTH:
+            # Anything but a fine tune step changes the configuration
+            self._generation = (self._generation + 1) & 0x3FFFFFFF
+        self._tx_buf[0] = reg_addr
+        if length < _TX_VIEWS:
+            view = self._tx_views[length]
+        else:
+            view = self._tx_mv[:length + 1]
+        return self._i2c.writeto(self._device_addr, view)
+
     def _write_reg(self, reg_addr: int, data: int):
-        reg_data = bytearray([reg_addr, data])
-        res = self._i2c.writeto(self._device_addr, bytes(reg_data))
-        return res
-    
-    def _write_bulk(self, reg_addr: int, data: bytearray):
-        reg_data = bytearray([reg_addr])
-        reg_data += data
-        res =  self._i2c.writeto(self._device_addr, bytes(reg_data))
-        return res
-    
-    def _read_reg(self, reg_addr):
-        reg = bytearray([reg_addr])             
-        self._i2c.writeto(self._device_addr, reg, False)        
+        data &= 0xFF
+        if self._is_cached(reg_addr):
+            if self._shadow[reg_addr] == data:
+                # Device already holds this value
+                self._writes_avoided += 1
+                return None
+            self._shadow[reg_addr] = data
+            if self._batch_depth:
+                # Staged until commit()
+                self._dirty[reg_addr] = 1
+                self._dirty_tags[reg_addr] = self._staging_tag
+                self._staged += 1
+                return None
+        elif self._batch_depth and self._shadow_valid:
+            if reg_addr == _PLL_RESET:
+                # PLL resets are issued after the staged registers are written
+                self._batch_pll_reset |= data
+                return None
+            # Other registers the shadow doesn't hold are written in order after the staged ones
+            count = self._batch_uncached
+            if count == _BATCH_UNCACHED_MAX:
+                raise RuntimeError("SI5351 batch holds too many uncached writes")
+            self._batch_uncached_regs[count] = reg_addr
+            self._batch_uncached_data[count] = data
+            self._batch_uncached_tags[count] = self._staging_tag
+            self._batch_uncached = count + 1
+            return None
+        self._tx_buf[1] = data
+        return self._send(reg_addr, 1)
+
+    def _write_bulk(self, reg_addr: int, data: bytearray, start: int = 0, length: int = -1):
+        # Write length bytes of data, beginning at data[start], to consecutive registers
+        if length < 0:
+            length = len(data) - start
+        shadow = self._shadow
+        if self._shadow_valid and reg_addr + length <= _SHADOW_SIZE:
+            i = 0
+            while i < length and shadow[reg_addr + i] == data[start + i]:
+                i += 1
+            if i == length:
+                # Device already holds these values
+                self._writes_avoided += 1
+                return None
+            if self._batch_depth:
+                # Staged until commit()
+                self._staged += 1
+                while i < length:
+                    if shadow[reg_addr + i] != data[start + i]:
+                        shadow[reg_addr + i] = data[start + i]
+                        self._dirty[reg_addr + i] = 1
+                        self._dirty_tags[reg_addr + i] = self._staging_tag
+                    i += 1
+                return None
+            for i in range(length):
+                shadow[reg_addr + i] = data[start + i]
+        elif self._batch_depth and self._shadow_valid:
+            # Not held by the shadow, queue each register until commit()
+            for i in range(length):
+                self._write_reg(reg_addr + i, data[start + i])
+            return None
+        tx_buf = self._tx_buf
+        for i in range(length):
+            tx_buf[i + 1] = data[start + i]
+        return self._send(reg_addr, length)
+
+    def _write_params(self, reg_addr: int, params: bytearray, stat_slot: int):
+        # Write a PLL or multisynth parameter block.
+        # In diff commit mode, only the smallest contiguous run of bytes which differ
+        # from the shadow registers is sent, and nothing at all if the block is unchanged.
+        length = len(params)
+        if not self._diff_commit or not self._shadow_valid:
+            return self._write_bulk(reg_addr, params)
+        first = 0
+        while first < length and params[first] == self._shadow[reg_addr + first]:
+            first += 1
+        if first == length:
+            # Nothing changed
+            self._writes_avoided += 1
+            self._bytes_saved[stat_slot] += length
+            return None
+        last = length - 1
+        while params[last] == self._shadow[reg_addr + last]:
+            last -= 1
+        self._bytes_saved[stat_slot] += length - (last - first + 1)
+        return self._write_bulk(reg_addr + first, params, first, last - first + 1)
+
+    def _read_reg_bus(self, reg_addr):
+        # Read a register from the device, bypassing the shadow cache
+        self._tag("_read_reg")
+        reg = bytearray([reg_addr])
+        self._i2c.writeto(self._device_addr, reg, False)
         res = self._i2c.readfrom(self._device_addr, 1)
         if len(res):
             res = int(res[0])
             return res
         else:
             return None
+
+    def _read_reg(self, reg_addr):
+        if self._is_cached(reg_addr):
+            self._reads_avoided += 1
+            return self._shadow[reg_addr]
+        return self._read_reg_bus(reg_addr)
+
+    def _load_shadow(self):
+        # Fill the shadow register cache from the device with a single burst read
+        self._tag("_load_shadow")
+        self._i2c.writeto(self._device_addr, bytes([0]), False)
+        self._i2c.readfrom_into(self._device_addr, self._shadow)
+        self._shadow_valid = True
+
     
     
-    
-    def _pll_calc(self, pll: int, freq: int, correction : int, vcxo : bool):
-        # Return (freq, register set array)
-     
+    def _pll_calc(self, pll: int, freq: int, correction : int, vcxo : bool, reg_set):
+        # Return freq, and fill in the caller supplied register set array
+        # Results are cached on (freq, pll). The cache is flushed when the reference changes.
+        if not vcxo:
+            slot = self._pll_cache.lookup(freq, pll)
+            if slot >= 0:
+                return self._pll_cache.result(slot, reg_set)
+        key_freq = freq
         
         ref_freq = self._xtal_freq[self._plla_ref_osc] if pll == PLLA else self._xtal_freq[self._pllb_ref_osc]
         
@@ -341,19 +719,28 @@ class SI5351():
      
         freq = lltmp
         freq += ref_freq * a
-        reg_set = array.array('L', [p1,p2,p3])
-       
-        return (((128 * a * 1000000 + b) if vcxo else freq), reg_set)
+        reg_set[_P1] = p1
+        reg_set[_P2] = p2
+        reg_set[_P3] = p3
+        if vcxo:
+            return 128 * a * 1000000 + b
+        return self._pll_cache.insert(key_freq, pll, freq, reg_set)
        
-    def _multisynth_calc(self, freq, pll_freq):
-        # Returns (multi synth value, reg_set)
+    def _multisynth_calc(self, freq, pll_freq, reg_set):
+        # Returns multi synth value, and fills in the caller supplied register set array
+        # Results are cached on (freq, pll_freq)
+        slot = self._ms_cache.lookup(freq, pll_freq)
+        if slot >= 0:
+            return self._ms_cache.result(slot, reg_set)
+        key_freq = freq
+        key_pll_freq = pll_freq
         divby4 = False
         ret_val = False
      
         
         # Multisynth bounds checking
-        if freq > _MULTISYNTH_MAX_FREQ * _FREQ_MULT:
-            freq = _MULTISYNTH_MAX_FREQ * _FREQ_MULT
+        if freq > _MULTISYNTH_MAX_FREQ_MULT:
+            freq = _MULTISYNTH_MAX_FREQ_MULT
         if freq < _MULTISYNTH_MIN_FREQ * _FREQ_MULT:
             freq = _MULTISYNTH_MIN_FREQ * _FREQ_MULT
         if freq >= _MULTISYNTH_DIVBY4_FREQ * _FREQ_MULT:
@@ -398,12 +785,53 @@ class SI5351():
             p1 = 128 * a + ((128 * b) // c) - 512
             p2 = 128 * b - c * ((128 * b) // c)
             p3 = c
-        reg_set = array.array('L')
-        reg_set.append(p1)
-        reg_set.append(p2)
-        reg_set.append(p3)
-        return((pll_freq if ret_val is False else freq), reg_set)
+        reg_set[_P1] = p1
+        reg_set[_P2] = p2
+        reg_set[_P3] = p3
+        return self._ms_cache.insert(key_freq, key_pll_freq, (pll_freq if ret_val is False else freq), reg_set)
     
+    def _pll_calc_fixed(self, pll: int, freq: int, reg_set):
+        # Fixed point _pll_calc, freq is the VCO frequency in Hz. Fills in reg_set
+        ref_freq = self._ref_freq16[self._plla_ref_osc] if pll == PLLA else self._ref_freq16[self._pllb_ref_osc]
+        # PLL bounds check
+        if freq < _PLL_VCO_MIN:
+            freq = _PLL_VCO_MIN
+        if freq > _PLL_VCO_MAX:
+            freq = _PLL_VCO_MAX
+        ratio = _fixed_div(freq, ref_freq, _FIXED_FRAC_BITS + _REF_FRAC_BITS)
+        a = ratio >> _FIXED_FRAC_BITS
+        b = ratio & (_FIXED_DENOM - 1)
+        if a < _PLL_A_MIN:
+            a = _PLL_A_MIN
+            b = 0
+        if a >= _PLL_A_MAX:
+            a = _PLL_A_MAX
+            b = 0
+        _fixed_params(a, b, reg_set)
+
+    def _multisynth_calc_fixed(self, freq: int, pll_freq: int, reg_set):
+        # Fixed point _multisynth_calc for a preset PLL. Fills in reg_set.
+        # freq is in 100ths of Hz, and must be a whole number of Hz above _SMALL_INT_MAX.
+        # pll_freq is in Hz.
+        # Multisynth bounds checking
+        if freq > _MULTISYNTH_MAX_FREQ_MULT:
+            freq = _MULTISYNTH_MAX_FREQ_MULT
+        if freq < _MULTISYNTH_MIN_FREQ * _FREQ_MULT:
+            freq = _MULTISYNTH_MIN_FREQ * _FREQ_MULT
+        if freq > _SMALL_INT_MAX:
+            ratio = _fixed_div(pll_freq, freq // _FREQ_MULT, _FIXED_FRAC_BITS)
+        else:
+            ratio = _fixed_muldiv(pll_freq // freq, pll_freq % freq, _FREQ_MULT, freq)
+        a = ratio >> _FIXED_FRAC_BITS
+        b = ratio & (_FIXED_DENOM - 1)
+        if a < _MULTISYNTH_A_MIN:
+            a = _MULTISYNTH_A_MIN
+            b = 0
+        if a >= _MULTISYNTH_A_MAX:
+            a = _MULTISYNTH_A_MAX
+            b = 0
+        _fixed_params(a, b, reg_set)
+
     def _multisynth67_calc(self, freq: int, pll_freq: int):
         # Multisynth bounds checking
         if freq > _MULTISYNTH67_MAX_FREQ * _FREQ_MULT:
@@ -468,7 +896,7 @@ class SI5351():
     
                        
     def _ms_div(self, clk: int, r_div: int, div_by_4: bool):
-        
+        self._tag("_ms_div")
         if clk == CLK0:
             reg_addr = _CLK0_PARAMETERS + 2
         elif clk == CLK1:
@@ -505,7 +933,7 @@ class SI5351():
         self._write_reg(reg_addr, reg_val)
     
     def _select_r_div(self, freq: int):
-        # return (r_div, freq)
+        # Return freq, the chosen R divider is left in self._r_div
         r_div = _OUTPUT_CLK_DIV_1
         # Choose the correct R divider
         if (freq >= _CLKOUT_MIN_FREQ * _FREQ_MULT) and (freq < _CLKOUT_MIN_FREQ * _FREQ_MULT * 2):
@@ -529,7 +957,8 @@ class SI5351():
         elif(freq >= _CLKOUT_MIN_FREQ * _FREQ_MULT * 64) and (freq < _CLKOUT_MIN_FREQ * _FREQ_MULT * 128):
             r_div = _OUTPUT_CLK_DIV_2
             freq *= 2
-        return (r_div, freq)
+        self._r_div = r_div
+        return freq
 
     def _select_r_div_ms67(self, freq):
         # return (r_div, freq)
@@ -558,16 +987,23 @@ class SI5351():
             freq *= 2
         return (r_div, freq)
 
-    def __init__(self, i2c_object, device_addr = 0x60, xtal_freq=25000000):
+    def __init__(self, i2c_object, device_addr = 0x60, xtal_freq=25000000, calc_cache_size=_CALC_CACHE_SIZE,
+                 pll_cache_size=_PLL_CACHE_SIZE):
         self._xtal_freq = [0] * 2
         self._xtal_freq[0] = xtal_freq
         self._clk_freq = [0] * 8
         self._plla_freq  = 0
         self._pllb_freq = 0
+        # VCO frequencies in whole Hz, 0 for a PLL at a fraction of a Hz
+        self._pll_hz = [0, 0]
+        # True for a PLL set by _set_pll_hz() since _plla_freq or _pllb_freq was last brought up to date
+        self._pll_stale = [False, False]
         self._clkin_div = [0]
         self._i2c_bus_error = 0
         self._clk_first_set = [False] * 8
         self._i2c = i2c_object
+        # Optional tag hook, provided by lib/i2c_profiler.py
+        self._i2c_tag = getattr(i2c_object, "set_tag", None)
         self._device_addr = device_addr
         self._dev_status = bytes(5)
         self._dev_int_status = bytes(4)
@@ -576,10 +1012,62 @@ class SI5351():
         self._clkin_div = _CLKIN_DIV_1
         self._ref_correction = [0] * 2
         self._pll_assignment = [0] * 8
+        self._shadow = bytearray(_SHADOW_SIZE)
+        self._shadow_valid = False
+        self._reads_avoided = 0
+        self._writes_avoided = 0
+        self._diff_commit = True
+        self._bytes_saved = array.array('L', [0] * _STAT_SLOTS)
+        self._batch_depth = 0
+        self._batch_pll_reset = 0
+        # Writes to registers outside the shadow made while staging, issued in order by commit()
+        self._batch_uncached = 0
+        self._batch_uncached_regs = bytearray(_BATCH_UNCACHED_MAX)
+        self._batch_uncached_data = bytearray(_BATCH_UNCACHED_MAX)
+        self._batch_uncached_tags = [None] * _BATCH_UNCACHED_MAX
+        self._dirty = bytearray(_SHADOW_SIZE)
+        # Profiler tag of the caller which staged each dirty register
+        self._dirty_tags = [None] * _SHADOW_SIZE
+        self._staging_tag = None
+        self._staged = 0
+        self._ms_cache = _CalcCache(calc_cache_size)
+        # Preallocated buffers for the allocation free set_freq path
+        self._tx_buf = bytearray(_TX_BUF_SIZE)
+        self._tx_mv = memoryview(self._tx_buf)
+        self._tx_views = [self._tx_mv[:n + 1] for n in range(_TX_VIEWS)]
+        self._params = bytearray(_PARAMETERS_LENGTH)
+        self._pll_regs = array.array('L', [0, 0, 0])
+        self._ms_regs = array.array('L', [0, 0, 0])
+        self._r_div = _OUTPUT_CLK_DIV_1
+        # Fine tune mode state
+        self._fine_mode = [False] * 8
+        self._fine_div = [0] * 8
+        self._fine_r_div = [0] * 8
+        # Dividers to use in preference to a centered one, see prefer_fine_divider()
+        self._fine_pref_div = [0] * 8
+        self._fine_pref_r_div = [0] * 8
+        self._fine_updates = 0
+        self._fine_fallbacks = 0
+        # Number of set_freq calls per output, used by the frequency planner
+        self._set_counts = [0] * 8
+        self._pll_cache = _CalcCache(pll_cache_size)
+        self._fixed_point = False
+        self._ref_freq16 = [0] * 2
+        self._set_ref_freq16(PLL_INPUT_XO)
+        self._warm = False
+        self._image_loaded = False
+        # Counts configuration changes, so callers can tell when the image is worth saving
+        self._generation = 0
    
+    # Work out the corrected reference frequency in 1/16 Hz for the fixed point maths
+    def _set_ref_freq16(self, ref_osc: int):
+        ref_freq = self._xtal_freq[ref_osc] << _REF_FRAC_BITS
+        self._ref_freq16[ref_osc] = ref_freq + (ref_freq * self._ref_correction[ref_osc] + 500000000) // 1000000000
+
     # Set the reference frequency value for the desired reference oscillator
     def _set_ref_freq(self, ref_freq: int, ref_osc: int):
         ref_osc &= 1
+        self._pll_cache.flush()
         if ref_freq <= 30000000:
             self._xtal_freq[ref_osc] = ref_freq
             if ref_osc == PLL_INPUT_CLKIN:
@@ -592,17 +1080,21 @@ class SI5351():
             self._xtal_freq[ref_osc] = ref_freq // 4;
             if ref_osc == PLL_INPUT_CLKIN:
                 self._clkin_div = _CLKIN_DIV_4       
+        self._set_ref_freq16(ref_osc)
             
     
     # Set the correction factor
     def _set_correction(self, corr: int, ref_osc: int):
         self._ref_correction[ref_osc & 0xFF] = corr
+        self._pll_cache.flush()
+        self._set_ref_freq16(ref_osc)
         # Recalculate and set PLL freqs based on correction value
-        self._set_pll(self._plla_freq, PLLA)
-        self._set_pll(self._pllb_freq, PLLB)
+        self._set_pll(self._pll_freq(PLLA), PLLA)
+        self._set_pll(self._pll_freq(PLLB), PLLB)
 
     # Set the indicated multisynth into integer mode.
     def _set_int(self, clk, enable):
+        self._tag("_set_int")
         clk &= 0x07
         reg_val = self._read_reg(_CLK0_CTRL + clk)
         if enable is True:
@@ -617,69 +1109,63 @@ class SI5351():
     # Set the specified PLL to a specific oscillation frequency
     def _set_pll(self, pll_freq, pll_assignment):
           
+            if self._fixed_point and not pll_freq % _FREQ_MULT:
+                self._pll_calc_fixed(pll_assignment, pll_freq // _FREQ_MULT, self._pll_regs)
+            elif pll_assignment == PLLA:
+                freq = self._pll_calc(PLLA, pll_freq, self._ref_correction[self._plla_ref_osc], 0, self._pll_regs)
+            else:
+                freq = self._pll_calc(PLLB, pll_freq, self._ref_correction[self._pllb_ref_osc], 0, self._pll_regs)
+            self._write_pll(pll_assignment)
+            self._pll_hz[pll_assignment] = 0 if pll_freq % _FREQ_MULT else pll_freq // _FREQ_MULT
+            self._pll_stale[pll_assignment] = False
             if pll_assignment == PLLA:
-                (freq, pll_reg) = self._pll_calc(PLLA, pll_freq, self._ref_correction[self._plla_ref_osc], 0)
+                self._plla_freq = pll_freq
+            elif pll_assignment == PLLB:
+                self._pllb_freq = pll_freq
+
+    # Set a PLL to a VCO frequency in whole Hz, with the fixed point maths.
+    # The frequency is a small int, so nothing is allocated. The frequency in
+    # 100ths of Hz is only worked out if something asks _pll_freq() for it.
+    def _set_pll_hz(self, vco: int, pll: int):
+        self._pll_calc_fixed(pll, vco, self._pll_regs)
+        self._write_pll(pll)
+        self._pll_hz[pll] = vco
+        self._pll_stale[pll] = True
+
+    # Return the frequency of a PLL in 100ths of Hz
+    def _pll_freq(self, pll: int):
+        if self._pll_stale[pll]:
+            # Last set by _set_pll_hz()
+            self._pll_stale[pll] = False
+            if pll == PLLA:
+                self._plla_freq = self._pll_hz[pll] * _FREQ_MULT
             else:
-                (freq, pll_reg) = self._pll_calc(PLLB, pll_freq, self._ref_correction[self._pllb_ref_osc], 0)
-              
-      
-            
-            # Derive the register values to write
-            # Prepare a bytearray for parameters to be written to
-            params = bytearray()
-          
-            
-            # Registers 26,27
-            params.append((pll_reg[_P3] >> 8) & 0xFF)
-           
-            params.append((pll_reg[_P3]) & 0xFF)
-            
-            
-            # Register 28
-            params.append((pll_reg[_P1] >> 16) & 0x03)
-           
-            
-            # Registers 29,30
-            params.append((pll_reg[_P1] >> 8) & 0xFF)
-           
+                self._pllb_freq = self._pll_hz[pll] * _FREQ_MULT
+        return self._plla_freq if pll == PLLA else self._pllb_freq
 
-            params.append(pll_reg[_P1]  & 0xFF)
-            
-            
-            # Register 31
-            temp = ((pll_reg[_P3] >> 12) & 0xF0)
-            temp2 = ((pll_reg[_P2] >> 16) & 0x0F)
-            temp += temp2
-            params.append(temp)
-           
-            
-            # Registers 32,33
-            temp = (pll_reg[_P2] >> 8) & 0xFF
-            params.append(temp)
-        
-            temp = pll_reg[_P2]  & 0xFF
-            params.append(temp)
-                             
+    # Write the PLL parameter block held in self._pll_regs
+    def _write_pll(self, pll_assignment: int):
+            params = self._params
+            _pack_params(self._pll_regs, params)
             
             # Write the parameters
+            self._tag("_set_pll")
             if pll_assignment == PLLA:
-                self._write_bulk(_PLLA_PARAMETERS, params)
-                self._plla_freq = pll_freq
+                self._write_params(_PLLA_PARAMETERS, params, _STAT_PLLA)
             elif pll_assignment == PLLB:
-                self._write_bulk(_PLLB_PARAMETERS, params)
-                self._pllb_freq = pll_freq
+                self._write_params(_PLLB_PARAMETERS, params, _STAT_PLLB)
     
     # Set the specified multisynth parameters.
     def _set_ms(self, clk, ms_reg, int_mode, r_div, div_by_4):
         if clk <= CLK5:
-            params = bytearray()
+            params = self._params
             clk &= 7
             
             # Registers 42,43 for CLK0
             temp = ((ms_reg[_P3] >> 8) & 0xFF)
-            params.append(temp)
+            params[0] = temp
             temp = ms_reg[_P3]  & 0xFF
-            params.append(temp)
+            params[1] = temp
             
             # Register 44 for CLK0
             reg_val = self._read_reg((_CLK0_PARAMETERS + 2) + (clk * 8))
@@ -687,51 +1173,52 @@ class SI5351():
             reg_val &= ~0x03
            
             temp = reg_val | ((ms_reg[_P1] >> 16) & 0x03)
-            params.append(temp)
+            params[2] = temp
             
             # Registers 45-46 for CLK0
             temp = (ms_reg[_P1] >> 8) & 0xFF
-            params.append(temp)
+            params[3] = temp
             temp = ms_reg[_P1]  & 0xFF           
-            params.append(temp)
+            params[4] = temp
             
             # Register 47 for CLK0
             temp = ((ms_reg[_P3] >> 12) & 0xF0)
             temp += ((ms_reg[_P2] >> 16) & 0x0F)
-            params.append(temp)
+            params[5] = temp
             
             # Registers 48, 49 for CLK0
             temp = (ms_reg[_P2] >> 8) & 0xFF
-            params.append(temp)
+            params[6] = temp
             temp = ms_reg[_P2]  & 0xFF
-            params.append(temp)
+            params[7] = temp
           
         else:
             # MS6 and MS7 only use one register
             temp = ms_reg[_P1] & 0xFF
         
+        self._tag("_set_ms")
         if clk == CLK0:
-            self._write_bulk(_CLK0_PARAMETERS, params)
+            self._write_params(_CLK0_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK1:
-            self._write_bulk(_CLK1_PARAMETERS, params)
+            self._write_params(_CLK1_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK2:
-            self._write_bulk(_CLK2_PARAMETERS, params)
+            self._write_params(_CLK2_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK3:
-            self._write_bulk(_CLK3_PARAMETERS, params)
+            self._write_params(_CLK3_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK4:
-            self._write_bulk(_CLK4_PARAMETERS, params)
+            self._write_params(_CLK4_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK5:
-            self._write_bulk(_CLK5_PARAMETERS, params)
+            self._write_params(_CLK5_PARAMETERS, params, clk)
             self._set_int(clk, int_mode)
             self._ms_div(clk, r_div, div_by_4)
         elif clk == CLK6:
@@ -742,6 +1229,7 @@ class SI5351():
     
     # Set the desired PLL source for a multisynth
     def _set_ms_source(self, clk, pll):
+        self._tag("_set_ms_source")
         reg_val = self._read_reg(_CLK0_CTRL + clk)
         if pll == PLLA:
             reg_val &= ~_CLK_PLL_SELECT
@@ -750,8 +1238,109 @@ class SI5351():
         self._write_reg(_CLK0_CTRL + clk, reg_val)
         self._pll_assignment[clk] = pll;
     
+    # Return True if no other active output between CLK0 and CLK5 shares the PLL used by clk
+    def _pll_exclusive(self, clk: int):
+        pll = self._pll_assignment[clk]
+        for i in range(0, 6):
+            if i != clk and self._clk_freq[i] != 0 and self._pll_assignment[i] == pll:
+                return False
+        return True
+
+    # Forget the fine tune dividers of every output on a PLL
+    def _fine_invalidate(self, pll: int):
+        for i in range(0, 6):
+            if self._pll_assignment[i] == pll:
+                self._fine_div[i] = 0
+
+    # Fine tune set_freq strategy.
+    #
+    # The output multisynth is held at a fixed even integer divider, and the frequency
+    # is moved by rewriting only the PLL feedback parameters, without a PLL reset.
+    # Diff commits reduce this to the few P1/P2 bytes which actually change.
+    # When the new frequency would push the VCO out of range, a new divider is chosen
+    # and the PLL, multisynth and R divider are reprogrammed, followed by a PLL reset.
+    # The new divider is the preferred one from prefer_fine_divider() if it reaches
+    # the frequency, otherwise the even divider which centers the VCO.
+    #
+    # Whole Hz frequencies are worked in Hz, where the VCO frequency fits a small int, and the
+    # PLL is set with the fixed point maths. So if freq itself is a small int (below about
+    # 10.7 MHz) the PLL only update allocates nothing. Fractions of a Hz need 100ths of Hz.
+    def _set_freq_fine(self, clk: int, freq: int):
+        if freq > 0 and freq < _CLKOUT_MIN_FREQ * _FREQ_MULT:
+            freq = _CLKOUT_MIN_FREQ * _FREQ_MULT
+        pll = self._pll_assignment[clk]
+        ms_freq = self._select_r_div(freq)
+        r_div = self._r_div
+        whole_hz = not ms_freq % _FREQ_MULT
+        if whole_hz:
+            ms_freq //= _FREQ_MULT
+            vco_min = _PLL_VCO_MIN
+            vco_max = _PLL_VCO_MAX
+        else:
+            vco_min = _PLL_VCO_MIN * _FREQ_MULT
+            vco_max = _PLL_VCO_MAX * _FREQ_MULT
+        div = self._fine_div[clk]
+        if div and r_div == self._fine_r_div[clk]:
+            vco = ms_freq * div
+            if vco >= vco_min and vco <= vco_max:
+                # Fast path, PLL feedback numerator only
+                self._clk_freq[clk] = freq
+                if whole_hz:
+                    self._set_pll_hz(vco, pll)
+                else:
+                    self._set_pll(vco, pll)
+                self._fine_updates += 1
+                return 0
+        # Full path
+        div = self._fine_pref_div[clk]
+        vco = ms_freq * div
+        if r_div != self._fine_pref_r_div[clk] or vco < vco_min or vco > vco_max:
+            # Pick an even integer divider which centers the VCO
+            div = (_FINE_VCO_CENTER if whole_hz else _FINE_VCO_CENTER * _FREQ_MULT) // ms_freq
+            div = (div + 1) & ~1
+            if div < _MULTISYNTH_A_MIN:
+                div = _MULTISYNTH_A_MIN
+            if div > _MULTISYNTH_A_MAX:
+                div = _MULTISYNTH_A_MAX
+            vco = ms_freq * div
+        if vco < vco_min or vco > vco_max:
+            # Out of reach of an integer divider, use the normal strategy
+            self._fine_div[clk] = 0
+            return None
+        self._fine_fallbacks += 1
+        self._clk_freq[clk] = freq
+        if self._clk_first_set[clk] == False:
+            self.output_enable(clk, True)
+            self._clk_first_set[clk] = True
+        ms_reg = self._ms_regs
+        ms_reg[_P1] = 128 * div - 512
+        ms_reg[_P2] = 0
+        ms_reg[_P3] = 1
+        if whole_hz:
+            self._set_pll_hz(vco, pll)
+        else:
+            self._set_pll(vco, pll)
+        self._set_ms(clk, ms_reg, True, r_div, False)
+        self._pll_reset(pll)
+        self._fine_div[clk] = div
+        self._fine_r_div[clk] = r_div
+        return 0
+
+    # Write a precomputed PLL parameter block, and record the PLL frequency it represents
+    def _set_pll_image(self, pll: int, image, pll_freq: int):
+        self._tag("_set_pll_image")
+        if pll == PLLA:
+            self._write_params(_PLLA_PARAMETERS, image, _STAT_PLLA)
+            self._plla_freq = pll_freq
+        else:
+            self._write_params(_PLLB_PARAMETERS, image, _STAT_PLLB)
+            self._pllb_freq = pll_freq
+        self._pll_hz[pll] = 0 if pll_freq % _FREQ_MULT else pll_freq // _FREQ_MULT
+        self._pll_stale[pll] = False
+
     # Apply a reset to the indicated PLL
     def _pll_reset(self, target_pll):
+        self._tag("_pll_reset")
         if target_pll == PLLA:
             self._write_reg(_PLL_RESET, _PLL_RESET_A)
         elif target_pll == PLLB:
@@ -759,18 +1348,132 @@ class SI5351():
   
    
             
-    # Enable or disable a chosen output        
-    def output_enable(self, clk: int, enable: bool):
-        reg_val = self._read_reg(_OUTPUT_ENABLE_CTRL)
-        if enable is True:
-            reg_val &= ~(1<< clk)
+    # Return True if the registers read into the shadow show a device which is still
+    # configured by this driver: no power cycle since the sticky bits were cleared,
+    # both PLLs locked, the expected crystal load, output control and VCXO registers
+    # as reset() leaves them, and both PLLs programmed with registers the driver would
+    # write for their frequencies. Otherwise init() falls back to reset().
+    def _warm_start_ok(self, xtal_load: int):
+        # Needs the reference frequency and correction set up
+        shadow = self._shadow
+        if shadow[_INTERRUPT_STATUS] & _STATUS_SYS_INIT:
+            return False
+        if shadow[_DEVICE_STATUS] & (_STATUS_LOL_A | _STATUS_LOL_B):
+            return False
+        if shadow[_CRYSTAL_LOAD] != xtal_load:
+            return False
+        # Output control bits reset() sets, and nothing later changes
+        for clk in range(0, 8):
+            if shadow[_CLK0_CTRL + clk] & (_CLK_POWERDOWN | _CLK_INVERT | _CLK_INPUT_MASK) != _CLK_INPUT_MULTISYNTH_N:
+                return False
+        if shadow[_VXCO_PARAMETERS_LOW] or shadow[_VXCO_PARAMETERS_MID] or shadow[_VXCO_PARAMETERS_HIGH]:
+            return False
+        return self._pll_regs_ok(PLLA) and self._pll_regs_ok(PLLB)
+
+    # Return True if a PLL parameter block in the shadow registers is what this driver writes
+    # for the VCO frequency it represents, with the current reference and correction: the VCO
+    # is in range, and _pll_calc, or _pll_calc_fixed for a block with its denominator, gives
+    # back the same registers.
+    def _pll_regs_ok(self, pll: int):
+        p1, p2, p3 = self._unpack_params(_PLLA_PARAMETERS if pll == PLLA else _PLLB_PARAMETERS)
+        if p3 == 0:
+            return False
+        freq = self._pll_freq_from_regs(pll)
+        if freq < _PLL_VCO_MIN * _FREQ_MULT or freq > _PLL_VCO_MAX * _FREQ_MULT:
+            return False
+        reg_set = array.array('L', [0, 0, 0])
+        if p3 == _FIXED_DENOM:
+            self._pll_calc_fixed(pll, (freq + _FREQ_MULT // 2) // _FREQ_MULT, reg_set)
         else:
-            reg_val |= (1<< clk)
-        self.__write_reg(_OUTPUT_ENABLE_CTRL, reg_val)
-            
-        
-    
+            ref_osc = self._plla_ref_osc if pll == PLLA else self._pllb_ref_osc
+            self._pll_calc(pll, freq, self._ref_correction[ref_osc], 0, reg_set)
+        return reg_set[_P1] == p1 and reg_set[_P2] == p2 and reg_set[_P3] == p3
+
+    # Return (P1, P2, P3) from a parameter block in the shadow registers
+    def _unpack_params(self, reg_addr: int):
+        shadow = self._shadow
+        p1 = ((shadow[reg_addr + 2] & 0x03) << 16) | (shadow[reg_addr + 3] << 8) | shadow[reg_addr + 4]
+        p2 = ((shadow[reg_addr + 5] & 0x0F) << 16) | (shadow[reg_addr + 6] << 8) | shadow[reg_addr + 7]
+        p3 = ((shadow[reg_addr + 5] & 0xF0) << 12) | (shadow[reg_addr] << 8) | shadow[reg_addr + 1]
+        return (p1, p2, p3)
+
+    # Return the PLL frequency in 100ths of Hz programmed in the shadow registers.
+    # The inverse of _pll_calc, rounded so that _pll_calc gives back the same registers.
+    def _pll_freq_from_regs(self, pll: int):
+        p1, p2, p3 = self._unpack_params(_PLLA_PARAMETERS if pll == PLLA else _PLLB_PARAMETERS)
+        if p3 == 0:
+            return 0
+        ref_osc = self._plla_ref_osc if pll == PLLA else self._pllb_ref_osc
+        ref_freq = self._xtal_freq[ref_osc] * _FREQ_MULT
+        ref_freq += ((((self._ref_correction[ref_osc] << 31) // 1000000000) * ref_freq) >> 31)
+        a = (p1 + 512) >> 7
+        b = (((p1 + 512) & 0x7F) * p3 + p2) >> 7
+        return ref_freq * a + (ref_freq * b + p3 - 1) // p3
+
+    # Rebuild the PLL frequencies, output assignments, output frequencies and fine tune
+    # dividers from the shadow registers, for a device which is already configured
+    def _restore_state(self):
+        shadow = self._shadow
+        self._plla_freq = self._pll_freq_from_regs(PLLA)
+        self._pllb_freq = self._pll_freq_from_regs(PLLB)
+        for pll in (PLLA, PLLB):
+            pll_freq = self._plla_freq if pll == PLLA else self._pllb_freq
+            self._pll_hz[pll] = 0 if pll_freq % _FREQ_MULT else pll_freq // _FREQ_MULT
+            self._pll_stale[pll] = False
+        for clk in range(0, 8):
+            ctrl = shadow[_CLK0_CTRL + clk]
+            self._pll_assignment[clk] = PLLB if ctrl & _CLK_PLL_SELECT else PLLA
+            self._clk_first_set[clk] = not (ctrl & _CLK_POWERDOWN) and not (shadow[_OUTPUT_ENABLE_CTRL] & (1 << clk))
+            self._clk_freq[clk] = 0
+            self._fine_div[clk] = 0
+            if clk > CLK5 or not self._clk_first_set[clk]:
+                continue
+            reg_addr = _CLK0_PARAMETERS + (clk * 8)
+            p1, p2, p3 = self._unpack_params(reg_addr)
+            r_div = (shadow[reg_addr + 2] >> _OUTPUT_CLK_DIV_SHIFT) & 0x07
+            pll_freq = self._pllb_freq if self._pll_assignment[clk] == PLLB else self._plla_freq
+            if (shadow[reg_addr + 2] & _OUTPUT_CLK_DIVBY4) == _OUTPUT_CLK_DIVBY4:
+                self._clk_freq[clk] = pll_freq // 4
+            elif p3:
+                # pll_freq / ((P1 + 512) / 128 + P2 / (128 * P3))
+                self._clk_freq[clk] = ((pll_freq * 128 * p3) // ((p1 + 512) * p3 + p2)) >> r_div
+                div = (p1 + 512) >> 7
+                if ctrl & _CLK_INTEGER_MODE and p2 == 0 and p3 == 1 and not (p1 & 0x7F) and not (div & 1):
+                    self._fine_div[clk] = div
+                    self._fine_r_div[clk] = r_div
+
+    # Program the device from a register image saved by save_image().
+    # The outputs are disabled, the register ranges are written in a few bursts,
+    # both PLLs are reset once, and then the saved output enables are restored.
+    # Returns False, without touching the device, if there is no image or it was
+    # saved with a different reference, correction or crystal load.
+    def _load_image(self, path: str, xtal_load: int, corr: int):
+        header_len = ustruct.calcsize(_IMAGE_HEADER)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(header_len)
+                image = f.read(_SHADOW_SIZE)
+        except OSError:
+            return False
+        if len(header) != header_len or len(image) != _SHADOW_SIZE:
+            return False
+        magic, xtal_freq, correction = ustruct.unpack(_IMAGE_HEADER, header)
+        if (magic != _IMAGE_MAGIC or xtal_freq != self._xtal_freq[PLL_INPUT_XO] or correction != corr
+            or image[_CRYSTAL_LOAD] != xtal_load):
+            return False
+        self._tag("_load_image")
+        self._write_reg(_OUTPUT_ENABLE_CTRL, 0xFF)
+        for first, last in _IMAGE_RANGES:
+            self._write_bulk(first, image, first, last - first + 1)
+        self._write_reg(_PLL_RESET, _PLL_RESET_A | _PLL_RESET_B)
+        self._write_reg(_OUTPUT_ENABLE_CTRL, image[_OUTPUT_ENABLE_CTRL])
+        self._image_loaded = True
+        return True
+
     def reset(self):
+        # Make sure the shadow registers reflect the device before writing through them
+        if not self._shadow_valid:
+            self._load_shadow()
         # First, turn the clocks off
         for i in range (16, 24):
             self._write_reg(i, 0x80)
@@ -797,6 +1500,7 @@ class SI5351():
         self._set_ms_source(CLK7, PLLB)
         
         # Reset the VCXO param
+        self._tag("reset")
         self._write_reg(_VXCO_PARAMETERS_LOW, 0)
         self._write_reg(_VXCO_PARAMETERS_MID, 0)
         self._write_reg(_VXCO_PARAMETERS_HIGH, 0)
@@ -810,11 +1514,14 @@ class SI5351():
             self._clk_freq[i] = 0
             self.output_enable(i, False)
             self._clk_first_set[i] = False
+            self._fine_div[i] = 0
             
 
     # Initialize the SI5351
+    #
+    # image_path - Optional register image saved by save_image(), used instead of reset() when it matches
     
-    def init (self, xtal_load_c: int, xo_freq: int, corr: int):
+    def init (self, xtal_load_c: int, xo_freq: int, corr: int, image_path: str = None):
         # return bool
         device_addresses = self._i2c.scan()
         if self._device_addr not in device_addresses:
@@ -825,31 +1532,100 @@ class SI5351():
             status_reg = self._read_reg(_DEVICE_STATUS)
             if (status_reg >> 7) == 0:
                 break;
-        # Set crystal load capacitance
-        self._write_reg(_CRYSTAL_LOAD, (xtal_load_c & _CRYSTAL_LOAD_MASK) | 0b00010010);
+        # Fill the shadow registers. From here on, register reads are served from RAM
+        self._load_shadow()
+        xtal_load = (xtal_load_c & _CRYSTAL_LOAD_MASK) | 0b00010010
         
         # Set up the XO reference frequency
         if xo_freq != 0: # Zero def means select _XTAL_FREQ
             self._set_ref_freq(xo_freq, PLL_INPUT_XO)
         else:
             self._set_ref_freq(_XTAL_FREQ, PLL_INPUT_XO);
+        # and the correction, so the warm start check can recalculate the PLL registers
+        self._ref_correction[PLL_INPUT_XO] = corr
+        self._set_ref_freq16(PLL_INPUT_XO)
+        self._warm = self._warm_start_ok(xtal_load)
+        # Set crystal load capacitance
+        self._tag("init")
+        self._write_reg(_CRYSTAL_LOAD, xtal_load);
         
-        # Set coeection
-        self._set_correction(corr, PLL_INPUT_XO)
+        # The device may still be configured from before a soft reboot of the host,
+        # otherwise program it from a saved image if there is one.
+        if self._warm or (image_path is not None and self._load_image(image_path, xtal_load, corr)):
+            # Pick up the device state instead of resetting it
+            self._pll_cache.flush()
+            self._restore_state()
+        else:
+            # Set coeection
+            self._set_correction(corr, PLL_INPUT_XO)
+            
+            self.reset()
         
-        self.reset()
+        # Clear the sticky status bits. SYS_INIT_STKY then stays clear until the device
+        # is power cycled, which is how a warm start is recognised.
+        self._write_reg(_INTERRUPT_STATUS, 0)
                      
         return True
     
+    # Return True if init() found the device already configured, and skipped the reset
+    def warm_started(self) -> bool:
+        return self._warm
+
+    # Return True if init() programmed the device from a saved register image
+    def image_loaded(self) -> bool:
+        return self._image_loaded
+
+    # Return a counter which changes whenever the device configuration changes. Writes which
+    # only touch the PLL feedback parameters, as fine tune steps do, leave it alone, since
+    # init() only needs the PLL and band configuration from a saved image.
+    # Used to decide when the configuration has settled and is worth saving.
+    def get_generation(self) -> int:
+        return self._generation
+
+    # Save the register image to a file, for init() to program the device from at the next cold boot.
+    # Returns False if there is nothing valid to save
+    def save_image(self, path: str) -> bool:
+        if not self._shadow_valid or self._batch_depth:
+            return False
+        with open(path, "wb") as f:
+            f.write(ustruct.pack(_IMAGE_HEADER, _IMAGE_MAGIC, self._xtal_freq[PLL_INPUT_XO],
+                                 self._ref_correction[PLL_INPUT_XO]))
+            f.write(self._shadow)
+        return True
+    
     # Set a specific output to a desired clock frequency
+    #
+    # clk - Clock output
+    # freq - Frequency in 100ths of Hz
+    #
+    # Heap use: frequencies up to _SMALL_INT_MAX (about 10.7 MHz) are small ints, and on
+    # CLK0-CLK5 these calls allocate nothing:
+    #
+    #   - fine tune steps to a whole number of Hz, and set_freq() of an output in fine tune
+    #     mode to the frequency it is already at
+    #   - with set_fixed_point(True), outputs on a PLL at a whole number of Hz, including
+    #     frequencies with a fraction of a Hz
+    #
+    # Anything else, including every frequency above about 10.7 MHz, does its arithmetic on
+    # heap allocated ints. tools/check_set_freq_alloc.py checks the allocation free cases.
     def set_freq(self, clk: int , freq: int):
         # Return False if failure to set, else True
         int_mode = False
         div_by_4 = False
         clk &= 0x07
+        self._set_counts[clk] += 1
         
         # Check which Multisynth is being set
         if clk <= CLK5:
+            # Outputs in fine tune mode which have their PLL to themselves
+            if self._fine_mode[clk] and freq and self._pll_exclusive(clk):
+                if self._fine_div[clk] and freq == self._clk_freq[clk]:
+                    # Already set, as the oscillator which doesn't move when tuning usually is
+                    return 0
+                if self._set_freq_fine(clk, freq) is not None:
+                    return 0
+            # The normal strategy invalidates fine tuning of any output on the same PLL
+            self._fine_invalidate(self._pll_assignment[clk])
             #
             # MS0 through MS5 logic
             #
@@ -858,15 +1634,15 @@ class SI5351():
             if freq > 0 and freq < _CLKOUT_MIN_FREQ * _FREQ_MULT:
                 freq = _CLKOUT_MIN_FREQ * _FREQ_MULT
             # Upper bounds check
-            if freq > _MULTISYNTH_MAX_FREQ * _FREQ_MULT:
-                freq = _MULTISYNTH_MAX_FREQ * _FREQ_MULT
+            if freq > _MULTISYNTH_MAX_FREQ_MULT:
+                freq = _MULTISYNTH_MAX_FREQ_MULT
             # If requested freq >100 MHz and no other outputs are already >100 MHz,
             # we need to recalculate PLLA and then recalculate all other CLK outputs
             # on same PLL
-            if freq > (_MULTISYNTH_SHARE_MAX * _FREQ_MULT):
+            if freq > _MULTISYNTH_SHARE_MAX_MULT:
                 # Check other clocks on the same PLL
                 for i in range(0,6):
-                    if self._clk_freq[i] > (_MULTISYNTH_SHARE_MAX * _FREQ_MULT):
+                    if self._clk_freq[i] > _MULTISYNTH_SHARE_MAX_MULT:
                         if (i != clk) and  (self._pll_assignment[i] == self._pll_assignment[clk]):
                             return False # won't set if any other clks already >100 MHz
             
@@ -877,7 +1653,8 @@ class SI5351():
                 # Set the freq in memory
                 self._clk_freq[clk] = freq
                 # Calculate the proper PLL frequency
-                (res, ms_reg) = self._multisynth_calc(freq, 0)
+                res = self._multisynth_calc(freq, 0, self._ms_regs)
+                ms_reg = self._ms_regs
                 # Set PLL
                 #self._set_pll(pll_freq, self._pll_assignment[clk])
                 # Recalculate params for other synths on the same PLL
@@ -886,8 +1663,10 @@ class SI5351():
                         if self._pll_assignment[i] == self._pll_assignment[clk]:
                             # Select the proper R div value
                             temp_freq = clk_freq[i]
-                            (r_div, temp_freq) = self._select_r_div(temp_freq)
-                            (ms_value, temp_reg) = self._multisynth_calc(temp_freq, pll_freq)
+                            temp_freq = self._select_r_div(temp_freq)
+                            r_div = self._r_div
+                            ms_value = self._multisynth_calc(temp_freq, pll_freq, self._ms_regs)
+                            temp_reg = self._ms_regs
                             # If freq > 150 MHz, we need to use DIVBY4 and integer mode
                             if temp_freq >= _MULTISYNTH_DIVBY4_FREQ * _FREQ_MULT:
                                 div_by_4 = True
@@ -904,13 +1683,17 @@ class SI5351():
                     self.output_enable(clk, 1)
                     self._clk_first_set[clk] = True
                 # Select the proper R div value
-                (r_div, freq) = self._select_r_div(freq)
+                freq = self._select_r_div(freq)
+                r_div = self._r_div
                 # Calculate the proper r_div value
                 
-                if self._pll_assignment[clk] == PLLA:
-                    (res, ms_reg) = self._multisynth_calc(freq, self._plla_freq)
+                ms_reg = self._ms_regs
+                pll = self._pll_assignment[clk]
+                pll_hz = self._pll_hz[pll]
+                if self._fixed_point and pll_hz and (freq <= _SMALL_INT_MAX or not freq % _FREQ_MULT):
+                    self._multisynth_calc_fixed(freq, pll_hz, ms_reg)
                 else:
-                    (res, ms_reg) = self._multisynth_calc(freq, self._pllb_freq)
+                    res = self._multisynth_calc(freq, self._pll_freq(pll), ms_reg)
                 # Set the multisynth registers
                 self._set_ms(clk, ms_reg, int_mode, r_div, div_by_4)
             return 0
@@ -918,6 +1701,7 @@ class SI5351():
             #
             # MS7 and MS7 logic
             #
+            pllb_freq = self._pll_freq(PLLB)
         
             # Lower bounds check
             if freq > 0 and freq < _CLKOUT67_MIN_FREQ * _FREQ_MULT:
@@ -931,8 +1715,8 @@ class SI5351():
             # with the same PLL, otherwise do not set it.
             if clk == CLK6:
                 if self._clk_freq[7] != 0:
-                    if self._pllb_freq % freq == 0:
-                        if (self._pllb_freq // freq) % 2 != 0:
+                    if pllb_freq % freq == 0:
+                        if (pllb_freq // freq) % 2 != 0:
                             # Not an even divide ratio, no bueno
                             return 1
                         else:
@@ -955,15 +1739,15 @@ class SI5351():
                     self._set_pll(pll_freq, PLLB)
             else: # if clk == CLK6:
                 if self._clk_freq[6] != 0:
-                    if self._pllb_freq % freq == 0:
-                        if (self._pllb_freq // freq) % 2 != 0:
+                    if pllb_freq % freq == 0:
+                        if (pllb_freq // freq) % 2 != 0:
                             # Not an even divide ratio, no bueno
                             return 1
                         else:
                             # Set the freq in memory
                             self._clk_freq[clk] = freq
                             (r_div, freq) = self._select_r_div_ms67(freq)
-                            (pll_freq, ms_reg) = self._multisynth67_calc(freq, self._pllb_freq)
+                            (pll_freq, ms_reg) = self._multisynth67_calc(freq, pllb_freq)
                     else:
                         # Not an integer divide ratio, no good
                         return 1
@@ -988,6 +1772,7 @@ class SI5351():
     
     def output_enable(self, clk: int, enable: bool):
         clk &= 0x07
+        self._tag("output_enable")
         reg_val = self._read_reg(_OUTPUT_ENABLE_CTRL)
         if enable is True:
             reg_val &= ~(1<<clk)
@@ -1003,6 +1788,7 @@ class SI5351():
    
     def drive_strength(self, clk: int, drive: int):
         clk &= 0x07
+        self._tag("drive_strength")
         reg_val = self._read_reg(_CLK0_CTRL + clk);
         reg_val &= ~0x03 # Mask
         if drive == DRIVE_4MA:
@@ -1012,7 +1798,356 @@ class SI5351():
         elif drive == DRIVE_8MA:
             reg_val |= 0x03
         self._write_reg(_CLK0_CTRL + clk, reg_val)
-        
+
+    # Start staging register changes.
+    #
+    # Until the matching commit(), register writes only update the shadow registers.
+    # Writes to registers the shadow doesn't hold are held too, and issued in order
+    # after the staged registers. Calls may be nested, only the outermost commit() writes
+    # to the device. Before the shadow is loaded there is nothing to stage against, and
+    # writes go straight to the device, but the nesting is still counted.
+    # The object may also be used as a context manager:
+    #
+    #   with si5351:
+    #       si5351.set_freq(CLK0, f0)
+    #       si5351.set_freq(CLK2, f2)
+
+    def begin(self):
+        self._batch_depth += 1
+
+    # Write all staged register changes to the device.
+    #
+    # Adjacent changed registers are merged into burst writes, and short gaps of unchanged
+    # registers are bridged when that is cheaper than starting a new transaction.
+    # Held writes to registers outside the shadow follow, in the order they were made.
+    # Any PLL reset requested while staging is issued last, and dropped if no registers changed.
+    # With an I2C profiler, each burst is accounted to the method which staged its first register.
+
+    def commit(self):
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        dirty = self._dirty
+        dirty_tags = self._dirty_tags
+        written = False
+        reg = 0
+        while reg < _SHADOW_SIZE:
+            if not dirty[reg]:
+                reg += 1
+                continue
+            start = reg
+            end = reg + 1
+            # Extend the run while the next dirty register is close enough
+            probe = end
+            while probe < _SHADOW_SIZE and probe - end <= _BATCH_GAP_MAX and probe != _PLL_RESET:
+                if dirty[probe]:
+                    end = probe + 1
+                probe += 1
+            tx_buf = self._tx_buf
+            for i in range(start, end):
+                dirty[i] = 0
+                tx_buf[i - start + 1] = self._shadow[i]
+            # Account the burst to the caller which staged its first register
+            if self._i2c_tag is not None:
+                self._i2c_tag(dirty_tags[start] or "commit")
+            self._send(start, end - start)
+            written = True
+            reg = end
+        for i in range(self._batch_uncached):
+            if self._i2c_tag is not None:
+                self._i2c_tag(self._batch_uncached_tags[i] or "commit")
+            self._tx_buf[1] = self._batch_uncached_data[i]
+            self._send(self._batch_uncached_regs[i], 1)
+        self._batch_uncached = 0
+        if self._batch_pll_reset:
+            pll_reset = self._batch_pll_reset
+            self._batch_pll_reset = 0
+            # A reset is only needed if the device configuration actually changed
+            if written:
+                self._tag("_pll_reset")
+                self._write_reg(_PLL_RESET, pll_reset)
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+
+    # Set the PLL which drives an output
+    #
+    # clk - Clock output
+    # pll - PLLA or PLLB
+    def set_pll_source(self, clk: int, pll: int):
+        clk &= 0x07
+        if self._pll_assignment[clk] != pll:
+            self._fine_div[clk] = 0
+        self._set_ms_source(clk, pll)
+
+    # Enable or disable fine tune mode for an output.
+    #
+    # In fine tune mode, set_freq keeps the output divider fixed and reaches the new
+    # frequency by changing only the PLL feedback numerator, with no PLL reset.
+    # This only applies while the output has its PLL to itself (see set_pll_source),
+    # otherwise set_freq uses the normal strategy.
+    #
+    # clk - Clock output (CLK0 through CLK5)
+    # enable - Set to True to enable fine tune mode
+    def fine_tune(self, clk: int, enable: bool):
+        clk &= 0x07
+        if clk > CLK5:
+            return
+        self._fine_mode[clk] = enable
+        # A known divider stays valid, set_freq forgets it whenever the multisynth is reprogrammed
+        if not enable:
+            self._fine_div[clk] = 0
+
+    # Set the divider fine tune mode picks for an output when it has to choose a new one,
+    # for as long as the divider keeps the VCO in range. Used with a precomputed band table
+    # (see load_pll_image), so that moving between table and computed frequencies
+    # doesn't change the divider, and reset the PLL, every time.
+    #
+    # clk - Clock output (CLK0 through CLK5)
+    # div - Even integer multisynth divider, or 0 for none
+    # r_div - The R divider setting to use it with
+    def prefer_fine_divider(self, clk: int, div: int, r_div: int):
+        clk &= 0x07
+        self._fine_pref_div[clk] = div
+        self._fine_pref_r_div[clk] = r_div
+
+    # Frequency planner
+    #
+    # Work out PLL frequencies and assignments for a set of output frequencies, so that
+    # only one output's registers change when tuning:
+    #
+    # The dynamic (most often changed) output gets PLLA to itself and is put in fine tune mode.
+    # The static outputs share PLLB, which is set to a VCO frequency that is an even integer
+    # multiple of all of them, so their multisynths run in integer mode and never need rewriting.
+    # If no such VCO frequency exists, the static outputs run fractional from PLLB.
+    #
+    # freqs - Dictionary of output frequencies in 100ths of Hz keyed by clock output (CLK0-CLK5)
+    # dynamic_clk - The output which changes most. If omitted, the output with the most
+    #               set_freq calls so far is used
+    #
+    # Returns a plan dictionary to pass to apply_plan(). Its "writes_saved" entry estimates the
+    # parameter bytes saved on each tuning step of the dynamic output: the bytes a step of
+    # _PLAN_STEP changes with the outputs as they are now, less those it changes with the plan
+    # applied, where the step only moves the PLLA feedback parameters. Diff commits send only
+    # the changed bytes, so this is the saving on the bus.
+
+    def plan(self, freqs: dict, dynamic_clk: int = -1) -> dict:
+        if dynamic_clk < 0:
+            for clk in freqs:
+                if dynamic_clk < 0 or self._set_counts[clk] > self._set_counts[dynamic_clk]:
+                    dynamic_clk = clk
+        statics = [clk for clk in freqs if clk != dynamic_clk]
+        # Frequencies seen by the static multisynths, after the R dividers
+        ms_freqs = list()
+        r_divs = list()
+        for clk in statics:
+            ms_freqs.append(self._select_r_div(freqs[clk]))
+            r_divs.append(self._r_div)
+        pllb_freq = 0
+        static_plan = list()
+        if len(statics):
+            # Try even integer dividers of the first static output, highest VCO first
+            div = ((_PLL_VCO_MAX * _FREQ_MULT) // ms_freqs[0]) & ~1
+            if div > _MULTISYNTH_A_MAX:
+                div = _MULTISYNTH_A_MAX & ~1
+            while div >= _MULTISYNTH_A_MIN and ms_freqs[0] * div >= _PLL_VCO_MIN * _FREQ_MULT:
+                vco = ms_freqs[0] * div
+                for ms_freq in ms_freqs:
+                    if vco % ms_freq or (vco // ms_freq) & 1 or vco // ms_freq < _MULTISYNTH_A_MIN \
+                        or vco // ms_freq > _MULTISYNTH_A_MAX:
+                        break
+                else:
+                    pllb_freq = vco
+                    break
+                div -= 2
+            for i in range(len(statics)):
+                static_plan.append((statics[i], (pllb_freq // ms_freqs[i]) if pllb_freq else 0, r_divs[i]))
+        writes_saved = 0
+        if dynamic_clk in freqs:
+            freq = freqs[dynamic_clk]
+            fine_now = self._fine_mode[dynamic_clk] and self._fine_div[dynamic_clk] and self._pll_exclusive(dynamic_clk)
+            writes_saved = self._step_bytes(dynamic_clk, freq, fine_now) - self._step_bytes(dynamic_clk, freq, True)
+        return {"dynamic": dynamic_clk, "freqs": freqs, "pllb_freq": pllb_freq, "static": static_plan,
+                "writes_saved": writes_saved}
+
+    # Return the number of parameter bytes a tuning step of _PLAN_STEP up from freq changes on an
+    # output. With fine set, for the output in fine tune mode with a PLL to itself, on the divider
+    # it would use. Otherwise for its multisynth, from the PLL it is on now.
+    def _step_bytes(self, clk: int, freq: int, fine: bool) -> int:
+        before = array.array('L', [0, 0, 0])
+        after = array.array('L', [0, 0, 0])
+        ms_freq = self._select_r_div(freq)
+        step = _PLAN_STEP << self._r_div
+        if fine:
+            div = self._fine_div[clk] if self._fine_div[clk] else self._fine_pref_div[clk]
+            vco = ms_freq * div
+            if vco < _PLL_VCO_MIN * _FREQ_MULT or vco > _PLL_VCO_MAX * _FREQ_MULT:
+                div = ((_FINE_VCO_CENTER * _FREQ_MULT // ms_freq) + 1) & ~1
+                if div < _MULTISYNTH_A_MIN:
+                    div = _MULTISYNTH_A_MIN
+                if div > _MULTISYNTH_A_MAX:
+                    div = _MULTISYNTH_A_MAX
+            # The planned output goes on PLLA
+            pll = self._pll_assignment[clk] if self._fine_div[clk] else PLLA
+            corr = self._ref_correction[self._plla_ref_osc if pll == PLLA else self._pllb_ref_osc]
+            self._pll_calc(pll, ms_freq * div, corr, 0, before)
+            self._pll_calc(pll, (ms_freq + step) * div, corr, 0, after)
+        else:
+            pll_freq = self._pll_freq(self._pll_assignment[clk])
+            self._multisynth_calc(ms_freq, pll_freq, before)
+            self._multisynth_calc(ms_freq + step, pll_freq, after)
+        old = bytearray(8)
+        new = bytearray(8)
+        _pack_params(before, old)
+        _pack_params(after, new)
+        count = 0
+        for i in range(8):
+            if old[i] != new[i]:
+                count += 1
+        return count
+
+    # Program the clock generator according to a plan from plan()
+    def apply_plan(self, plan: dict):
+        freqs = plan["freqs"]
+        dynamic_clk = plan["dynamic"]
+        self.begin()
+        staged = self._staged
+        # Take the static outputs off PLLA first, so the dynamic output ends up alone on it
+        for clk, div, r_div in plan["static"]:
+            self.fine_tune(clk, False)
+            self.set_pll_source(clk, PLLB)
+        if plan["pllb_freq"]:
+            self._set_pll(plan["pllb_freq"], PLLB)
+            ms_reg = self._ms_regs
+            for clk, div, r_div in plan["static"]:
+                self._clk_freq[clk] = freqs[clk]
+                if self._clk_first_set[clk] == False:
+                    self.output_enable(clk, True)
+                    self._clk_first_set[clk] = True
+                ms_reg[_P1] = 128 * div - 512
+                ms_reg[_P2] = 0
+                ms_reg[_P3] = 1
+                self._set_ms(clk, ms_reg, True, r_div, False)
+                if len(plan["static"]) == 1:
+                    # Alone on PLLB, so later set_freq calls at this frequency write nothing
+                    self._fine_mode[clk] = True
+                    self._fine_div[clk] = div
+                    self._fine_r_div[clk] = r_div
+            # Skip the reset, and the glitch on the static outputs, if nothing on PLLB changed
+            if not (self._batch_depth and self._shadow_valid) or self._staged != staged:
+                self._pll_reset(PLLB)
+        else:
+            for clk, div, r_div in plan["static"]:
+                self.set_freq(clk, freqs[clk])
+        if dynamic_clk in freqs:
+            self.set_pll_source(dynamic_clk, PLLA)
+            self.fine_tune(dynamic_clk, True)
+            self.set_freq(dynamic_clk, freqs[dynamic_clk])
+        self.commit()
+
+    # Set an output in fine tune mode from a precomputed PLL parameter block
+    # (see tools/gen_band_regs.py), skipping the PLL arithmetic.
+    #
+    # clk - Clock output
+    # freq - The output frequency the block produces, in 100ths of Hz
+    # div - The even integer multisynth divider the block was computed for
+    # r_div - The R divider setting the block was computed for
+    # image - The 8 byte PLL parameter block
+    #
+    # Returns False, without touching the device, if the output is not in fine tune mode
+    # with a PLL to itself. The caller should then use set_freq()
+
+    def load_pll_image(self, clk: int, freq: int, div: int, r_div: int, image) -> bool:
+        clk &= 0x07
+        if clk > CLK5 or not self._fine_mode[clk] or not self._pll_exclusive(clk):
+            return False
+        pll = self._pll_assignment[clk]
+        self._clk_freq[clk] = freq
+        self.prefer_fine_divider(clk, div, r_div)
+        if freq % _FREQ_MULT:
+            self._set_pll_image(pll, image, (freq << r_div) * div)
+        else:
+            # Keep the VCO frequency in whole Hz, where it is a small int
+            self._set_pll_image(pll, image, 0)
+            self._pll_hz[pll] = ((freq // _FREQ_MULT) << r_div) * div
+            self._pll_stale[pll] = True
+        if self._fine_div[clk] != div or self._fine_r_div[clk] != r_div:
+            # The multisynth is on another divider, reprogram it to match the block
+            if self._clk_first_set[clk] == False:
+                self.output_enable(clk, True)
+                self._clk_first_set[clk] = True
+            ms_reg = self._ms_regs
+            ms_reg[_P1] = 128 * div - 512
+            ms_reg[_P2] = 0
+            ms_reg[_P3] = 1
+            self._set_ms(clk, ms_reg, True, r_div, False)
+            self._pll_reset(pll)
+            self._fine_div[clk] = div
+            self._fine_r_div[clk] = r_div
+            self._fine_fallbacks += 1
+        else:
+            self._fine_updates += 1
+        return True
+
+    # Return the fine tune counters as (PLL only updates, full reprogramming)
+    def get_fine_stats(self):
+        return (self._fine_updates, self._fine_fallbacks)
+
+    # Enable or disable the fixed point maths outside fine tune mode, which always uses it
+    # for whole Hz frequencies. PLLs are set with it for whole Hz frequencies, multisynths
+    # for outputs on a PLL at a whole number of Hz. See the error bound above _fixed_div()
+    def set_fixed_point(self, enable: bool):
+        self._fixed_point = enable
+
+    # Return the number of bus (reads, writes) avoided by the shadow registers
+    def get_shadow_stats(self):
+        return (self._reads_avoided, self._writes_avoided)
+
+    # Zero the shadow register statistics
+    def clear_shadow_stats(self):
+        self._reads_avoided = 0
+        self._writes_avoided = 0
+
+    # Return the calculation cache counters as
+    # (multisynth hits, multisynth misses, PLL hits, PLL misses)
+    def get_calc_cache_stats(self):
+        return (self._ms_cache.hits, self._ms_cache.misses, self._pll_cache.hits, self._pll_cache.misses)
+
+    # Zero the calculation cache counters
+    def clear_calc_cache_stats(self):
+        self._ms_cache.hits = 0
+        self._ms_cache.misses = 0
+        self._pll_cache.hits = 0
+        self._pll_cache.misses = 0
+
+    # Enable or disable diff commit mode for the PLL and multisynth parameter blocks.
+    # When enabled (the default), only the bytes which changed since the last write are sent.
+    def set_diff_commit(self, enable: bool):
+        self._diff_commit = enable
+
+    # Return the number of parameter bytes not sent to the bus because of diff commits
+    #
+    # clk - Clock output
+    def get_bytes_saved(self, clk: int):
+        return self._bytes_saved[clk & 0x07]
+
+    # As above, but for the PLL parameter blocks
+    #
+    # pll - PLLA or PLLB
+    def get_pll_bytes_saved(self, pll: int):
+        return self._bytes_saved[_STAT_PLLB if pll == PLLB else _STAT_PLLA]
+
+    # Zero the diff commit statistics
+    def clear_bytes_saved(self):
+        for i in range(_STAT_SLOTS):
+            self._bytes_saved[i] = 0
+
  
     
     
@@ -0,0 +1,108 @@
+#
+# Event trace
+#
+# Trace records timestamped points in the life of an event into a fixed size ring,
+# so the time from an encoder detent to the clock generator write and the LCD update
+# can be measured on the radio. Each record holds ticks_us, the trace point, and two
+# small integers whose meaning depends on the point, see the table below.
+#
+# Tracing is off unless "trace" is set in the user config settings. When it is off
+# g.trace is None, and each trace point costs a single test.
+#
+# All storage is allocated up front, so tracing doesn't add garbage collections.
+# The encoder's hard interrupt handler stamps TP_DETENT, so each record is written
+# with interrupts disabled, and no record is lost when one lands mid stamp.
+# Call dump_csv() from the REPL to print the trace, or dump_binary() to save it for
+# tools/trace_report.py.
+#
+
+import machine
+import time
+import ustruct
+from array import array
+from micropython import const
+
+_DEFAULT_SIZE                   = const(256)
+
+# Trace points                                subtype             arg
+TP_DETENT                       = const(0)  # 0                   direction
+TP_CREATE                       = const(1)  # event subtype       event type
+TP_DISPATCH                     = const(2)  # event subtype       event type
+TP_HANDLER_ENTRY                = const(3)  # event subtype       subscriber index
+TP_HANDLER_EXIT                 = const(4)  # event subtype       subscriber index
+TP_CLOCK_COMMIT                 = const(5)  # 0                   tuned frequency
+TP_LCD_WRITE                    = const(6)  # display subtype     value written
+
+TP_NAMES = ("detent", "create", "dispatch", "entry", "exit", "clock", "lcd")
+
+_BINARY_MAGIC = b"TRC1"
+_BINARY_HEADER = "<4sI"
+_BINARY_RECORD = "<IBxHi"
+
+class Trace:
+    def __init__(self, size: int = _DEFAULT_SIZE):
+        self._size = size
+        self._ticks = array('L', [0] * size)
+        self._point = bytearray(size)
+        self._subtype = array('H', [0] * size)
+        self._arg = array('l', [0] * size)
+        self._pos = 0
+        self._count = 0
+        self._record = bytearray(ustruct.calcsize(_BINARY_RECORD))
+
+    # Add a record for a trace point. Safe to call from a hard interrupt handler
+    def stamp(self, point: int, subtype: int = 0, arg: int = 0):
+        irq_state = machine.disable_irq()
+        pos = self._pos
+        self._ticks[pos] = time.ticks_us()
+        self._point[pos] = point
+        self._subtype[pos] = subtype
+        self._arg[pos] = arg
+        pos += 1
+        self._pos = 0 if pos == self._size else pos
+        if self._count < self._size:
+            self._count += 1
+        machine.enable_irq(irq_state)
+
+    # Forget all records
+    def clear(self):
+        self._pos = 0
+        self._count = 0
+
+    # Return the number of records held
+    def get_count(self) -> int:
+        return self._count
+
+    # Return the ring position of the oldest record
+    def _first(self) -> int:
+        return (self._pos - self._count) % self._size
+
+    # Print the records oldest first, as CSV lines of us,point,subtype,arg.
+    # Passing a stream writes them there instead.
+    def dump_csv(self, stream = None):
+        pos = self._first()
+        line = "{},{},{},{}"
+        if stream is None:
+            print("us,point,subtype,arg")
+        else:
+            stream.write("us,point,subtype,arg\n")
+        for n in range(self._count):
+            text = line.format(self._ticks[pos], TP_NAMES[self._point[pos]], self._subtype[pos], self._arg[pos])
+            if stream is None:
+                print(text)
+            else:
+                stream.write(text)
+                stream.write("\n")
+            pos = (pos + 1) % self._size
+
+    # Write the records oldest first to a file, as a header followed by fixed size records
+    def dump_binary(self, path: str):
+        pos = self._first()
+        record = self._record
+        with open(path, "wb") as f:
+            f.write(ustruct.pack(_BINARY_HEADER, _BINARY_MAGIC, self._count))
+            for n in range(self._count):
+                ustruct.pack_into(_BINARY_RECORD, record, 0, self._ticks[pos], self._point[pos],
+                                  self._subtype[pos], self._arg[pos])
+                f.write(record)
+                pos = (pos + 1) % self._size
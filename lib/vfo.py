@@ -1,11 +1,115 @@
 from machine import Pin
 import micropython
-import event as ev
 import lib.globals as g
 import lib.constants as c
 import lib.gpiopins as pins
 import lib.gpio_lcd as lcd
 import lib.si5351 as clkgen
+import lib.trace as trace
+import ustruct
+
+
+# Precomputed band register table header, see tools/gen_band_regs.py
+BANDREGS_MAGIC = b"SBR2"
+BANDREGS_HEADER = "<4sIiIIIHHHHBB"
+_BANDREGS_RECORD_LENGTH = 8
+
+
+#
+# Loader for the precomputed band register tables generated by tools/gen_band_regs.py
+#
+# Each record is the PLL parameter block for the conversion oscillator at one
+# tuned frequency, so a lookup is a seek and a read into a preallocated buffer.
+#
+
+class _BandRegTable:
+    def __init__(self):
+        self._file = None
+        self._record = bytearray(_BANDREGS_RECORD_LENGTH)
+        self.div = [0, 0]
+        self.r_div = [0, 0]
+        
+    def open(self, path: str, cal_data: dict, limits: dict) -> bool:
+        # Open a table. Returns False if there is none, or it was generated for
+        # a different calibration or band
+        self.close()
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return False
+        header_len = ustruct.calcsize(BANDREGS_HEADER)
+        header = f.read(header_len)
+        if len(header) != header_len:
+            f.close()
+            return False
+        (magic, xtal_freq, correction, cf_freq, low, high, step, count,
+         div_lsb, div_usb, r_div_lsb, r_div_usb) = ustruct.unpack(BANDREGS_HEADER, header)
+        if (magic != BANDREGS_MAGIC or xtal_freq != cal_data["xtal_freq_hz"]
+            or correction != cal_data["si5351_correction_ppb"] or cf_freq != cal_data["cf_frequency_hz"]
+            or low != limits["low_limit"] or high != limits["high_limit"]):
+            f.close()
+            return False
+        self._file = f
+        self._header_len = header_len
+        self._low = low
+        self._step = step
+        self._count = count
+        self.div[c.TXM_LSB] = div_lsb
+        self.div[c.TXM_USB] = div_usb
+        self.r_div[c.TXM_LSB] = r_div_lsb
+        self.r_div[c.TXM_USB] = r_div_usb
+        return True
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            
+    def lookup(self, freq: int, mode: int):
+        # Return the PLL parameter block for a tuned frequency and mode, or None if it isn't in the table
+        if self._file is None or not self.div[mode]:
+            return None
+        offset = freq - self._low
+        if offset < 0 or offset % self._step:
+            return None
+        index = offset // self._step
+        if index >= self._count:
+            return None
+        self._file.seek(self._header_len + (mode * self._count + index) * _BANDREGS_RECORD_LENGTH)
+        if self._file.readinto(self._record) != _BANDREGS_RECORD_LENGTH:
+            return None
+        return self._record
+
+
+#
+# Latest wins queue of clock generator updates
+#
+# Posting a frequency for an output replaces any update still pending for that output,
+# so only the newest frequency is ever written.
+#
+
+class _ClockWriteQueue:
+    def __init__(self):
+        self._freqs = [0] * 8
+        self._pending = 0
+        self.posted = 0
+        self.merged = 0
+        
+    def post(self, clk: int, freq: int):
+        # Queue a frequency in Hz for an output
+        if self._pending & (1 << clk):
+            self.merged += 1
+        self._freqs[clk] = freq
+        self._pending |= (1 << clk)
+        self.posted += 1
+        
+    def pending(self) -> bool:
+        return self._pending != 0
+    
+    def take(self, clk: int) -> int:
+        # Return the newest frequency for an output and clear its pending flag
+        self._pending &= ~(1 << clk)
+        return self._freqs[clk]
 
 
 class Vfo:
@@ -28,27 +132,73 @@ class Vfo:
         #print("first osc freq: {}".format(first_osc))
         #print("second osc freq: {}".format(second_osc))
         
-        # SI5351 library needs frequencies specified in 100ths of hz.
-        g.si5351.set_freq(clkgen.CLK0, first_osc * 100)
-        g.si5351.set_freq(clkgen.CLK2, second_osc * 100)
+        # Queue the new oscillator frequencies. service() writes them to the clock generator
+        self.clk_q.post(clkgen.CLK0, first_osc)
+        self.clk_q.post(clkgen.CLK2, second_osc)
 
         # Update frequency on display
-        event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_FREQ, {"freq": freq})
-        g.event.publish(event_data)
+        self._publish_display(c.EST_DISPLAY_UPDATE_FREQ, freq)
         
         # Update TX state if it has changed
         if tx != self.txstate:
-            event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE, {"txstate": tx})
             self.txstate = tx
-            g.event.publish(event_data)
+            self._publish_display(c.EST_DISPLAY_UPDATE_TXSTATE, tx)
         
         # Update mode if it has changed
         if mode != self.mode:
-            event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_MODE, {"mode": mode})
             self.mode = mode
-            g.event.publish(event_data)
+            self._publish_display(c.EST_DISPLAY_UPDATE_MODE, mode)
+            
+    # Queue a display update for the main loop. Only the latest value
+    # of each field is written to the display.
+    def _publish_display(self, subtype: int, value: int):
+        g.event.post(c.ET_DISPLAY, subtype, value, coalesce=True)
+            
+    # Write the queued oscillator frequencies to the clock generator
+    def _write_clocks(self):
+        first_osc = self.clk_q.take(clkgen.CLK0)
+        second_osc = self.clk_q.take(clkgen.CLK2)
+        tx = self.txstate
+        mode = self.mode
+        
+        # The conversion oscillator is the one which moves when tuning
+        dynamic_clk = clkgen.CLK2 if tx == c.TXS_TX or tx == c.TXS_TUNE else clkgen.CLK0
+        fconv = second_osc if dynamic_clk == clkgen.CLK2 else first_osc
+        
+        # Whenever the conversion oscillator needs a new divider, use the one the band table was
+        # computed for, so the next table lookup doesn't reprogram the multisynth and reset the PLL
+        g.si5351.prefer_fine_divider(dynamic_clk, self.band_regs.div[mode], self.band_regs.r_div[mode])
+        
+        # SI5351 library needs frequencies specified in 100ths of hz.
+        if dynamic_clk != self.dynamic_clk:
+            # The conversion oscillator moved to the other output. Re-plan the clock generator so it
+            # has a PLL to itself, and the carrier/BFO oscillator sits on an integer divider.
+            plan = g.si5351.plan({clkgen.CLK0: first_osc * 100, clkgen.CLK2: second_osc * 100}, dynamic_clk)
+            g.si5351.apply_plan(plan)
+            self.dynamic_clk = dynamic_clk
+        else:
+            # Stage both outputs so they are written to the clock generator together
+            g.si5351.begin()
+            # Use the precomputed registers for the conversion oscillator if there are any.
+            # The other oscillator has not moved.
+            record = self.band_regs.lookup(self.tuned_freq, mode)
+            if record is None or not g.si5351.load_pll_image(dynamic_clk, fconv * 100, self.band_regs.div[mode],
+                                                             self.band_regs.r_div[mode], record):
+                g.si5351.set_freq(clkgen.CLK0, first_osc * 100)
+                g.si5351.set_freq(clkgen.CLK2, second_osc * 100)
+            g.si5351.commit()
+        if g.trace is not None:
+            g.trace.stamp(trace.TP_CLOCK_COMMIT, 0, self.tuned_freq)
+            
+    # Drain the clock write queue.
+    # Called by the main loop once the pending input events have been handled,
+    # so a burst of detents results in a single write of the final frequency.
+    def service(self):
+        if self.clk_q.pending():
+            self._write_clocks()
             
     def _set_agc_disable(self, disable = False):
+        self.agc_disable = disable
         pins.ctrl_agc_disable(disable)
 
 
@@ -60,13 +210,31 @@ class Vfo:
         self.mode = -1
         self.agc_disable = False
         self.txstate = -1
+        self.dynamic_clk = -1
+        self.clk_q = _ClockWriteQueue()
         self.tuning_increment_index = 2 # Start at 1 KHz
         
+        # Precomputed clock generator registers for the band, if available
+        self.band_regs = _BandRegTable()
+        self.band_regs.open(g.band_regs_path.format(self.band), g.cal_data, self.band_table[self.band])
+        
         # Set up SI5351
-        g.si5351.init(clkgen.CRYSTAL_LOAD_0PF, g.cal_data["xtal_freq_hz"], g.cal_data["si5351_correction_ppb"])
+        g.si5351.init(clkgen.CRYSTAL_LOAD_0PF, g.cal_data["xtal_freq_hz"], g.cal_data["si5351_correction_ppb"],
+                      g.si5351_image_path)
         
-        # Tell the event handler we want to listen for switch and encoder events
-        g.event.add_subscriber(self.action, c.ET_ENCODER | c.ET_SWITCHES | c.ET_VFO)
+        # Tell the event handler which switch, encoder and VFO events we want
+        g.event.add_handlers(c.ET_SWITCHES, {c.EST_PTT_PRESSED: self._on_ptt_pressed,
+                                             c.EST_TUNE_PRESSED: self._on_tune_pressed,
+                                             c.EST_PTT_RELEASED: self._on_key_released,
+                                             c.EST_TUNE_RELEASED: self._on_key_released,
+                                             c.EST_KNOB_RELEASED: self._on_knob_released})
+        g.event.add_handlers(c.ET_ENCODER, {c.EST_KNOB_CW: self._on_knob_cw,
+                                            c.EST_KNOB_CCW: self._on_knob_ccw})
+        g.event.add_handlers(c.ET_VFO, {c.EST_TX_TIMED_OUT_ENTRY: self._on_tx_timed_out,
+                                        c.EST_VFO_AGC_DISABLE: self._on_agc_disable,
+                                        c.EST_VFO_AGC_ENABLE: self._on_agc_enable,
+                                        c.EST_VFO_MODE_LSB: self._on_mode_lsb,
+                                        c.EST_VFO_MODE_USB: self._on_mode_usb})
         
         # Clock generator drive strength
         g.si5351.drive_strength(clkgen.CLK0, clkgen.DRIVE_8MA)
@@ -74,8 +242,10 @@ class Vfo:
         g.si5351.drive_strength(clkgen.CLK2, clkgen.DRIVE_8MA)
         
         # Clock generator output enable
-        g.si5351.set_freq(clkgen.CLK0, 10000000)
-        g.si5351.set_freq(clkgen.CLK2, 10000000)
+        # After a warm start or a saved image the outputs are already configured, leave them where they are
+        if not g.si5351.warm_started() and not g.si5351.image_loaded():
+            g.si5351.set_freq(clkgen.CLK0, 10000000)
+            g.si5351.set_freq(clkgen.CLK2, 10000000)
         g.si5351.output_enable(clkgen.CLK0, True)
         g.si5351.output_enable(clkgen.CLK1, False)
         g.si5351.output_enable(clkgen.CLK2, True)
@@ -83,83 +253,91 @@ class Vfo:
         
         # Set up the clock generator output frequencies and enable the outputs
         self._set_freq(self.tuned_freq, c.TXS_RX, mode)
+        self.service()
         
         # Set the default tuning increment
-        event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TUNING_INCR, {"incr":g.tuning_increment_table[self.tuning_increment_index]})
-        g.event.publish(event_data)
+        self._publish_display(c.EST_DISPLAY_UPDATE_TUNING_INCR, g.tuning_increment_table[self.tuning_increment_index])
         
         # Set the default agc state
-        event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_AGC, {"agc": not self.agc_disable})
-        g.event.publish(event_data)
-        
-        
-    # This is called when the encoder knob is turned, or any switch is pressed or released   
-    def action(self, event_data: object):
-        #print("Event Type: {} Subtype: {}".format(event_obj.type, event_obj.subtype))
-        # Test for time out condition
-        new_event_data = None
-        if event_data.subtype == c.EST_TX_TIMED_OUT_ENTRY:
-            if self.txstate != c.TXS_RX: # If not in RX
-                self.txstate = c.TXS_TIMEOUT # Put in time out state
-                self._set_freq(self.tuned_freq, self.txstate, self.mode)
-                new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE, {"txstate": self.txstate})
-        # Test for ptt pressed
-        elif event_data.subtype == c.EST_PTT_PRESSED:
-            self.txstate = c.TXS_TX # Put in tx state
-            self._set_freq(self.tuned_freq, self.txstate, self.mode)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE, {"txstate": self.txstate})
-        # Test for tune pressed
-        elif event_data.subtype == c.EST_TUNE_PRESSED:
-            self.txstate = c.TXS_TUNE # Put in tune state
-            self._set_freq(self.tuned_freq, self.txstate, self.mode)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE, {"txstate": self.txstate})
-        # Test for tune or ptt released
-        elif event_data.subtype == c.EST_PTT_RELEASED or event_data.subtype == c.EST_TUNE_RELEASED:
-            self.txstate = c.TXS_RX # Put in rx state
-            self._set_freq(self.tuned_freq, self.txstate, self.mode)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE, {"txstate": self.txstate})
-        # Test for knob advance CW
-        elif event_data.subtype == c.EST_KNOB_CW:
-            new_tuned_freq = self.tuned_freq + g.tuning_increment_table[self.tuning_increment_index]
-            if new_tuned_freq < self.band_table[self.band]["high_limit"]:
-                self.tuned_freq = new_tuned_freq
-                self._set_freq(self.tuned_freq, self.txstate, self.mode)
-        # Test for knob advance CCW        
-        elif event_data.subtype == c.EST_KNOB_CCW:
-            new_tuned_freq = self.tuned_freq - g.tuning_increment_table[self.tuning_increment_index]
-            if new_tuned_freq > self.band_table[self.band]["low_limit"]:
-                self.tuned_freq = new_tuned_freq
-                self._set_freq(self.tuned_freq, self.txstate, self.mode)
-        # Test for knob short press
-        elif event_data.subtype == c.EST_KNOB_RELEASED:
-            self.tuning_increment_index += 1
-            if self.tuning_increment_index >= len(g.tuning_increment_table):
-                self.tuning_increment_index = 0
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TUNING_INCR, {"incr":g.tuning_increment_table[self.tuning_increment_index]})
-        # Test for AGC disable message
-        elif event_data.subtype == c.EST_VFO_AGC_DISABLE:
-            self._set_agc_disable(True)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_AGC,{"agc": 0})
-                                          
-        # Test for AGC enable message
-        elif event_data.subtype == c.EST_VFO_AGC_ENABLE:
-            self._set_agc_disable(False)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_AGC,{"agc": 1})
+        self._publish_display(c.EST_DISPLAY_UPDATE_AGC, 0 if self.agc_disable else 1)
+        
+        
+    # Event handlers. These are called when the encoder knob is turned, a switch is pressed
+    # or released, or the menu system changes a setting. Each handles one event subtype.
+    
+    # Set the transmit state, and show it
+    def _set_txstate(self, txstate: int):
+        self.txstate = txstate
+        self._set_freq(self.tuned_freq, self.txstate, self.mode)
+        self._publish_display(c.EST_DISPLAY_UPDATE_TXSTATE, self.txstate)
+        
+    # Set the mode, and show it
+    def _set_mode(self, mode: int):
+        self.mode = mode
+        self._set_freq(self.tuned_freq, self.txstate, self.mode)
+        self._publish_display(c.EST_DISPLAY_UPDATE_MODE, self.mode)
+        
+    # Time out condition
+    def _on_tx_timed_out(self, event_data: object):
+        if self.txstate != c.TXS_RX: # If not in RX
+            self._set_txstate(c.TXS_TIMEOUT) # Put in time out state
             
-        # Test for mode LSB message
-        elif event_data.subtype == c.EST_VFO_MODE_LSB:
-            self.mode = c.TXM_LSB
-            self._set_freq(self.tuned_freq, self.txstate, self.mode)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_MODE,{"mode": 0})
-                                          
-        # Test for mode USB message
-        elif event_data.subtype == c.EST_VFO_MODE_USB:
-            self.mode = c.TXM_USB
+    # PTT pressed
+    def _on_ptt_pressed(self, event_data: object):
+        self._set_txstate(c.TXS_TX) # Put in tx state
+        
+    # Tune pressed
+    def _on_tune_pressed(self, event_data: object):
+        self._set_txstate(c.TXS_TUNE) # Put in tune state
+        
+    # Tune or ptt released
+    def _on_key_released(self, event_data: object):
+        self._set_txstate(c.TXS_RX) # Put in rx state
+        
+    # Move the tuned frequency by a signed number of tuning increments, clamped to the band limits
+    def _tune_steps(self, steps: int):
+        new_tuned_freq = self.tuned_freq + steps * g.tuning_increment_table[self.tuning_increment_index]
+        band = self.band_table[self.band]
+        if new_tuned_freq > band["high_limit"]:
+            new_tuned_freq = band["high_limit"]
+        elif new_tuned_freq < band["low_limit"]:
+            new_tuned_freq = band["low_limit"]
+        if new_tuned_freq != self.tuned_freq:
+            self.tuned_freq = new_tuned_freq
             self._set_freq(self.tuned_freq, self.txstate, self.mode)
-            new_event_data = ev.EventData(c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_MODE,{"mode": 1})
             
-        if new_event_data:
-            g.event.publish(new_event_data)  
+    # Knob advance CW, by the number of steps in arg0
+    def _on_knob_cw(self, event_data: object):
+        self._tune_steps(event_data.arg0)
+            
+    # Knob advance CCW, by the number of steps in arg0
+    def _on_knob_ccw(self, event_data: object):
+        self._tune_steps(-event_data.arg0)
+            
+    # Knob short press
+    def _on_knob_released(self, event_data: object):
+        self.tuning_increment_index += 1
+        if self.tuning_increment_index >= len(g.tuning_increment_table):
+            self.tuning_increment_index = 0
+        self._publish_display(c.EST_DISPLAY_UPDATE_TUNING_INCR, g.tuning_increment_table[self.tuning_increment_index])
+        
+    # AGC disable message
+    def _on_agc_disable(self, event_data: object):
+        self._set_agc_disable(True)
+        self._publish_display(c.EST_DISPLAY_UPDATE_AGC, 0)
+        
+    # AGC enable message
+    def _on_agc_enable(self, event_data: object):
+        self._set_agc_disable(False)
+        self._publish_display(c.EST_DISPLAY_UPDATE_AGC, 1)
+        
+    # Mode LSB message
+    def _on_mode_lsb(self, event_data: object):
+        self._set_mode(c.TXM_LSB)
+        
+    # Mode USB message
+    def _on_mode_usb(self, event_data: object):
+        self._set_mode(c.TXM_USB)
         
         
 
@@ -0,0 +1,181 @@
+#
+# Micro-benchmark of event dispatch, if/elif chains against subtype handler tables
+#
+# Builds the same three subscribers as Vfo, Menu and Display twice. Once as a single
+# action() per subscriber testing event_data.subtype in an if/elif chain, in the order
+# the firmware used to, and once registered per subtype with Event.add_handlers().
+# The handlers only count calls, so the figures are the cost of dispatch alone.
+# Publishes the same mix of events to each and reports events per second.
+#
+# Runs under CPython from the repository root, or on the radio with lib/ on the path:
+#
+#   python3 tools/bench_events.py [--events N]
+#
+
+import sys
+
+_MICROPYTHON = sys.implementation.name == "micropython"
+
+if _MICROPYTHON:
+    import time
+    import event as ev
+    import lib.constants as c
+
+    def _now_us():
+        return time.ticks_us()
+
+    def _elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+else:
+    import os
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import si5351_sim as sim
+    sim.install_host_shims()
+    # lib/constants.py relies on const being a builtin, as it is on the board
+    import builtins
+    builtins.const = sys.modules["micropython"].const
+    import lib.event as ev
+    import lib.constants as c
+
+    def _now_us():
+        return time.perf_counter()
+
+    def _elapsed_us(start):
+        return (time.perf_counter() - start) * 1000000
+
+
+class _Chains:
+    # One action per subscriber, as Vfo, Menu and Display had
+    def __init__(self, event):
+        self.calls = 0
+        event.add_subscriber(self.vfo_action, c.ET_ENCODER | c.ET_SWITCHES | c.ET_VFO)
+        event.add_subscriber(self.display_action, c.ET_DISPLAY)
+        event.add_subscriber(self.menu_action, c.ET_ENCODER | c.ET_SWITCHES)
+
+    def vfo_action(self, event_data):
+        if event_data.subtype == c.EST_TX_TIMED_OUT_ENTRY:
+            self.calls += 1
+        elif event_data.subtype == c.EST_PTT_PRESSED:
+            self.calls += 1
+        elif event_data.subtype == c.EST_TUNE_PRESSED:
+            self.calls += 1
+        elif event_data.subtype == c.EST_PTT_RELEASED or event_data.subtype == c.EST_TUNE_RELEASED:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_CW:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_CCW:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_RELEASED:
+            self.calls += 1
+        elif event_data.subtype == c.EST_VFO_AGC_DISABLE:
+            self.calls += 1
+        elif event_data.subtype == c.EST_VFO_AGC_ENABLE:
+            self.calls += 1
+        elif event_data.subtype == c.EST_VFO_MODE_LSB:
+            self.calls += 1
+        elif event_data.subtype == c.EST_VFO_MODE_USB:
+            self.calls += 1
+
+    def menu_action(self, event_data):
+        if event_data.subtype == c.EST_KNOB_RELEASED_LONG:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_RELEASED:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_MENU_CW:
+            self.calls += 1
+        elif event_data.subtype == c.EST_KNOB_MENU_CCW:
+            self.calls += 1
+
+    def display_action(self, event_data):
+        if event_data.subtype == c.EST_DISPLAY_UPDATE_FREQ:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_UPDATE_MODE:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_UPDATE_TXSTATE:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_UPDATE_TUNING_INCR:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_UPDATE_AGC:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_MENU_ENTRY:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_MENU_EXIT:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_MENU_UPDATE:
+            self.calls += 1
+        elif event_data.subtype == c.EST_DISPLAY_FATAL_ERROR:
+            self.calls += 1
+
+
+class _Tables:
+    # The same subscribers, registered per subtype
+    def __init__(self, event):
+        self.calls = 0
+        event.add_handlers(c.ET_SWITCHES, {c.EST_PTT_PRESSED: self.handler, c.EST_TUNE_PRESSED: self.handler,
+                                           c.EST_PTT_RELEASED: self.handler, c.EST_TUNE_RELEASED: self.handler,
+                                           c.EST_KNOB_RELEASED: self.handler})
+        event.add_handlers(c.ET_ENCODER, {c.EST_KNOB_CW: self.handler, c.EST_KNOB_CCW: self.handler})
+        event.add_handlers(c.ET_VFO, {c.EST_TX_TIMED_OUT_ENTRY: self.handler, c.EST_VFO_AGC_DISABLE: self.handler,
+                                      c.EST_VFO_AGC_ENABLE: self.handler, c.EST_VFO_MODE_LSB: self.handler,
+                                      c.EST_VFO_MODE_USB: self.handler})
+        event.add_handlers(c.ET_DISPLAY, {c.EST_DISPLAY_UPDATE_FREQ: self.handler,
+                                          c.EST_DISPLAY_UPDATE_MODE: self.handler,
+                                          c.EST_DISPLAY_UPDATE_TXSTATE: self.handler,
+                                          c.EST_DISPLAY_UPDATE_TUNING_INCR: self.handler,
+                                          c.EST_DISPLAY_UPDATE_AGC: self.handler,
+                                          c.EST_DISPLAY_MENU_ENTRY: self.handler,
+                                          c.EST_DISPLAY_MENU_EXIT: self.handler,
+                                          c.EST_DISPLAY_MENU_UPDATE: self.handler,
+                                          c.EST_DISPLAY_FATAL_ERROR: self.handler})
+        event.add_handlers(c.ET_SWITCHES, {c.EST_KNOB_RELEASED_LONG: self.handler,
+                                           c.EST_KNOB_RELEASED: self.handler})
+        event.add_handlers(c.ET_ENCODER, {c.EST_KNOB_MENU_CW: self.handler, c.EST_KNOB_MENU_CCW: self.handler})
+
+    def handler(self, event_data):
+        self.calls += 1
+
+
+# Mostly tuning, with the display updates it causes, and the odd switch and menu event
+_MIX = ((c.ET_ENCODER, c.EST_KNOB_CW), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_FREQ),
+        (c.ET_ENCODER, c.EST_KNOB_CCW), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_FREQ),
+        (c.ET_ENCODER, c.EST_KNOB_CW), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_FREQ),
+        (c.ET_SWITCHES, c.EST_PTT_PRESSED), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE),
+        (c.ET_SWITCHES, c.EST_PTT_RELEASED), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TXSTATE),
+        (c.ET_ENCODER, c.EST_KNOB_MENU_CW), (c.ET_DISPLAY, c.EST_DISPLAY_MENU_UPDATE),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_TUNING_INCR),
+        (c.ET_VFO, c.EST_VFO_MODE_USB), (c.ET_DISPLAY, c.EST_DISPLAY_UPDATE_MODE))
+
+
+def _run(name, subscribers, events):
+    event = ev.Event()
+    counter = subscribers(event)
+    objects = [event.acquire(event_type, subtype) for event_type, subtype in _MIX]
+    # Index everything before timing
+    for event_obj in objects:
+        event.publish(event_obj)
+    counter.calls = 0
+    rounds = events // len(objects)
+    start = _now_us()
+    for n in range(rounds):
+        for event_obj in objects:
+            event.publish(event_obj)
+    elapsed = _elapsed_us(start)
+    published = rounds * len(objects)
+    print("{:<8} {:>8} events {:>8} subscriber calls {:>10.0f} events/s".format(
+        name, published, counter.calls, published * 1000000 / elapsed))
+
+
+def main():
+    events = 16000 if _MICROPYTHON else 320000
+    if "--events" in sys.argv:
+        events = int(sys.argv[sys.argv.index("--events") + 1])
+    _run("chains", _Chains, events)
+    _run("tables", _Tables, events)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#
+# Host side benchmark for the SI5351 driver
+#
+# Drives lib/si5351.py against the register level simulator in tools/si5351_sim.py,
+# the same way Vfo does, and reports bus usage per tuning step for several driver
+# configurations. Every step is checked against the exact decoded output frequencies.
+#
+# Usage, from the repository root:
+#
+#   python3 tools/bench_si5351.py [--steps N] [--step-hz HZ] [--bus-freq HZ]
+#
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import si5351_sim as sim
+
+sim.install_host_shims()
+
+import lib.si5351 as clkgen
+
+CF_FREQ = 12288000
+START_FREQ = 7000000
+
+
+def _new_driver(bus_freq, calc_cache_size=16, pll_cache_size=4):
+    i2c = sim.SimI2C(bus_freq=bus_freq)
+    si5351 = clkgen.SI5351(i2c, calc_cache_size=calc_cache_size, pll_cache_size=pll_cache_size)
+    si5351.init(clkgen.CRYSTAL_LOAD_0PF, 25000000, 0)
+    return (i2c, si5351)
+
+
+def _check(i2c, expected):
+    # Return the largest deviation in Hz between the decoded and the requested frequencies
+    worst = 0
+    for clk, freq in expected.items():
+        actual = i2c.output_freq(clk)
+        if actual is None:
+            raise AssertionError("CLK{} is off".format(clk))
+        worst = max(worst, abs(float(actual - freq)))
+    return worst
+
+
+def _sweep(name, i2c, si5351, steps, step_hz, batch, planned):
+    # LSB receive: CLK0 is the conversion oscillator, CLK2 the BFO
+    if planned:
+        si5351.apply_plan(si5351.plan({clkgen.CLK0: (CF_FREQ - START_FREQ) * 100,
+                                       clkgen.CLK2: CF_FREQ * 100}, clkgen.CLK0))
+    else:
+        si5351.set_freq(clkgen.CLK0, (CF_FREQ - START_FREQ) * 100)
+        si5351.set_freq(clkgen.CLK2, CF_FREQ * 100)
+    # Vfo enables the outputs explicitly
+    si5351.output_enable(clkgen.CLK0, True)
+    si5351.output_enable(clkgen.CLK2, True)
+    i2c.clear_stats()
+    worst = 0
+    for step in range(steps):
+        fconv = CF_FREQ - (START_FREQ + step * step_hz)
+        if batch:
+            si5351.begin()
+        si5351.set_freq(clkgen.CLK0, fconv * 100)
+        si5351.set_freq(clkgen.CLK2, CF_FREQ * 100)
+        if batch:
+            si5351.commit()
+        worst = max(worst, _check(i2c, {clkgen.CLK0: fconv, clkgen.CLK2: CF_FREQ}))
+    stats = i2c.stats()
+    print("{:<10s} {:>8.2f} {:>8.2f} {:>8.2f} {:>10.1f} {:>10.3f}".format(
+        name, stats["transactions"] / steps, stats["reads"] / steps,
+        stats["bytes_written"] / steps, stats["bus_time_us"] / steps, worst))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SI5351 driver bus usage benchmark")
+    parser.add_argument("--steps", type=int, default=3000, help="number of tuning steps")
+    parser.add_argument("--step-hz", type=int, default=100, help="tuning step in Hz")
+    parser.add_argument("--bus-freq", type=int, default=100000, help="I2C clock rate in Hz")
+    args = parser.parse_args()
+
+    print("{} steps of {} Hz at {} Hz bus clock, per step figures".format(args.steps, args.step_hz, args.bus_freq))
+    print("{:<10s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s}".format(
+        "mode", "xfers", "reads", "bytes", "bus us", "max err Hz"))
+
+    # Full block writes, no calculation cache, one output at a time
+    i2c, si5351 = _new_driver(args.bus_freq, calc_cache_size=0, pll_cache_size=0)
+    si5351.set_diff_commit(False)
+    _sweep("full", i2c, si5351, args.steps, args.step_hz, False, False)
+
+    # Diff commits, batched
+    i2c, si5351 = _new_driver(args.bus_freq)
+    _sweep("diff", i2c, si5351, args.steps, args.step_hz, True, False)
+
+    # Frequency plan with the conversion oscillator in fine tune mode, as Vfo does
+    i2c, si5351 = _new_driver(args.bus_freq)
+    _sweep("planned", i2c, si5351, args.steps, args.step_hz, True, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#
+# Check that publishing events doesn't allocate event objects
+#
+# Under MicroPython, copy lib/event.py to the board and run this file. It publishes
+# events through the pool and reports the change in gc.mem_alloc(), which should be 0.
+#
+# Under CPython, from the repository root:
+#
+#   python3 tools/check_event_alloc.py [--rounds N]
+#
+# drives Vfo, Menu and Display with the encoder, switch and menu events the main loop
+# publishes, and counts the EventData objects constructed after start up. Then spins
+# the knob several detents per main loop pass, and counts the display writes, which
+# should be one per pass. Exits non zero if any event objects were constructed, the
+# pool was exhausted, or the display updates weren't coalesced.
+#
+
+import sys
+
+_MICROPYTHON = sys.implementation.name == "micropython"
+
+
+def check_micropython(rounds):
+    import gc
+    import event as ev
+
+    count = [0]
+
+    def subscriber(event_data):
+        count[0] += event_data.arg0
+
+    event = ev.Event()
+    event.add_subscriber(subscriber, 0x3)
+    # Warm up, so the index entries exist before measuring
+    for event_type in (0x1, 0x2):
+        event_data = event.acquire(event_type, 1, 1)
+        event.publish(event_data)
+        event.release(event_data)
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    for i in range(rounds):
+        event_data = event.acquire(0x1, 1, 1, 0)
+        event.publish(event_data)
+        event.release(event_data)
+        event_data = event.acquire(0x2, 2, 1, 0)
+        event.publish(event_data)
+        event.release(event_data)
+    after = gc.mem_alloc()
+    gc.enable()
+    print("{} events, {} bytes allocated, {} pool misses".format(count[0], after - before, event.pool_misses))
+    return 0 if after == before and not event.pool_misses else 1
+
+
+class FakeLcd:
+    def __init__(self):
+        self.writes = 0
+
+    def move_to(self, x, y):
+        pass
+
+    def putstr(self, text):
+        self.writes += 1
+
+    def clear(self):
+        pass
+
+
+def install_shims():
+    import os
+    import types
+
+    tools = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, tools)
+    sys.path.insert(0, os.path.dirname(tools))
+    import si5351_sim as sim
+    sim.install_host_shims()
+    # Pin objects are only called to read inputs or set outputs
+    sys.modules["machine"].Pin = lambda *args, **kwargs: (lambda *value: 0)
+    sys.modules["machine"].Timer = object
+    sys.modules.setdefault("lib.gpio_lcd", types.ModuleType("lib.gpio_lcd"))
+    import builtins
+    builtins.const = sys.modules["micropython"].const
+    # On the board lib/ is on the path, and some modules import the event package directly
+    import lib.event
+    sys.modules["event"] = lib.event
+    import lib.gpiopins as pins
+    for name in ("ctrl_agc_disable", "ctrl_button_ptt", "ctrl_button_tune", "ctrl_button_knob",
+                 "ctrl_mute_out", "ctrl_ptt_out", "ctrl_tune_out"):
+        setattr(pins, name, sys.modules["machine"].Pin())
+    return sim
+
+
+def start_firmware():
+    # Bring up the event system, clock generator, display, VFO and menu as xmain.init() does.
+    # Returns the simulated I2C bus.
+    sim = install_shims()
+    import lib.constants as c
+    import lib.display as display
+    import lib.event as ev
+    import lib.globals as g
+    import lib.menu as menu
+    import lib.si5351 as clkgen
+    import lib.vfo as vfo
+
+    g.event = ev.Event()
+    g.cal_data = dict(g.cal_defaults)
+    g.band_table = g.band_table_default
+    g.lcd = FakeLcd()
+    i2c = sim.SimI2C()
+    g.si5351 = clkgen.SI5351(i2c)
+    g.display = display.Display()
+    g.display.init()
+    g.vfo = vfo.Vfo()
+    g.vfo.init(g.band_table, 7200000, c.TXM_LSB)
+    g.menu = menu.Menu()
+    g.menu.init()
+    g.event.drain()
+    return i2c
+
+
+def check_cpython(rounds):
+    start_firmware()
+    import lib.constants as c
+    import lib.event as ev
+    import lib.globals as g
+
+    # Count constructions from here on, the pool is already filled
+    constructed = [0]
+    init = ev.EventData.__init__
+
+    def counting_init(self, *args):
+        constructed[0] += 1
+        init(self, *args)
+
+    ev.EventData.__init__ = counting_init
+
+    def publish(event_type, subtype):
+        # As the main loop does, knob events are for a single detent
+        event_data = g.event.acquire(event_type, subtype, 1)
+        g.event.publish(event_data)
+        g.event.release(event_data)
+        g.vfo.service()
+        g.event.drain()
+
+    sequence = (
+        # Into the menu, change the mode and the AGC, and back out. Menu only
+        # knows its position once it has been entered.
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED_LONG),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_ENCODER, c.EST_KNOB_MENU_CW),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_ENCODER, c.EST_KNOB_MENU_CW),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_ENCODER, c.EST_KNOB_MENU_CCW),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED_LONG),
+        # Tuning, increment and transmit state
+        (c.ET_ENCODER, c.EST_KNOB_CW),
+        (c.ET_ENCODER, c.EST_KNOB_CCW),
+        (c.ET_SWITCHES, c.EST_KNOB_PRESSED),
+        (c.ET_SWITCHES, c.EST_KNOB_RELEASED),
+        (c.ET_SWITCHES, c.EST_PTT_PRESSED),
+        (c.ET_VFO, c.EST_TX_TIMED_OUT_ENTRY),
+        (c.ET_SWITCHES, c.EST_PTT_RELEASED),
+        (c.ET_VFO, c.EST_TX_TIMED_OUT_EXIT),
+        (c.ET_SWITCHES, c.EST_TUNE_PRESSED),
+        (c.ET_SWITCHES, c.EST_TUNE_RELEASED),
+    )
+    published = 0
+    for i in range(rounds):
+        for event_type, subtype in sequence:
+            publish(event_type, subtype)
+            published += 1
+
+    # A fast spin, several detents between main loop passes. The display is written once per pass.
+    g.lcd.writes = 0
+    for i in range(rounds):
+        for detent in range(8):
+            event_data = g.event.acquire(c.ET_ENCODER, c.EST_KNOB_CW if i & 1 else c.EST_KNOB_CCW, 1)
+            g.event.publish(event_data)
+            g.event.release(event_data)
+        g.vfo.service()
+        g.event.drain()
+    print("{} detents in {} passes, {} display writes".format(rounds * 8, rounds, g.lcd.writes))
+    ok = g.lcd.writes == rounds
+
+    free = g.event._pool_free
+    print("{} events published, {} EventData constructed, {} pool misses, {} of {} pooled objects free".format(
+        published, constructed[0], g.event.pool_misses, free, len(g.event._pool)))
+    ok = ok and not constructed[0] and not g.event.pool_misses and free == len(g.event._pool)
+    print("ok" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+def main():
+    rounds = 100
+    if "--rounds" in sys.argv:
+        rounds = int(sys.argv[sys.argv.index("--rounds") + 1])
+    if _MICROPYTHON:
+        return check_micropython(rounds)
+    return check_cpython(rounds)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
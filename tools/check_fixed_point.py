@@ -0,0 +1,116 @@
+#
+# Host side comparison of the SI5351 fixed point maths against the bigint maths
+#
+# For every step across the range, works out the registers both ways and the exact
+# output frequency they produce, for the two ways the firmware programs an output:
+#
+#   pll - fine tune mode: an even integer multisynth divider centering the VCO,
+#         with the frequency set by the PLL feedback ratio (_pll_calc / _pll_calc_fixed)
+#   ms  - normal mode: PLL at 800 MHz, with the frequency set by the fractional
+#         multisynth ratio (_multisynth_calc / _multisynth_calc_fixed)
+#
+# Prints the worst error of each path against the requested frequency, the worst
+# difference between them, and the documented bound. Exits non zero if the fixed
+# point path exceeds its bound.
+#
+# Usage, from the repository root:
+#
+#   python3 tools/check_fixed_point.py [--start HZ] [--stop HZ] [--step HZ] [--correction PPB]
+#
+
+import argparse
+import os
+import sys
+from fractions import Fraction
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import si5351_sim as sim
+
+sim.install_host_shims()
+
+import lib.si5351 as clkgen
+
+_FREQ_MULT = 100
+_PLL_FIXED_HZ = 800000000
+_FINE_VCO_CENTER = 750000000
+
+
+def ratio(reg_set):
+    # a + b/c from P1, P2 and P3
+    return Fraction(reg_set[0] + 512, 128) + Fraction(reg_set[1], 128 * reg_set[2])
+
+
+def fine_divider(freq):
+    # Even divider _set_freq_fine picks for an output frequency in Hz
+    return (_FINE_VCO_CENTER // freq + 1) & ~1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SI5351 fixed point and bigint maths")
+    parser.add_argument("--start", type=int, default=1000000, help="first frequency in Hz")
+    parser.add_argument("--stop", type=int, default=30000000, help="last frequency in Hz")
+    parser.add_argument("--step", type=int, default=10, help="step in Hz")
+    parser.add_argument("--xtal", type=int, default=25000000, help="reference frequency in Hz")
+    parser.add_argument("--correction", type=int, default=0, help="reference correction in ppb")
+    args = parser.parse_args()
+
+    si5351 = clkgen.SI5351(sim.SimI2C(args.xtal), xtal_freq=args.xtal, calc_cache_size=0,
+                           pll_cache_size=0)
+    si5351._set_ref_freq(args.xtal, clkgen.PLL_INPUT_XO)
+    si5351._ref_correction[clkgen.PLL_INPUT_XO] = args.correction
+    si5351._set_ref_freq16(clkgen.PLL_INPUT_XO)
+    # The reference the device actually sees
+    ref = Fraction(args.xtal) * (1 + Fraction(args.correction, 1000000000))
+
+    regs = si5351._pll_regs
+    worst = {"pll": [0, 0, 0, 0], "ms": [0, 0, 0, 0]}  # bigint error, fixed error, difference, bound
+
+    freq = args.start
+    while freq <= args.stop:
+        # Fine tune mode, PLL ratio
+        div = fine_divider(freq)
+        vco = freq * div
+        si5351._pll_calc(clkgen.PLLA, vco * _FREQ_MULT, args.correction, False, regs)
+        big = ref * ratio(regs) / div
+        si5351._pll_calc_fixed(clkgen.PLLA, vco, regs)
+        fixed = ref * ratio(regs) / div
+        bound = Fraction(25) * freq / vco
+        w = worst["pll"]
+        w[0] = max(w[0], abs(big - freq))
+        w[1] = max(w[1], abs(fixed - freq))
+        w[2] = max(w[2], abs(fixed - big))
+        w[3] = max(w[3], abs(fixed - freq) / bound)
+
+        # Normal mode, multisynth ratio from a fixed PLL
+        si5351._multisynth_calc(freq * _FREQ_MULT, _PLL_FIXED_HZ * _FREQ_MULT, regs)
+        big = _PLL_FIXED_HZ / ratio(regs)
+        si5351._multisynth_calc_fixed(freq * _FREQ_MULT, _PLL_FIXED_HZ, regs)
+        fixed = _PLL_FIXED_HZ / ratio(regs)
+        # f * 2**-20 / (r - 2**-20), which is f**2 / (2**20 * f_vco) to first order
+        bound = Fraction(freq) / ((1 << 20) * Fraction(_PLL_FIXED_HZ, freq) - 1)
+        w = worst["ms"]
+        w[0] = max(w[0], abs(big - freq))
+        w[1] = max(w[1], abs(fixed - freq))
+        w[2] = max(w[2], abs(fixed - big))
+        w[3] = max(w[3], abs(fixed - freq) / bound)
+
+        freq += args.step
+
+    print("{} Hz to {} Hz in {} Hz steps, correction {} ppb".format(args.start, args.stop, args.step,
+                                                                   args.correction))
+    print("path  bigint err mHz  fixed err mHz  difference mHz  fixed / bound")
+    ok = True
+    for path in ("pll", "ms"):
+        w = worst[path]
+        print("{:<5} {:>14.3f} {:>14.3f} {:>15.3f} {:>14.3f}".format(path, float(w[0]) * 1000, float(w[1]) * 1000,
+                                                                    float(w[2]) * 1000, float(w[3])))
+        if w[3] > 1:
+            ok = False
+    print("within bound" if ok else "BOUND EXCEEDED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+#
+# Host side measurement of the PTT to TX oscillator latency under a knob flood
+#
+# Brings the firmware up against the SI5351 simulator (see check_event_alloc.py), then
+# repeatedly floods the encoder queue and presses PTT part way through the flood. The
+# switch, encoder and output tasks of MainLoop in xmain.py are mirrored here, along
+# with the dispatch order used before events had priorities, so the two can be compared.
+#
+# For each press, counts what happens between PTT being seen by the switch service and
+# the TX oscillators being written: knob events published, characters written to the
+# LCD, simulated I2C bus time, and the host time taken, which is only useful to compare
+# the two loops. Exits non zero if the prioritised loop publishes more than one knob
+# event or writes the LCD before switching to TX.
+#
+# Usage, from the repository root:
+#
+#   python3 tools/check_ptt_latency.py [--trials N] [--flood DETENTS] [--seed N]
+#
+
+import argparse
+import random
+import sys
+import time
+
+import check_event_alloc as host
+
+
+class _Meter:
+    # Snapshot of the costs at the time PTT is seen
+    def __init__(self, i2c, lcd):
+        self.i2c = i2c
+        self.lcd = lcd
+        self.knob_events = 0
+        self.armed = False
+        self.results = list()
+
+    def arm(self):
+        self.armed = True
+        self.knob_start = self.knob_events
+        self.lcd_start = self.lcd.chars
+        self.bus_start = self.i2c.bus_time_us()
+        self.host_start = time.perf_counter()
+
+    def check(self, vfo, tx_state):
+        # Called after each clock generator service
+        if self.armed and vfo.txstate == tx_state and not vfo.clk_q.pending():
+            self.armed = False
+            self.results.append((self.knob_events - self.knob_start, self.lcd.chars - self.lcd_start,
+                                 self.i2c.bus_time_us() - self.bus_start,
+                                 (time.perf_counter() - self.host_start) * 1000000))
+
+
+class _CountingLcd(host.FakeLcd):
+    def __init__(self):
+        super().__init__()
+        self.chars = 0
+
+    def putstr(self, text):
+        super().putstr(text)
+        self.chars += len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure PTT to TX oscillator latency under a knob flood")
+    parser.add_argument("--trials", type=int, default=200, help="number of PTT presses")
+    parser.add_argument("--flood", type=int, default=32, help="most detents queued per main loop pass")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    i2c = host.start_firmware()
+    import lib.constants as c
+    import lib.event as ev
+    import lib.globals as g
+
+    g.lcd = _CountingLcd()
+    meter = _Meter(i2c, g.lcd)
+    encoder_q = list()
+    switch_q = list()
+
+    def knob_event(steps):
+        subtype = c.EST_KNOB_CW if steps > 0 else c.EST_KNOB_CCW
+        event_data = g.event.acquire(c.ET_ENCODER, subtype, abs(steps))
+        g.event.publish(event_data)
+        g.event.release(event_data)
+        meter.knob_events += 1
+
+    def press(subtype):
+        # What SwitchPoll._switch_service does when it sees the switch change
+        if subtype == c.EST_PTT_PRESSED:
+            meter.arm()
+        switch_q.append(subtype)
+
+    def service_switches():
+        # Mirrors MainLoop._service_switches() in xmain.py
+        while switch_q:
+            g.event.post(c.ET_SWITCHES, switch_q.pop(0), priority=ev.PRIORITY_HIGH)
+        g.event.drain(ev.PRIORITY_HIGH)
+        g.vfo.service()
+        meter.check(g.vfo, c.TXS_TX)
+
+    def pass_priority(arrival, subtype):
+        # Mirrors the encoder task, which merges the detents into one event, then the
+        # switch task if PTT came in while that event was handled, then the output task
+        if arrival == 0:
+            press(subtype)
+        if switch_q:
+            service_switches()
+        steps = 0
+        while encoder_q:
+            steps += encoder_q.pop()
+        if steps:
+            knob_event(steps)
+        if arrival > 0:
+            press(subtype)
+        if switch_q:
+            service_switches()
+        g.event.drain()
+        g.vfo.service()
+        meter.check(g.vfo, c.TXS_TX)
+
+    def pass_fifo(arrival, subtype):
+        # The dispatch order before events had priorities
+        count = 0
+        while True:
+            if count == arrival:
+                press(subtype)
+            try:
+                direction = encoder_q.pop()
+            except IndexError:
+                break
+            knob_event(direction)
+            count += 1
+        if switch_q:
+            event_data = g.event.acquire(c.ET_SWITCHES, switch_q.pop(0))
+            g.event.publish(event_data)
+            g.event.release(event_data)
+        g.vfo.service()
+        meter.check(g.vfo, c.TXS_TX)
+        g.event.drain()
+
+    ok = True
+    for name, loop_pass in (("fifo", pass_fifo), ("priority", pass_priority)):
+        rnd = random.Random(args.seed)
+        meter.results = list()
+        for trial in range(args.trials):
+            for subtype in (c.EST_PTT_PRESSED, c.EST_PTT_RELEASED):
+                flood = rnd.randint(1, args.flood)
+                arrival = rnd.randint(0, flood - 1)
+                # A few passes, with the switch changing part way through the flood of the first
+                for n in range(4):
+                    for d in range(flood):
+                        encoder_q.append(rnd.choice((-1, 1)))
+                    loop_pass(arrival if n == 0 else -1, subtype)
+                # Stay within the band
+                g.vfo.tuned_freq = 7150000
+        knobs = [r[0] for r in meter.results]
+        chars = [r[1] for r in meter.results]
+        bus = [r[2] for r in meter.results]
+        host_us = [r[3] for r in meter.results]
+        print("{:<9} {} presses, knob events worst {} mean {:.1f}, lcd chars worst {}, i2c us worst {:.0f},"
+              " host us worst {:.0f} mean {:.0f}".format(name, len(meter.results), max(knobs),
+                                                         sum(knobs) / len(knobs), max(chars), max(bus),
+                                                         max(host_us), sum(host_us) / len(host_us)))
+        if loop_pass is pass_priority and (max(knobs) > 1 or max(chars) or len(meter.results) != args.trials):
+            ok = False
+    print("within bound" if ok else "BOUND EXCEEDED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#
+# Check that tuning the clock generator doesn't allocate
+#
+# Covers the allocation free cases listed above SI5351.set_freq(), in two scenarios:
+#
+#   fine     Outputs set up as Vfo does for LSB receive on 40 m, with the conversion
+#            oscillator on CLK0 in fine tune mode and the BFO on CLK2. Each step is a
+#            batched set_freq of both outputs, moving CLK0 by 10 Hz. The BFO is above
+#            10.7 MHz, so its frequency is a bigint, built once outside the loop as Vfo's
+#            stays the same while tuning.
+#   outputs  Fixed point maths on, every output from CLK0 to CLK5 on PLLA at 800 MHz, at
+#            frequencies with a fraction of a Hz, some low enough to use an R divider.
+#            Each step sets all six, moving each by 1.01 Hz.
+#
+# Under MicroPython, copy lib/si5351.py to the board and run this file. No clock generator
+# is needed, the driver talks to a stand in bus. It reports the change in gc.mem_alloc()
+# over each scenario, which should be 0.
+#
+# Under CPython, from the repository root:
+#
+#   python3 tools/check_set_freq_alloc.py [--rounds N]
+#
+# runs the same steps against tools/si5351_sim.py, with lib/si5351.py compiled so that the
+# result of every arithmetic operation, and every value read from an array, is checked.
+# An int outside the MicroPython small int range there would be a heap allocated bigint
+# on the board. Ints passed in by the caller, such as the BFO frequency, are only flagged
+# if the driver does arithmetic on them. Viper functions work in machine words and are
+# left alone. Also checks that every fine tune step took the PLL only fast path, and the
+# final output frequencies. Exits non zero on any failure.
+#
+
+import sys
+
+_MICROPYTHON = sys.implementation.name == "micropython"
+
+CF_FREQ = 12288000
+START_FREQ = 7000000
+STEP_HZ = 10
+# Outputs scenario frequencies in 100ths of Hz, and the step
+OUTPUT_FREQS = (13600037, 47500001, 183650099, 353512345, 710012367, 1010000051)
+OUTPUT_STEP = 101
+# MicroPython small ints are 31 bit signed on 32 bit ports
+_SMALL_INT_MAX = (1 << 30) - 1
+_SMALL_INT_MIN = -(1 << 30)
+
+
+class NullI2C:
+    # Stands in for the bus. Keeps a register image so the driver's start up reads work.
+    def __init__(self, device_addr=0x60):
+        self._device_addr = device_addr
+        self._regs = bytearray(256)
+        self._ptr = 0
+
+    def scan(self):
+        return [self._device_addr]
+
+    def writeto(self, addr, buf, stop=True):
+        n = len(buf)
+        self._ptr = buf[0]
+        for i in range(1, n):
+            self._regs[(self._ptr + i - 1) & 0xFF] = buf[i]
+        return n
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(self._regs[self._ptr:self._ptr + nbytes])
+
+    def readfrom_into(self, addr, buf, stop=True):
+        for i in range(len(buf)):
+            buf[i] = self._regs[(self._ptr + i) & 0xFF]
+
+
+def setup_fine(clkgen, i2c):
+    # Bring the driver up as Vfo does, and return it
+    si5351 = clkgen.SI5351(i2c)
+    si5351.init(clkgen.CRYSTAL_LOAD_0PF, 25000000, 0)
+    si5351.apply_plan(si5351.plan({clkgen.CLK0: (CF_FREQ - START_FREQ) * 100, clkgen.CLK2: CF_FREQ * 100},
+                                  clkgen.CLK0))
+    si5351.output_enable(clkgen.CLK0, True)
+    si5351.output_enable(clkgen.CLK2, True)
+    return si5351
+
+
+def tune_fine(clkgen, si5351, bfo, rounds):
+    # Tune up the band from START_FREQ, one batched write of both outputs per step
+    fconv = (CF_FREQ - START_FREQ) * 100
+    for i in range(rounds):
+        fconv -= STEP_HZ * 100
+        si5351.begin()
+        si5351.set_freq(clkgen.CLK0, fconv)
+        si5351.set_freq(clkgen.CLK2, bfo)
+        si5351.commit()
+    return fconv
+
+
+def setup_outputs(clkgen, i2c):
+    si5351 = clkgen.SI5351(i2c)
+    si5351.init(clkgen.CRYSTAL_LOAD_0PF, 25000000, 0)
+    si5351.set_fixed_point(True)
+    for clk in range(len(OUTPUT_FREQS)):
+        si5351.set_freq(clk, OUTPUT_FREQS[clk])
+        si5351.output_enable(clk, True)
+    return si5351
+
+
+def tune_outputs(si5351, first, rounds):
+    # Step every output from round first, and return the next round
+    for i in range(first, first + rounds):
+        for clk in range(len(OUTPUT_FREQS)):
+            si5351.set_freq(clk, OUTPUT_FREQS[clk] + i * OUTPUT_STEP)
+    return first + rounds
+
+
+def check_micropython(rounds):
+    import gc
+    import si5351 as clkgen
+
+    failed = 0
+    si5351 = setup_fine(clkgen, NullI2C())
+    bfo = CF_FREQ * 100
+    # Warm up, so the first step's fine tune bookkeeping is out of the way
+    tune_fine(clkgen, si5351, bfo, 2)
+    fallbacks = si5351.get_fine_stats()[1]
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    tune_fine(clkgen, si5351, bfo, rounds)
+    after = gc.mem_alloc()
+    gc.enable()
+    fallbacks = si5351.get_fine_stats()[1] - fallbacks
+    print("fine: {} steps, {} bytes allocated, {} full reprogrammings".format(rounds, after - before, fallbacks))
+    if after != before or fallbacks:
+        failed = 1
+
+    si5351 = setup_outputs(clkgen, NullI2C())
+    first = tune_outputs(si5351, 1, 2)
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    tune_outputs(si5351, first, rounds)
+    after = gc.mem_alloc()
+    gc.enable()
+    print("outputs: {} steps, {} bytes allocated".format(rounds, after - before))
+    if after != before:
+        failed = 1
+    return failed
+
+
+class _Bigints:
+    # Counts the driver source lines which produced a bigint while counting is on
+    def __init__(self):
+        self.counting = False
+        self.lines = dict()
+
+    def check(self, value, line):
+        if (self.counting and type(value) is int
+            and (value > _SMALL_INT_MAX or value < _SMALL_INT_MIN)):
+            self.lines[line] = self.lines.get(line, 0) + 1
+        return value
+
+    def item(self, container, index, line):
+        # Reading an array element makes a new int object, reading a list element doesn't
+        import array
+        value = container[index]
+        if isinstance(container, array.array):
+            self.check(value, line)
+        return value
+
+
+def _load_checked_driver(path, bigints):
+    # Compile the driver with every arithmetic result and array read passed through bigints
+    import ast
+    import copy
+    import types
+
+    class Instrument(ast.NodeTransformer):
+        def _call(self, name, args, node):
+            call = ast.Call(func=ast.Attribute(value=ast.Name(id="_bigints", ctx=ast.Load()),
+                                               attr=name, ctx=ast.Load()),
+                            args=args + [ast.Constant(node.lineno)], keywords=[])
+            return ast.copy_location(call, node)
+
+        def visit_FunctionDef(self, node):
+            for decorator in node.decorator_list:
+                if isinstance(decorator, ast.Attribute) and decorator.attr == "viper":
+                    return node
+            self.generic_visit(node)
+            return node
+
+        def visit_BinOp(self, node):
+            self.generic_visit(node)
+            return self._call("check", [node], node)
+
+        def visit_UnaryOp(self, node):
+            self.generic_visit(node)
+            return self._call("check", [node], node)
+
+        def visit_AugAssign(self, node):
+            self.generic_visit(node)
+            target = copy.deepcopy(node.target)
+            for child in ast.walk(target):
+                if hasattr(child, "ctx"):
+                    child.ctx = ast.Load()
+            check = ast.copy_location(ast.Expr(self._call("check", [target], node)), node)
+            return [node, check]
+
+        def visit_Subscript(self, node):
+            self.generic_visit(node)
+            if not isinstance(node.ctx, ast.Load) or isinstance(node.slice, ast.Slice):
+                return node
+            return self._call("item", [node.value, node.slice], node)
+
+    with open(path) as f:
+        source = f.read()
+    tree = ast.fix_missing_locations(Instrument().visit(ast.parse(source, path)))
+    module = types.ModuleType("si5351")
+    module.__file__ = path
+    module._bigints = bigints
+    exec(compile(tree, path, "exec"), module.__dict__)
+    return module, source.splitlines()
+
+
+def check_cpython(rounds):
+    import os
+
+    tools = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, tools)
+    import si5351_sim as sim
+    sim.install_host_shims()
+    bigints = _Bigints()
+    clkgen, source = _load_checked_driver(os.path.join(os.path.dirname(tools), "lib", "si5351.py"), bigints)
+    ok = True
+
+    i2c = sim.SimI2C()
+    si5351 = setup_fine(clkgen, i2c)
+    bfo = CF_FREQ * 100
+    tune_fine(clkgen, si5351, bfo, 2)
+    fallbacks = si5351.get_fine_stats()[1]
+    bigints.counting = True
+    fconv = tune_fine(clkgen, si5351, bfo, rounds)
+    bigints.counting = False
+    fallbacks = si5351.get_fine_stats()[1] - fallbacks
+    expected = {clkgen.CLK0: fconv, clkgen.CLK2: bfo}
+    ok = _report("fine", rounds, i2c, expected, bigints, source) and not fallbacks and ok
+    print("fine: {} full reprogrammings".format(fallbacks))
+
+    i2c = sim.SimI2C()
+    si5351 = setup_outputs(clkgen, i2c)
+    first = tune_outputs(si5351, 1, 2)
+    bigints.counting = True
+    first = tune_outputs(si5351, first, rounds)
+    bigints.counting = False
+    expected = dict()
+    for clk in range(len(OUTPUT_FREQS)):
+        expected[clk] = OUTPUT_FREQS[clk] + (first - 1) * OUTPUT_STEP
+    ok = _report("outputs", rounds, i2c, expected, bigints, source) and ok
+
+    print("ok" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+def _report(name, rounds, i2c, expected, bigints, source):
+    # Print the results of a scenario, expected holds output frequencies in 100ths of Hz.
+    # Returns True if it passed
+    worst = 0
+    for clk, freq in expected.items():
+        actual = i2c.output_freq(clk)
+        if actual is None:
+            print("{}: CLK{} is off".format(name, clk))
+            return False
+        worst = max(worst, abs(float(actual - freq / 100)))
+    print("{}: {} steps, final error {:.3f} Hz".format(name, rounds, worst))
+    for line in sorted(bigints.lines):
+        print("{}: bigint at line {} ({} times): {}".format(name, line, bigints.lines[line],
+                                                           source[line - 1].strip()))
+    ok = not bigints.lines and worst < 1
+    bigints.lines.clear()
+    return ok
+
+
+def main():
+    rounds = 10000
+    if "--rounds" in sys.argv:
+        rounds = int(sys.argv[sys.argv.index("--rounds") + 1])
+    if _MICROPYTHON:
+        return check_micropython(rounds)
+    return check_cpython(rounds)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#
+# Host side generator for the precomputed band register tables
+#
+# For every band in the band table, computes the PLLA parameter block the SI5351
+# driver would write for the conversion oscillator at every reachable VFO frequency
+# (at the smallest tuning step), for both LSB and USB, and writes them to a compact
+# binary file which lib/vfo.py loads at boot. Tuning then becomes a file seek plus a
+# burst write, with no PLL arithmetic on the Pico.
+#
+# The arithmetic is vectorised with NumPy and matches SI5351._pll_calc_fixed bit for bit,
+# which fine tune mode uses for the whole Hz frequencies Vfo tunes to, so a table block
+# is the same register image the driver would write without the table.
+#
+# Usage, from the repository root:
+#
+#   python3 tools/gen_band_regs.py [--band-table FILE] [--cal FILE] [--step HZ] [--out-dir DIR]
+#
+# then copy the generated config/bandregs_<band>.bin files to the config directory on the Pico.
+#
+# File layout (little endian), see BANDREGS_HEADER in lib/vfo.py:
+#
+#   header: magic, xtal_freq_hz, si5351_correction_ppb, cf_frequency_hz,
+#           low_limit, high_limit, step_hz, record count,
+#           LSB divider, USB divider, LSB R divider, USB R divider
+#   LSB records: count x 8 byte PLLA parameter blocks (registers 26-33)
+#   USB records: count x 8 byte PLLA parameter blocks
+#
+# A divider of 0 means there is no table for that mode.
+#
+
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib.globals as g
+
+BANDREGS_MAGIC = b"SBR2"
+BANDREGS_HEADER = "<4sIiIIIHHHHBB"
+RECORD_LENGTH = 8
+
+# Values from lib/si5351.py
+_PLL_VCO_MIN = 600000000
+_PLL_VCO_MAX = 900000000
+_FINE_VCO_CENTER = 750000000
+_MULTISYNTH_A_MIN = 6
+_MULTISYNTH_A_MAX = 1800
+_PLL_A_MIN = 15
+_PLL_A_MAX = 90
+_FIXED_FRAC_BITS = 19
+_FIXED_DENOM = 1 << 19
+_REF_FRAC_BITS = 4
+_R_DIV_MIN_FREQ = 4000 * 128  # Below this, the driver uses an R divider
+
+
+def corrected_ref(xtal_freq, correction):
+    # Reference frequency in 1/16 Hz, corrected as SI5351._set_ref_freq16 does
+    ref_freq = xtal_freq << _REF_FRAC_BITS
+    return ref_freq + (ref_freq * correction + 500000000) // 1000000000
+
+
+def pick_divider(fconv):
+    # Even integer multisynth divider which keeps the VCO in range across the whole band,
+    # centered on the middle of the band. Returns 0 if there is none.
+    # Vfo passes it to SI5351.prefer_fine_divider(), so fine tune mode uses it for
+    # frequencies outside the table too, instead of centering the VCO on each one.
+    if fconv.min() < _R_DIV_MIN_FREQ:
+        return 0
+    mid = (int(fconv.min()) + int(fconv.max())) // 2
+    div = (_FINE_VCO_CENTER // mid + 1) & ~1
+    div = max(_MULTISYNTH_A_MIN, min(_MULTISYNTH_A_MAX, div))
+    if int(fconv.min()) * div < _PLL_VCO_MIN or int(fconv.max()) * div > _PLL_VCO_MAX:
+        return 0
+    return div
+
+
+def pll_blocks(vco, ref_freq):
+    # Vectorised SI5351._pll_calc_fixed and _pack_params.
+    # vco is an int64 array of VCO frequencies in Hz, ref_freq the reference in 1/16 Hz
+    vco = np.clip(vco, _PLL_VCO_MIN, _PLL_VCO_MAX)
+    # _fixed_div: round(vco * 2**23 / ref_freq), rounding half up
+    ratio = ((vco << (_FIXED_FRAC_BITS + _REF_FRAC_BITS + 1)) // ref_freq + 1) >> 1
+    a = ratio >> _FIXED_FRAC_BITS
+    b = ratio & (_FIXED_DENOM - 1)
+    b = np.where((a < _PLL_A_MIN) | (a >= _PLL_A_MAX), 0, b)
+    a = np.clip(a, _PLL_A_MIN, _PLL_A_MAX)
+    # _fixed_params
+    p1 = np.where(b != 0, 128 * a + (b >> (_FIXED_FRAC_BITS - 7)) - 512, 128 * a - 512)
+    p2 = np.where(b != 0, (b << 7) & (_FIXED_DENOM - 1), 0)
+    p3 = np.where(b != 0, _FIXED_DENOM, 1)
+    blocks = np.empty((len(vco), RECORD_LENGTH), dtype=np.uint8)
+    blocks[:, 0] = (p3 >> 8) & 0xFF
+    blocks[:, 1] = p3 & 0xFF
+    blocks[:, 2] = (p1 >> 16) & 0x03
+    blocks[:, 3] = (p1 >> 8) & 0xFF
+    blocks[:, 4] = p1 & 0xFF
+    blocks[:, 5] = ((p3 >> 12) & 0xF0) + ((p2 >> 16) & 0x0F)
+    blocks[:, 6] = (p2 >> 8) & 0xFF
+    blocks[:, 7] = p2 & 0xFF
+    return blocks
+
+
+def generate(band, limits, cal_data, step):
+    low = limits["low_limit"]
+    high = limits["high_limit"]
+    cf_freq = cal_data["cf_frequency_hz"]
+    ref_freq = corrected_ref(cal_data["xtal_freq_hz"], cal_data["si5351_correction_ppb"])
+    tuned = np.arange(low, high + 1, step, dtype=np.int64)
+    # Conversion oscillator frequencies, as computed in Vfo._set_freq
+    fconv_lsb = np.abs(cf_freq - tuned)
+    fconv_usb = tuned + cf_freq
+    tables = list()
+    for fconv in (fconv_lsb, fconv_usb):
+        div = pick_divider(fconv)
+        if div:
+            blocks = pll_blocks(fconv * div, ref_freq)
+        else:
+            blocks = np.zeros((len(tuned), RECORD_LENGTH), dtype=np.uint8)
+        tables.append((div, blocks))
+    header = struct.pack(BANDREGS_HEADER, BANDREGS_MAGIC, cal_data["xtal_freq_hz"],
+                         cal_data["si5351_correction_ppb"], cf_freq, low, high, step, len(tuned),
+                         tables[0][0], tables[1][0], 0, 0)
+    return header + b"".join(blocks.tobytes() for div, blocks in tables)
+
+
+def _read_json(path, default):
+    if path is None or not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate precomputed SI5351 band register tables")
+    parser.add_argument("--band-table", help="band table json (defaults to the firmware default)")
+    parser.add_argument("--cal", help="calibration json (defaults to the firmware default)")
+    parser.add_argument("--step", type=int, default=min(g.tuning_increment_table), help="tuning step in Hz")
+    parser.add_argument("--out-dir", default=".", help="directory to write config/bandregs_<band>.bin into")
+    args = parser.parse_args()
+
+    band_table = _read_json(args.band_table, g.band_table_default)
+    cal_data = dict(g.cal_defaults)
+    cal_data.update(_read_json(args.cal, {}))
+
+    for band, limits in band_table.items():
+        image = generate(band, limits, cal_data, args.step)
+        path = os.path.join(args.out_dir, g.band_regs_path.format(band))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(image)
+        print("{}: {} bytes -> {}".format(band, len(image), path))
+
+
+if __name__ == "__main__":
+    main()
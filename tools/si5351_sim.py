@@ -0,0 +1,193 @@
+#
+# Host side Si5351 simulator
+#
+# SimI2C models the Si5351 register map behind a MicroPython style I2C object, so it can
+# be passed to SI5351(i2c_object) unchanged on a Linux box. It counts bus transactions,
+# bytes and simulated bus time, and decodes the PLL, multisynth and R divider settings
+# back into exact output frequencies.
+#
+# Call install_host_shims() before importing lib.si5351 under CPython.
+# See tools/bench_si5351.py for an example.
+#
+
+import sys
+import types
+from fractions import Fraction
+
+REG_COUNT = 256
+DEVICE_ADDR = 0x60
+
+_INTERRUPT_STATUS = 1
+_OUTPUT_ENABLE_CTRL = 3
+_CLK0_CTRL = 16
+_PLLA_PARAMETERS = 26
+_PLLB_PARAMETERS = 34
+_CLK0_PARAMETERS = 42
+_PLL_RESET = 177
+
+_STATUS_SYS_INIT = (1 << 7)
+_CLK_POWERDOWN = (1 << 7)
+_CLK_PLL_SELECT = (1 << 5)
+_OUTPUT_CLK_DIVBY4 = (3 << 2)
+
+# Bits on the wire per byte (8 data bits plus ACK), and bit times for START/STOP
+_BITS_PER_BYTE = 9
+_START_STOP_BITS = 2
+
+
+def install_host_shims():
+    # Provide the few MicroPython modules lib/si5351.py imports when running under CPython
+    if "micropython" not in sys.modules:
+        mp = types.ModuleType("micropython")
+        mp.const = lambda x: x
+        mp.native = lambda f: f
+        mp.viper = lambda f: f
+        mp.schedule = lambda f, arg: f(arg)
+        sys.modules["micropython"] = mp
+    if "ustruct" not in sys.modules:
+        import struct
+        sys.modules["ustruct"] = struct
+    if "machine" not in sys.modules:
+        machine = types.ModuleType("machine")
+        machine.I2C = object
+        machine.disable_irq = lambda: 0
+        machine.enable_irq = lambda state: None
+        sys.modules["machine"] = machine
+
+
+class SimI2C:
+    def __init__(self, xtal_freq=25000000, bus_freq=100000, device_addr=DEVICE_ADDR):
+        self.xtal_freq = xtal_freq
+        self.bus_freq = bus_freq
+        self.device_addr = device_addr
+        self.regs = bytearray(REG_COUNT)
+        # Power on state, SYS_INIT_STKY set
+        self.regs[_INTERRUPT_STATUS] = _STATUS_SYS_INIT
+        self._ptr = 0
+        self.pll_resets = [0, 0]
+        self.clear_stats()
+
+    #
+    # Statistics
+    #
+
+    def clear_stats(self):
+        self.transactions = 0
+        self.write_transactions = 0
+        self.read_transactions = 0
+        self.data_bytes_written = 0
+        self.data_bytes_read = 0
+        self.bus_bits = 0
+        self.log = list()
+
+    def bus_time_us(self):
+        # Simulated time spent on the bus at the chosen clock rate
+        return self.bus_bits * 1000000 / self.bus_freq
+
+    def stats(self):
+        return {"transactions": self.transactions,
+                "writes": self.write_transactions,
+                "reads": self.read_transactions,
+                "bytes_written": self.data_bytes_written,
+                "bytes_read": self.data_bytes_read,
+                "bus_time_us": self.bus_time_us()}
+
+    def _account(self, wire_bytes):
+        self.transactions += 1
+        # Address byte plus payload
+        self.bus_bits += (1 + wire_bytes) * _BITS_PER_BYTE + _START_STOP_BITS
+
+    def _check_addr(self, addr):
+        if addr != self.device_addr:
+            raise OSError(19)  # ENODEV, as MicroPython reports a missing device
+
+    #
+    # MicroPython I2C interface
+    #
+
+    def scan(self):
+        return [self.device_addr]
+
+    def writeto(self, addr, buf, stop=True):
+        self._check_addr(addr)
+        buf = bytes(buf)
+        self._account(len(buf))
+        if not len(buf):
+            return 0
+        self._ptr = buf[0]
+        data = buf[1:]
+        if len(data):
+            self.write_transactions += 1
+            self.data_bytes_written += len(data)
+            self.log.append((self._ptr, data))
+            for value in data:
+                self._write(self._ptr, value)
+                self._ptr = (self._ptr + 1) % REG_COUNT
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self.readfrom_into(addr, buf, stop)
+        return bytes(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._check_addr(addr)
+        self._account(len(buf))
+        self.read_transactions += 1
+        self.data_bytes_read += len(buf)
+        for i in range(len(buf)):
+            buf[i] = self.regs[self._ptr]
+            self._ptr = (self._ptr + 1) % REG_COUNT
+
+    def _write(self, reg, value):
+        if reg == _PLL_RESET:
+            # Self clearing
+            if value & (1 << 5):
+                self.pll_resets[0] += 1
+            if value & (1 << 7):
+                self.pll_resets[1] += 1
+            return
+        self.regs[reg] = value
+
+    #
+    # Register decoding
+    #
+
+    def _params(self, base):
+        r = self.regs
+        p3 = (r[base] << 8) | r[base + 1] | ((r[base + 5] >> 4) << 16)
+        p1 = ((r[base + 2] & 0x03) << 16) | (r[base + 3] << 8) | r[base + 4]
+        p2 = ((r[base + 5] & 0x0F) << 16) | (r[base + 6] << 8) | r[base + 7]
+        return (p1, p2, p3)
+
+    @staticmethod
+    def _ratio(p1, p2, p3):
+        # a + b/c from P1, P2 and P3
+        if p3 == 0:
+            return None
+        return Fraction(p1 + 512, 128) + Fraction(p2, 128 * p3)
+
+    def pll_freq(self, pll):
+        # Exact VCO frequency of PLLA (0) or PLLB (1) in Hz
+        ratio = self._ratio(*self._params(_PLLB_PARAMETERS if pll else _PLLA_PARAMETERS))
+        if ratio is None:
+            return None
+        return self.xtal_freq * ratio
+
+    def output_freq(self, clk):
+        # Exact output frequency of CLK0 - CLK5 in Hz, or None if the output is off
+        if self.regs[_OUTPUT_ENABLE_CTRL] & (1 << clk):
+            return None
+        ctrl = self.regs[_CLK0_CTRL + clk]
+        if ctrl & _CLK_POWERDOWN:
+            return None
+        vco = self.pll_freq(1 if ctrl & _CLK_PLL_SELECT else 0)
+        base = _CLK0_PARAMETERS + 8 * clk
+        if (self.regs[base + 2] & _OUTPUT_CLK_DIVBY4) == _OUTPUT_CLK_DIVBY4:
+            ms = Fraction(4)
+        else:
+            ms = self._ratio(*self._params(base))
+        if vco is None or not ms:
+            return None
+        r_div = 1 << ((self.regs[base + 2] >> 4) & 0x07)
+        return vco / ms / r_div
@@ -0,0 +1,76 @@
+#
+# Host side simulation of the tuning acceleration in lib/accel.py
+#
+# Turns a simulated knob at a steady rate across a span of the band, with the main
+# loop reading the knob after every detent, which is the worst case. Reports, for
+# each rate, how many detents and VFO updates it takes to cross the span, and the
+# smallest and largest frequency step seen. Turning slowly should move one tuning
+# increment per detent.
+#
+# Usage, from the repository root:
+#
+#   python3 tools/sim_accel.py [--span HZ] [--incr HZ] [--curve JSON]
+#
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import si5351_sim as sim
+
+sim.install_host_shims()
+
+# Simulated ticks_us, advanced by the loop below
+_now_us = [0]
+time.ticks_us = lambda: _now_us[0]
+time.ticks_diff = lambda end, start: end - start
+
+import lib.accel as accel
+
+_DEFAULT_CURVE = [[0, 1], [15, 2], [30, 5], [60, 10]]
+
+
+def sweep(curve, rate, span, incr):
+    # Return (detents, updates, smallest step, largest step) to tune across span at rate detents/s
+    _now_us[0] = 0
+    accelerator = accel.Accelerator(curve)
+    interval = 1000000 // rate
+    # Start from rest
+    _now_us[0] += 1000000
+    moved = 0
+    detents = 0
+    updates = 0
+    steps = list()
+    while moved < span:
+        _now_us[0] += interval
+        accelerator.detent()
+        detents += 1
+        step = incr * accelerator.multiplier()
+        moved += step
+        updates += 1
+        steps.append(step)
+    return (detents, updates, min(steps), max(steps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the tuning acceleration curve")
+    parser.add_argument("--span", type=int, default=300000, help="span to cross in Hz")
+    parser.add_argument("--incr", type=int, default=1000, help="tuning increment in Hz")
+    parser.add_argument("--curve", type=json.loads, default=_DEFAULT_CURVE, help="curve as JSON")
+    args = parser.parse_args()
+
+    print("curve {}, crossing {} Hz at {} Hz per detent".format(args.curve, args.span, args.incr))
+    print("{:>10} {:>8} {:>8} {:>10} {:>10}".format("detents/s", "detents", "updates", "min step", "max step"))
+    for rate in (2, 5, 10, 20, 40, 80, 120):
+        detents, updates, smallest, largest = sweep(args.curve, rate, args.span, args.incr)
+        print("{:>10} {:>8} {:>8} {:>10} {:>10}".format(rate, detents, updates, smallest, largest))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
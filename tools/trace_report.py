@@ -0,0 +1,116 @@
+#
+# Summarise an event trace saved on the radio by lib/trace.py
+#
+# Reads either the binary form written by Trace.dump_binary(), or the CSV printed by
+# Trace.dump_csv() and captured from the REPL. Reports:
+#
+#   detent to clock - from the first knob detent not yet written to the clock generator,
+#                     to the clock generator write which includes it
+#   detent to lcd   - the same, to the frequency being written to the LCD
+#   created         - events acquired while tracing, from the pool or newly allocated
+#   handlers        - time spent in each subscriber, by event subtype and subscriber index
+#
+# Usage, from the repository root:
+#
+#   python3 tools/trace_report.py TRACE_FILE
+#
+
+import argparse
+import struct
+import sys
+
+# Must match lib/trace.py
+TP_NAMES = ("detent", "create", "dispatch", "entry", "exit", "clock", "lcd")
+_BINARY_MAGIC = b"TRC1"
+_BINARY_HEADER = "<4sI"
+_BINARY_RECORD = "<IBxHi"
+# ticks_us wraps at 2**30 on MicroPython
+_TICKS_MASK = (1 << 30) - 1
+
+
+def read_trace(path):
+    # Return a list of (us, point name, subtype, arg), oldest first
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(_BINARY_MAGIC):
+        magic, count = struct.unpack_from(_BINARY_HEADER, data, 0)
+        offset = struct.calcsize(_BINARY_HEADER)
+        size = struct.calcsize(_BINARY_RECORD)
+        records = list()
+        for n in range(count):
+            us, point, subtype, arg = struct.unpack_from(_BINARY_RECORD, data, offset + n * size)
+            records.append((us, TP_NAMES[point], subtype, arg))
+        return records
+    records = list()
+    for line in data.decode().splitlines():
+        fields = line.strip().split(",")
+        if len(fields) != 4 or fields[1] not in TP_NAMES:
+            continue
+        records.append((int(fields[0]), fields[1], int(fields[2]), int(fields[3])))
+    return records
+
+
+def ticks_diff(end, start):
+    return (end - start) & _TICKS_MASK
+
+
+def summarise(name, values):
+    if not values:
+        print("{:<16} none".format(name))
+        return
+    values = sorted(values)
+    print("{:<16} {:>6} {:>8} {:>8} {:>8} {:>8}".format(name, len(values), values[0], values[len(values) // 2],
+                                                       sum(values) // len(values), values[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a lib/trace.py event trace")
+    parser.add_argument("path", help="binary or CSV trace file")
+    args = parser.parse_args()
+
+    records = read_trace(args.path)
+    to_clock = list()
+    to_lcd = list()
+    handlers = dict()
+    clock_start = None
+    lcd_start = None
+    entries = list()
+    created = 0
+    for us, point, subtype, arg in records:
+        if point == "detent":
+            if clock_start is None:
+                clock_start = us
+            if lcd_start is None:
+                lcd_start = us
+        elif point == "clock":
+            if clock_start is not None:
+                to_clock.append(ticks_diff(us, clock_start))
+                clock_start = None
+        elif point == "lcd":
+            if lcd_start is not None:
+                to_lcd.append(ticks_diff(us, lcd_start))
+                lcd_start = None
+        elif point == "create":
+            created += 1
+        elif point == "entry":
+            entries.append((subtype, arg, us))
+        elif point == "exit":
+            # Subscribers can publish, so entries and exits nest
+            while entries:
+                entry_subtype, entry_index, entry_us = entries.pop()
+                if entry_subtype == subtype and entry_index == arg:
+                    handlers.setdefault((subtype, arg), list()).append(ticks_diff(us, entry_us))
+                    break
+
+    print("{} records".format(len(records)))
+    print("{} events created".format(created))
+    print("{:<16} {:>6} {:>8} {:>8} {:>8} {:>8}".format("us", "count", "min", "median", "mean", "max"))
+    summarise("detent to clock", to_clock)
+    summarise("detent to lcd", to_lcd)
+    for subtype, index in sorted(handlers):
+        summarise("subtype {} sub {}".format(subtype, index), handlers[(subtype, index)])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 from machine import I2C,Pin,Timer
 import micropython
+import uasyncio as asyncio
 import gc
 import time
 import sys
@@ -15,6 +16,10 @@ import lib.menu as menu
 import lib.si5351 as clkgen
 import lib.vfo as vfo
 import lib.display as display
+from lib.i2c_profiler import I2CProfiler
+from lib.trace import Trace
+from lib.ringbuf import RingBuffer
+from lib.accel import Accelerator
 
 ##################################
 # Constants used in this module  #
@@ -44,7 +49,14 @@ class SwitchPoll:
         self.last_ptt_state = False
         self.last_knob_state = False
         self.sequencer_state = SS_IDLE
-        self.switch_q = list()
+        self.switch_q = RingBuffer(16)
+        # Set whenever an event is queued, wakes the main loop switch task
+        self.flag = asyncio.ThreadSafeFlag()
+        # Time from PTT or TUNE being seen pressed, to the TX oscillators being written
+        self.key_pending = False
+        self.key_ticks_us = 0
+        self.key_latency_us = 0
+        self.key_latency_max_us = 0
         self.sequencer_future_ticks = 0
         self.switch_timer = Timer()
         self.switch_timer.init(period=10, callback=self._interrupt_switch_timer)
@@ -58,6 +70,14 @@ class SwitchPoll:
     def _interrupt_switch_timer(self, timer_obj):
         micropython.schedule(self._switch_service, None)
     
+    # Queue an event for the main loop. Events are queued as a small int
+    # holding the priority, type and subtype, so the switch service doesn't allocate.
+    # Keying and time out events are high priority, so they are handled before any UI work.
+    
+    def _queue(self, event_type: int, event_subtype: int, priority: int = ev.PRIORITY_LOW):
+        self.switch_q.put((priority << 28) | (event_type << 16) | event_subtype)
+        self.flag.set()
+    
     # Switch service. This is called shortly after each 10mS interrupt
     # The code here should not post events, and should queue them instead
     # So that they can be handled in the main loop using the queue_service() method.
@@ -71,35 +91,33 @@ class SwitchPoll:
         if self.last_tune_state != cur_tune_state:
             self.last_tune_state = cur_tune_state
             if cur_tune_state:
-                event_data = ev.EventData(c.ET_SWITCHES, c.EST_TUNE_PRESSED)
-                self.switch_q.append(event_data)
+                self.key_ticks_us = time.ticks_us()
+                self.key_pending = True
+                self._queue(c.ET_SWITCHES, c.EST_TUNE_PRESSED, ev.PRIORITY_HIGH)
             else:
-                event_data = ev.EventData(c.ET_SWITCHES, c.EST_TUNE_RELEASED)
-                self.switch_q.append(event_data)
+                self._queue(c.ET_SWITCHES, c.EST_TUNE_RELEASED, ev.PRIORITY_HIGH)
         # PTT Switch handler
         if self.last_ptt_state != cur_ptt_state:
             self.last_ptt_state = cur_ptt_state
             if cur_ptt_state:
-                event_data = ev.EventData(c.ET_SWITCHES, c.EST_PTT_PRESSED)
-                self.switch_q.append(event_data)
+                self.key_ticks_us = time.ticks_us()
+                self.key_pending = True
+                self._queue(c.ET_SWITCHES, c.EST_PTT_PRESSED, ev.PRIORITY_HIGH)
             else:
-                event_data = ev.EventData(c.ET_SWITCHES, c.EST_PTT_RELEASED)
-                self.switch_q.append(event_data)
+                self._queue(c.ET_SWITCHES, c.EST_PTT_RELEASED, ev.PRIORITY_HIGH)
         # Encoder Knob Switch handler
         if self.last_knob_state != cur_knob_state:
             self.last_knob_state = cur_knob_state
             if cur_knob_state:
                 self.knob_pressed_time = time.ticks_ms()
-                event_data = ev.EventData(c.ET_SWITCHES, c.EST_KNOB_PRESSED)
-                self.switch_q.append(event_data)
+                self._queue(c.ET_SWITCHES, c.EST_KNOB_PRESSED)
             else:
                 # Determine if the knob was pressed for the long period and send the correct event subtype
                 if time.ticks_diff(time.ticks_ms(), self.knob_pressed_time) >= c.KNOB_LONG_PRESS_TIME:
                     ev_subtype = c.EST_KNOB_RELEASED_LONG
                 else:
                     ev_subtype = c.EST_KNOB_RELEASED
-                event_data = ev.EventData(c.ET_SWITCHES, ev_subtype)
-                self.switch_q.append(event_data)
+                self._queue(c.ET_SWITCHES, ev_subtype)
         
         #
         # Sequence the mute, ptt, and tune GPIO outputs using a state machine
@@ -137,31 +155,40 @@ class SwitchPoll:
                 pins.ctrl_tune_out(False)
                 pins.ctrl_mute_out(False)
                 new_state = SS_TIMED_OUT
-                event_data = ev.EventData(c.ET_VFO, c.EST_TX_TIMED_OUT_ENTRY)
-                self.switch_q.append(event_data)
+                self._queue(c.ET_VFO, c.EST_TX_TIMED_OUT_ENTRY, ev.PRIORITY_HIGH)
         elif self.sequencer_state == SS_UNMUTE_WAIT: # Wait the unmute time
             if time.ticks_diff(now, self.sequencer_future_ticks) >= 0:
                 pins.ctrl_mute_out(False) # Unmute the audio
                 new_state = SS_IDLE
         elif self.sequencer_state == SS_TIMED_OUT: # Timed out, wait in this state until the user unkeys
             if not (cur_ptt_state or cur_tune_state):
-                event_data = ev.EventData(c.ET_VFO, c.EST_TX_TIMED_OUT_EXIT)
                 new_state = SS_IDLE
-                self.switch_q.append(event_data)
+                self._queue(c.ET_VFO, c.EST_TX_TIMED_OUT_EXIT, ev.PRIORITY_HIGH)
                 
         self.sequencer_state = new_state # Set the new state for next time
     
-    # Check for queued switch events and return the event if it exists else None
-    # This gets called by the foreground loop. The forground loop will publish the
-    # event if one is returned from here.
+    # Return True if switch events are waiting for queue_service()
+    
+    def pending(self) -> bool:
+        return self.switch_q.any()
+    
+    # Move the queued switch events to the event system, in the lane for their priority.
+    # This gets called by the foreground loop, which then drains the event system.
     
     def queue_service(self):
-        try:
-            event_data = self.switch_q.pop(0)
-            
-        except IndexError:
-            return None
-        return event_data
+        while self.switch_q.any():
+            packed = self.switch_q.get()
+            g.event.post((packed >> 16) & 0xFFF, packed & 0xFFFF, priority = packed >> 28)
+    
+    # Called by the foreground loop once the high priority events have been handled
+    # and the clock generator written. Records the PTT to TX oscillator latency.
+    
+    def key_serviced(self):
+        if self.key_pending:
+            self.key_pending = False
+            self.key_latency_us = time.ticks_diff(time.ticks_us(), self.key_ticks_us)
+            if self.key_latency_us > self.key_latency_max_us:
+                self.key_latency_max_us = self.key_latency_us
         
 
 def init():
@@ -287,6 +314,17 @@ def init():
     #
 
     g.i2c = I2C(0, freq=100000, scl = pins.i2c_scl, sda = pins.i2c_sda)
+    
+    # Optionally wrap the bus in the transaction profiler.
+    # Print the summary from the REPL with g.i2c.dump()
+    if g.user_config_settings["i2c_profile"]:
+        g.i2c = I2CProfiler(g.i2c)
+    
+    # Optionally trace events from the encoder to the clock generator and the LCD.
+    # Print the trace from the REPL with g.trace.dump_csv()
+    if g.user_config_settings["trace"]:
+        g.trace = Trace()
+        g.event.trace = g.trace
 
     #
     # Create si5351 object
@@ -330,8 +368,8 @@ def init():
     #
     # Initialize the encoder knob
     #
-    g.encoder_q = list()
-    g.knob = knob.EncoderKnob(0, g.encoder_q, pins.encoder_i)
+    g.accel = Accelerator(g.user_config_settings["accel_curve"])
+    g.knob = knob.EncoderKnob(0, pins.encoder_i, trace = g.trace, accel = g.accel)
 
 
     #
@@ -354,40 +392,107 @@ def init():
 
 
 
-def run():
-    last_gc_time = time.ticks_ms()
-    gc.collect()
-    print("Memory free: {}".format(gc.mem_free()))
-    while True:
-        # Service encoder knob queue
-        try:
-            direction = g.encoder_q.pop()
-            if direction < 0:
+#
+# Main loop. Each task sleeps until it has something to do, so the CPU idles
+# between events. The switch service and the encoder knob wake their tasks
+# with ThreadSafeFlags.
+#
+
+class MainLoop:
+    def __init__(self):
+        # Set by the tasks once they have published events, wakes the output task
+        self.output_flag = asyncio.ThreadSafeFlag()
+        # Task wake-ups, reported per second by the housekeeping task
+        self.wakeups = 0
+        self.wakeups_per_s = 0
+        
+    # Keying and time out events first, then switch the oscillators straight away
+    def _service_switches(self):
+        g.switch_poller.queue_service()
+        g.event.drain(ev.PRIORITY_HIGH)
+        g.vfo.service()
+        g.switch_poller.key_serviced()
+        self.output_flag.set()
+    
+    async def _switch_task(self):
+        while True:
+            await g.switch_poller.flag.wait()
+            self.wakeups += 1
+            self._service_switches()
+    
+    # Read the encoder knob detents turned since the last pass as one signed step count,
+    # and publish a single event with the number of steps in arg0. When tuning, the steps are
+    # scaled by the acceleration multiplier for how fast the knob is turning.
+    # A switch event coming in is handled first, so it isn't kept waiting.
+    async def _encoder_task(self):
+        while True:
+            await g.knob.flag.wait()
+            self.wakeups += 1
+            if g.switch_poller.pending():
+                self._service_switches()
+            steps = g.knob.read_and_clear()
+            if steps == 0:
+                continue
+            if not g.menu.active():
+                steps *= g.accel.multiplier()
+            if steps < 0:
                 # Divert to menu system if it is active
                 subtype = c.EST_KNOB_MENU_CCW if g.menu.active() else c.EST_KNOB_CCW
-                event_data = ev.EventData(c.ET_ENCODER, subtype)
             else:
                 # Divert to menu system if it is active
                 subtype = c.EST_KNOB_MENU_CW if g.menu.active() else c.EST_KNOB_CW
-                event_data = ev.EventData(c.ET_ENCODER, subtype)
-            g.event.publish(event_data)
-                    
-        except IndexError:
-            pass
-        
-        # Check to see of there were any switch events
-        # That we need to publish
-        
-        event_data = g.switch_poller.queue_service()
-        if event_data is not None:
+            event_data = g.event.acquire(c.ET_ENCODER, subtype, abs(steps))
             g.event.publish(event_data)
-        
-        # garbage collect occasionally
-        now = time.ticks_ms()
-        if time.ticks_diff(now, last_gc_time) > c.GC_COLLECT_INTERVAL:
-            last_gc_time = now
+            g.event.release(event_data)
+            self.output_flag.set()
+    
+    # Publish the low priority switch events and the deferred display updates,
+    # then write the newest oscillator frequencies to the clock generator.
+    # Updates queued by the events are merged, only the last one is written.
+    async def _output_task(self):
+        while True:
+            await self.output_flag.wait()
+            self.wakeups += 1
+            g.event.drain()
+            g.vfo.service()
+    
+    # Garbage collect occasionally, and report the task wake-ups per second
+    async def _housekeeping_task(self):
+        last_generation = g.si5351.get_generation()
+        # If the device was programmed from the saved image, and nothing has changed since, the image is current
+        saved_generation = last_generation if g.si5351.image_loaded() else -1
+        last_time = time.ticks_ms()
+        while True:
+            await asyncio.sleep_ms(c.GC_COLLECT_INTERVAL)
+            self.wakeups += 1
+            now = time.ticks_ms()
+            self.wakeups_per_s = self.wakeups * 1000 // max(1, time.ticks_diff(now, last_time))
+            self.wakeups = 0
+            last_time = now
             gc.collect()
-            print("Memory free: {}".format(gc.mem_free()))    
+            print("Memory free: {} Wake-ups/s: {}".format(gc.mem_free(), self.wakeups_per_s))
+            # Save the clock generator registers once their configuration hasn't changed for a whole
+            # interval. Tuning within a band doesn't change it, so the image is only rewritten
+            # after a band, divider or PLL assignment change, not every interval while tuning.
+            generation = g.si5351.get_generation()
+            if generation == last_generation and generation != saved_generation:
+                g.si5351.save_image(g.si5351_image_path)
+                saved_generation = generation
+            last_generation = generation
+    
+    async def main(self):
+        # Show the start up display updates
+        self.output_flag.set()
+        # Any task failing ends the main loop with its exception
+        await asyncio.gather(self._switch_task(), self._encoder_task(), self._output_task(),
+                             self._housekeeping_task())
+
+
+def run():
+    gc.collect()
+    print("Memory free: {}".format(gc.mem_free()))
+    g.main_loop = MainLoop()
+    asyncio.run(g.main_loop.main())
 
 #
 # Initialize everything